@@ -275,4 +275,170 @@ class CustomerFormValidationTestCase(TestCase):
         form_data['password'] = 'wrongpassword'
         form = CustomerLoginForm(data=form_data)
         self.assertFalse(form.is_valid())
-        self.assertIn('電子郵件或密碼錯誤', str(form.errors))
\ No newline at end of file
+        self.assertIn('電子郵件或密碼錯誤', str(form.errors))
+
+class TicketQRCodeImageTestCase(TestCase):
+    def setUp(self):
+        from merchant_marketplace.models import Product
+        from payments.models import Order
+
+        merchant_member = Member.objects.create_user(
+            username='qrshop@example.com',
+            email='qrshop@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        merchant = Merchant.objects.create(
+            member=merchant_member,
+            ShopName='QR商店',
+            UnifiedNumber='99887766',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='qrshop'
+        )
+        self.member = Member.objects.create_user(
+            username='qrbuyer@example.com',
+            email='qrbuyer@example.com',
+            password='testpass123',
+            member_type='customer'
+        )
+        customer = Customer.objects.create(member=self.member, name='買家')
+        product = Product.objects.create(
+            name='測試票券',
+            description='測試',
+            price=100,
+            stock=10,
+            phone_number='0912345678',
+            merchant=merchant,
+        )
+        order = Order.objects.create(
+            provider='newebpay',
+            status='paid',
+            amount=0,
+            item_description=product.name,
+            product=product,
+            customer=customer,
+            quantity=1,
+            unit_price=product.price,
+        )
+        self.ticket = order.items.get()
+        self.url = reverse('customers_account:ticket_qr_image', args=[self.ticket.id])
+
+    def test_owner_gets_cacheable_png(self):
+        """測試票券持有人可取得 QR Code 圖片，且支援 ETag 與瀏覽器快取"""
+        self.client.force_login(self.member)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertIn('private', response['Cache-Control'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_other_customer_cannot_get_png(self):
+        """測試非票券持有人無法取得 QR Code 圖片"""
+        other = Member.objects.create_user(
+            username='other@example.com',
+            email='other@example.com',
+            password='testpass123',
+            member_type='customer'
+        )
+        self.client.force_login(other)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+
+class RequestCustomerTestCase(TestCase):
+    def setUp(self):
+        self.member = Member.objects.create_user(
+            username='lazy@example.com',
+            email='lazy@example.com',
+            password='testpass123',
+            member_type='customer'
+        )
+        self.customer = Customer.objects.create(member=self.member, name='延遲載入')
+
+    def test_customer_is_loaded_once_with_member(self):
+        """測試 request.customer 在同一請求中只以一次查詢載入（含 member）"""
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+        from truepay.middleware.customer import CustomerMiddleware
+
+        request = RequestFactory().get('/')
+        request.user = self.member
+        CustomerMiddleware(lambda request: None)(request)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(request.customer.pk, self.customer.pk)
+            self.assertEqual(request.customer.member.email, 'lazy@example.com')
+        with self.assertNumQueries(0):
+            self.assertTrue(request.customer)
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        CustomerMiddleware(lambda request: None)(request)
+        with self.assertNumQueries(0):
+            self.assertFalse(request.customer)
+
+    def test_member_without_customer_is_redirected(self):
+        """測試沒有客戶資料的會員進入客戶頁面時導回首頁"""
+        member = Member.objects.create_user(
+            username='nocustomer@example.com',
+            email='nocustomer@example.com',
+            password='testpass123',
+            member_type='customer'
+        )
+        self.client.force_login(member)
+
+        response = self.client.get(reverse('customers_account:purchase_history'))
+        self.assertRedirects(response, reverse('pages:home'), fetch_redirect_response=False)
+
+        self.client.force_login(self.member)
+        response = self.client.get(reverse('customers_account:purchase_history'))
+        self.assertEqual(response.status_code, 200)
+
+
+
+class SessionActivityThrottleTestCase(TestCase):
+    def setUp(self):
+        self.member = Member.objects.create_user(
+            username='activity@example.com',
+            email='activity@example.com',
+            password='testpass123',
+            member_type='customer'
+        )
+
+    def _process(self, session):
+        from django.test import RequestFactory
+        from truepay.security_middleware import SessionSecurityMiddleware
+
+        request = RequestFactory().get('/customers/dashboard/')
+        request.user = self.member
+        request.session = session
+        SessionSecurityMiddleware(lambda request: None).process_request(request)
+
+    def test_last_activity_is_only_written_after_interval(self):
+        """測試 last_activity 只有超過更新間隔才寫回 session"""
+        from django.contrib.sessions.backends.cached_db import SessionStore
+
+        session = SessionStore()
+        self._process(session)
+        self.assertTrue(session.modified)
+        first_activity = session['last_activity']
+
+        session = SessionStore()
+        session['last_activity'] = first_activity
+        session.modified = False
+        self._process(session)
+        self.assertFalse(session.modified)
+
+        session['last_activity'] = first_activity - 120
+        session.modified = False
+        self._process(session)
+        self.assertTrue(session.modified)
+        self.assertGreaterEqual(session['last_activity'], first_activity)
@@ -10,6 +10,7 @@ urlpatterns = [
     path("dashboard/", views.dashboard, name="dashboard"),
     path("purchase-history/", views.purchase_history, name="purchase_history"),
     path("ticket-wallet/", views.ticket_wallet, name="ticket_wallet"),
+    path("ticket-wallet/<int:ticket_id>/qr.png", views.ticket_qr_image, name="ticket_qr_image"),
     path("profile-settings/", views.profile_settings, name="profile_settings"),
     
     # TOTP 二階段驗證相關路由
@@ -1,4 +1,5 @@
 # Standard library imports
+import hashlib
 import json
 from functools import wraps
 from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
@@ -10,19 +11,22 @@ import pyotp
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model, login as django_login, logout as django_logout, update_session_auth_hash
+from django.contrib.auth.decorators import login_required
 from django.core.mail import send_mail
-from django.core.paginator import Paginator
 from django.core.signing import TimestampSigner, BadSignature, SignatureExpired
 from django.db import transaction
 from django.db.models import Sum, Q, Count
-from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.decorators.http import require_http_methods
 
 # Local imports
 from truepay.decorators import customer_login_required
+from truepay.middleware.customer import get_customer
+from truepay.pagination import CursorPaginator
 from .forms import (
     CustomerRegistrationForm,
     CustomerLoginForm,
@@ -33,6 +37,7 @@ from .forms import (
 )
 from .models import Customer
 from payments.models import Order, OrderItem
+from payments.serializers import serialize_order, serialize_ticket
 from merchant_account.models import Merchant
 
 
@@ -146,9 +151,8 @@ def logout(request):
 def purchase_history(request):
     """消費者購買記錄頁面"""
     # 透過 user 找到對應的 Customer
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -160,13 +164,12 @@ def purchase_history(request):
         .order_by("-created_at")
     )
 
-    # 為了向後兼容，我們仍然使用 order_items 這個變數名
-    order_items = orders
+    # 游標分頁處理
+    paginator = CursorPaginator(orders, 10)  # 每頁顯示10筆記錄
+    page_obj = paginator.get_page(request.GET)
 
-    # 分頁處理
-    paginator = Paginator(order_items, 10)  # 每頁顯示10筆記錄
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    if request.GET.get("format") == "json":
+        return JsonResponse(page_obj.to_json(serialize_order))
 
     context = {
         "customer": customer,
@@ -182,9 +185,8 @@ def purchase_history(request):
 def dashboard(request):
     """消費者儀表板頁面"""
     # 透過 user 找到對應的 Customer
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -217,9 +219,8 @@ def dashboard(request):
 def ticket_wallet(request):
     """消費者票券錢包頁面"""
     # 透過 member 找到對應的 Customer
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -236,7 +237,7 @@ def ticket_wallet(request):
 
     # 基本查詢：取得該客戶的所有票券
     tickets = (
-        OrderItem.objects.select_related("product__merchant", "order")
+        OrderItem.objects.select_related("product__merchant", "order", "customer")
         .filter(customer=customer)
         .order_by("-created_at")
     )
@@ -249,7 +250,7 @@ def ticket_wallet(request):
     if merchant_filter:
         try:
             merchant_id = int(merchant_filter)
-            tickets = tickets.filter(product__merchant_id=merchant_id)
+            tickets = tickets.filter(merchant_id=merchant_id)
         except (ValueError, TypeError):
             pass
 
@@ -279,10 +280,12 @@ def ticket_wallet(request):
         .order_by("ShopName")
     )
 
-    # 分頁處理
-    paginator = Paginator(tickets, 10)  # 每頁顯示10筆記錄
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # 游標分頁處理
+    paginator = CursorPaginator(tickets, 10)  # 每頁顯示10筆記錄
+    page_obj = paginator.get_page(request.GET)
+
+    if request.GET.get("format") == "json":
+        return JsonResponse(page_obj.to_json(serialize_ticket))
 
     # 檢查是否已通過核銷前驗證
     redemption_verified = request.session.get("redemption_verified", False)
@@ -329,13 +332,31 @@ def ticket_wallet(request):
     return render(request, "customers/ticket_wallet.html", context)
 
 
+@login_required(login_url="/customers/login/")
+def ticket_qr_image(request, ticket_id):
+    """票券 QR Code 圖片（只有票券持有人可以取得，瀏覽器可私有快取）"""
+    ticket = get_object_or_404(
+        OrderItem.objects.select_related("product"),
+        id=ticket_id,
+        customer__member=request.user,
+    )
+
+    # QR Code 內容不會變動，ETag 由快取鍵決定，304 時不需讀取圖片
+    etag = f'"{hashlib.md5(ticket.qr_code_cache_key.encode()).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(ticket.get_qr_code_png(), content_type="image/png")
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, max_age=60 * 60 * 24)
+    return response
+
+
 @customer_login_required
 def profile_settings(request):
     """消費者會員資料修改頁面"""
     # 透過 user 找到對應的 Customer
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -393,9 +414,8 @@ def profile_settings(request):
 @customer_login_required
 def totp_setup(request):
     """TOTP 設置頁面 - 顯示 QR Code"""
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -431,9 +451,8 @@ def totp_setup(request):
 @customer_login_required
 def totp_enable(request):
     """啟用 TOTP - 驗證用戶輸入的代碼"""
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -489,9 +508,8 @@ def totp_enable(request):
 @customer_login_required
 def totp_manage(request):
     """TOTP 管理頁面 - 顯示當前狀態和管理選項"""
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -506,9 +524,8 @@ def totp_manage(request):
 @customer_login_required
 def totp_disable(request):
     """停用 TOTP"""
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -536,9 +553,8 @@ def totp_disable(request):
 @customer_login_required
 def regenerate_backup_tokens(request):
     """重新生成備用恢復代碼"""
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -574,7 +590,9 @@ def regenerate_backup_tokens(request):
 def verify_totp_api(request):
     """API 端點用於驗證 TOTP 代碼"""
     try:
-        customer = Customer.objects.get(member=request.user)
+        customer = request.customer
+        if not customer:
+            raise Customer.DoesNotExist
         data = json.loads(request.body)
         totp_code = data.get("totp_code", "").strip()
 
@@ -606,7 +624,9 @@ def cancel_order(request, order_id):
 
     try:
         # 透過 user 找到對應的 Customer
-        customer = Customer.objects.get(member=request.user)
+        customer = request.customer
+        if not customer:
+            raise Customer.DoesNotExist
 
         with transaction.atomic():
             # 取得訂單並檢查權限
@@ -751,9 +771,8 @@ def reset_password(request, token):
 @customer_login_required
 def totp_verify_for_redemption(request):
     """核銷前2FA驗證頁面"""
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -830,12 +849,9 @@ def customer_required(view_func):
             messages.error(request, "權限不足")
             return redirect("pages:home")
 
-        # 獲取客戶資料
-        try:
-            customer = Customer.objects.get(member=request.user)
-            # 將客戶資料加入 request 以便 view 使用
-            request.customer = customer
-        except Customer.DoesNotExist:
+        # 獲取客戶資料，將客戶資料加入 request 以便 view 使用
+        request.customer = get_customer(request)
+        if not request.customer:
             messages.error(request, "客戶資料不存在")
             return redirect("pages:home")
 
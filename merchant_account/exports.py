@@ -0,0 +1,270 @@
+"""
+報表明細匯出
+以 queryset.iterator() 分批讀取資料並逐列產生，
+CSV 透過 StreamingHttpResponse 串流輸出，XLSX 使用 openpyxl write-only 模式，
+記憶體用量不隨資料量增加；背景任務則將檔案寫入不公開的 exports 儲存空間
+（{商家 ID}/{匯出 ID}/{檔名}），由商家下載頁以有時效的簽章網址下載
+"""
+
+import csv
+import re
+
+from django.core.files.storage import storages
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from merchant_marketplace.models import Product
+from payments.models import Order, OrderItem
+from truepay.db_router import is_reading_from_replica, replica_reads
+from .stats import get_daily_stats
+
+EXPORT_CHUNK_SIZE = 2000
+
+# 匯出可選的最長統計天數
+EXPORT_MAX_DAYS = 365
+
+# 背景匯出重試後仍失敗
+EXPORT_FAILED_KEY = "report_export:failed:v1:{}"
+
+
+def _format_datetime(value):
+    if value is None:
+        return ""
+    return timezone.localtime(value).strftime("%Y-%m-%d %H:%M")
+
+
+def iter_sales_rows(merchant, since):
+    """銷售明細：每筆訂單一列"""
+    yield [
+        "訂單編號",
+        "建立時間",
+        "付款時間",
+        "訂單狀態",
+        "金流方式",
+        "付款方式",
+        "商品名稱",
+        "數量",
+        "單價",
+        "訂單金額",
+        "客戶姓名",
+    ]
+
+    status_display = dict(Order.STATUS_CHOICES)
+    provider_display = dict(Order.PROVIDER_CHOICES)
+    orders = (
+        Order.objects.filter(merchant=merchant, created_at__gte=since)
+        .order_by("created_at")
+        .values_list(
+            "provider_order_id",
+            "created_at",
+            "paid_at",
+            "status",
+            "provider",
+            "newebpay_payment_type",
+            "product__name",
+            "quantity",
+            "unit_price",
+            "amount",
+            "customer__name",
+        )
+    )
+    for (
+        order_no,
+        created_at,
+        paid_at,
+        status,
+        provider,
+        payment_type,
+        product_name,
+        quantity,
+        unit_price,
+        amount,
+        customer_name,
+    ) in orders.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            order_no,
+            _format_datetime(created_at),
+            _format_datetime(paid_at),
+            status_display.get(status, status),
+            provider_display.get(provider, provider),
+            payment_type,
+            product_name,
+            quantity,
+            unit_price,
+            amount,
+            customer_name,
+        ]
+
+
+def iter_ticket_rows(merchant, since):
+    """票券明細：每張票券一列"""
+    yield [
+        "票券代碼",
+        "訂單編號",
+        "商品名稱",
+        "票券狀態",
+        "建立時間",
+        "有效期限",
+        "使用時間",
+        "客戶姓名",
+    ]
+
+    status_display = dict(OrderItem.STATUS_CHOICES)
+    tickets = (
+        OrderItem.objects.filter(merchant=merchant, created_at__gte=since)
+        .order_by("created_at")
+        .values_list(
+            "ticket_code",
+            "order__provider_order_id",
+            "product__name",
+            "status",
+            "created_at",
+            "valid_until",
+            "used_at",
+            "customer__name",
+        )
+    )
+    for (
+        ticket_code,
+        order_no,
+        product_name,
+        status,
+        created_at,
+        valid_until,
+        used_at,
+        customer_name,
+    ) in tickets.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            ticket_code,
+            order_no,
+            product_name,
+            status_display.get(status, status),
+            _format_datetime(created_at),
+            _format_datetime(valid_until),
+            _format_datetime(used_at),
+            customer_name or "",
+        ]
+
+
+def iter_product_rows(merchant, since):
+    """商品明細：每個商品一列（銷售數據來自每日統計彙總）"""
+    yield ["商品名稱", "銷售數量", "總營收", "平均售價", "庫存數量", "狀態"]
+
+    product_stats = {
+        item["product_id"]: item
+        for item in get_daily_stats(merchant, since)
+        .values("product_id")
+        .annotate(order_count=Sum("paid_order_count"), revenue=Sum("revenue"))
+    }
+    products = (
+        Product.objects.filter(merchant=merchant)
+        .order_by("-created_at")
+        .values_list("id", "name", "price", "stock", "is_active")
+    )
+    for product_id, name, price, stock, is_active in products.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        stat = product_stats.get(product_id, {})
+        order_count = stat.get("order_count") or 0
+        revenue = stat.get("revenue") or 0
+        avg_price = revenue / order_count if order_count > 0 else price
+        yield [
+            name,
+            order_count,
+            revenue,
+            round(avg_price),
+            stock,
+            "上架" if is_active else "下架",
+        ]
+
+
+# 報表類型 -> (報表名稱, 明細產生函式)
+EXPORT_TYPES = {
+    "sales": ("銷售分析報表", iter_sales_rows),
+    "tickets": ("票券營運報表", iter_ticket_rows),
+    "products": ("商品表現報表", iter_product_rows),
+}
+
+
+def get_export_filename(merchant, report_type, file_format):
+    title, _ = EXPORT_TYPES[report_type]
+    return f"{title}_{merchant.ShopName}_{timezone.now().strftime('%Y%m%d')}.{file_format}"
+
+
+def get_export_storage():
+    """報表匯出檔案的儲存空間（STORAGES["exports"]）"""
+    return storages["exports"]
+
+
+def get_export_path(merchant_id, export_id, filename):
+    return f"{merchant_id}/{export_id}/{filename}"
+
+
+def find_export_file(merchant_id, export_id):
+    """
+    取得已完成的匯出檔案路徑
+
+    Returns:
+        str: 檔案路徑，尚未完成或匯出 ID 格式錯誤時為 None
+    """
+    if not re.fullmatch(r"[0-9a-f]{32}", export_id):
+        return None
+    try:
+        _, files = get_export_storage().listdir(f"{merchant_id}/{export_id}")
+    except FileNotFoundError:
+        return None
+    if not files:
+        return None
+    return get_export_path(merchant_id, export_id, files[0])
+
+
+class _Echo:
+    """csv.writer 的虛擬檔案物件，直接回傳寫入的內容供串流使用"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv_response(merchant, report_type, since):
+    """以 StreamingHttpResponse 逐列輸出 CSV 明細"""
+    _, iter_rows = EXPORT_TYPES[report_type]
+    writer = csv.writer(_Echo())
+
+    # 串流內容在 view 回傳後才產生，需沿用 view 當下的讀取資料庫
+    from_replica = is_reading_from_replica()
+
+    def generate():
+        # UTF-8 BOM 讓 Excel 正確辨識中文
+        yield "\ufeff"
+        with replica_reads(enabled=from_replica):
+            for row in iter_rows(merchant, since):
+                yield writer.writerow(row)
+
+    response = StreamingHttpResponse(
+        generate(), content_type="text/csv; charset=utf-8"
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{get_export_filename(merchant, report_type, "csv")}"'
+    )
+    return response
+
+
+def write_csv(merchant, report_type, since, fileobj):
+    """將 CSV 明細寫入文字檔案物件"""
+    _, iter_rows = EXPORT_TYPES[report_type]
+    fileobj.write("\ufeff")
+    writer = csv.writer(fileobj)
+    for row in iter_rows(merchant, since):
+        writer.writerow(row)
+
+
+def write_xlsx(merchant, report_type, since, fileobj):
+    """以 openpyxl write-only 模式將明細寫入二進位檔案物件"""
+    title, iter_rows = EXPORT_TYPES[report_type]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title)
+    for row in iter_rows(merchant, since):
+        ws.append(row)
+    wb.save(fileobj)
@@ -0,0 +1,59 @@
+"""
+nginx 重導向設定匯出管理命令
+將啟用中的子網域重導向與商家子網域寫成 nginx map，讓重導向直接由 nginx 回應
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from merchant_account.nginx_redirects import (
+    MAPS_FILENAME,
+    build_nginx_redirect_maps,
+    export_nginx_redirects,
+)
+
+
+class Command(BaseCommand):
+    help = '匯出子網域重導向 nginx map，內容變動時重新載入 nginx'
+
+    def add_arguments(self, parser):
+        """新增命令參數"""
+        parser.add_argument(
+            '--output-dir',
+            type=str,
+            default=None,
+            help='輸出目錄（預設: NGINX_REDIRECT_DIR 設定）',
+        )
+        parser.add_argument(
+            '--no-reload',
+            action='store_true',
+            help='只寫入檔案，不執行 NGINX_RELOAD_COMMAND',
+        )
+        parser.add_argument(
+            '--print',
+            action='store_true',
+            help=f'只輸出 {MAPS_FILENAME} 的內容，不寫入檔案',
+        )
+
+    def handle(self, *args, **options):
+        """執行命令的主要邏輯"""
+        if options['print']:
+            self.stdout.write(build_nginx_redirect_maps(), ending='')
+            return
+
+        try:
+            result = export_nginx_redirects(
+                directory=options['output_dir'], reload=not options['no_reload']
+            )
+        except ValueError as e:
+            raise CommandError(f'{e}，請使用 --output-dir 指定輸出目錄')
+
+        if not result['changed']:
+            self.stdout.write(f'[略過] {result["path"]} 內容沒有變動')
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'[完成] 已寫入 {result["path"]}'))
+        if result['reloaded']:
+            self.stdout.write(self.style.SUCCESS('[完成] 已重新載入 nginx'))
+        elif not options['no_reload']:
+            self.stdout.write(
+                self.style.WARNING('[提醒] 未設定 NGINX_RELOAD_COMMAND，請自行重新載入 nginx')
+            )
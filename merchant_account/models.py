@@ -6,6 +6,9 @@ from django.utils.translation import gettext as _
 import re
 import secrets
 
+from truepay.counters import increment_counter, register_counter
+from .subdomain_cache import invalidate_subdomains
+
 
 # Create your models here.
 class Merchant(models.Model):
@@ -146,6 +149,7 @@ class Merchant(models.Model):
             SubdomainRedirect.create_redirect(
                 old_subdomain=old_subdomain, new_subdomain=new_subdomain, merchant=self
             )
+            invalidate_subdomains(old_subdomain, new_subdomain)
 
         return True
 
@@ -434,12 +438,22 @@ class SubdomainRedirect(models.Model):
             merchant=merchant,
             expires_at=expires_at,
         )
+        invalidate_subdomains(old_subdomain, new_subdomain)
         return redirect
 
     def is_valid(self):
         return self.is_active and timezone.now() < self.expires_at
 
     def use_redirect(self):
+        # 計數先累積在 Redis，定期合併寫入，避免每次重導向都 UPDATE 同一列
+        increment_counter("subdomain_redirect_hits", self.pk)
         self.redirect_count += 1
         self.last_used = timezone.now()
-        self.save(update_fields=["redirect_count", "last_used"])
+
+
+register_counter(
+    "subdomain_redirect_hits",
+    "merchant_account.SubdomainRedirect",
+    "redirect_count",
+    touched_field="last_used",
+)
@@ -0,0 +1,203 @@
+"""
+nginx 重導向設定匯出
+把舊子網域重導向與 /shop/<subdomain>/ 路徑重導向寫成 nginx map，
+讓這些 301/302 直接在 nginx 回應，不必進入 Django。
+
+輸出到 NGINX_REDIRECT_DIR 的兩個檔案：
+- truepay_redirect_maps.conf：http 區塊使用的 map
+- truepay_redirect_rules.conf：server 區塊使用的 return 規則
+nginx.conf 以萬用字元 include，檔案不存在時 nginx 仍可正常啟動。
+
+未匯出到 nginx 的請求（如已過期的重導向、不存在的商家）仍由
+SubdomainRedirectMiddleware 處理；在 nginx 完成的重導向不會計入 redirect_count
+"""
+
+import logging
+import os
+import shlex
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Merchant, SubdomainRedirect
+
+logger = logging.getLogger(__name__)
+
+MAPS_FILENAME = "truepay_redirect_maps.conf"
+RULES_FILENAME = "truepay_redirect_rules.conf"
+
+# 排程匯出的去抖動鎖，短時間內多次變動只匯出一次
+EXPORT_PENDING_KEY = "nginx_redirects:export_pending"
+EXPORT_DELAY_SECONDS = 10
+
+HEADER = "# 由 manage.py export_nginx_redirects 產生，請勿手動修改\n"
+
+RULES = HEADER + (
+    "if ($truepay_host_redirect_301) {\n"
+    "    return 301 $scheme://$truepay_host_redirect_301$request_uri;\n"
+    "}\n"
+    "if ($truepay_host_redirect_302) {\n"
+    "    return 302 $scheme://$truepay_host_redirect_302$request_uri;\n"
+    "}\n"
+    "if ($truepay_shop_redirect) {\n"
+    "    return 301 $scheme://$truepay_shop_redirect/$is_args$args;\n"
+    "}\n"
+)
+
+
+def _map_block(source, variable, entries, extra_lines=()):
+    lines = [f"map {source} ${variable} {{", '    default "";']
+    lines.extend(f"    {line}" for line in extra_lines)
+    lines.extend(f'    "{key}" "{value}";' for key, value in entries)
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def build_nginx_redirect_maps(now=None):
+    """
+    產生 nginx map 內容
+
+    與 SubdomainRedirectMiddleware 相同的規則：
+    - 舊子網域主機 → 新子網域主機（依 redirect_type 分成 301 / 302）
+    - /shop/<subdomain>/、/shop/<subdomain>/pay/<id>/ → 子網域首頁；
+      路徑中是舊子網域時直接導向新子網域，省去一次轉址
+
+    Returns:
+        str: map 設定內容
+    """
+    now = now or timezone.now()
+    base_domain = settings.BASE_DOMAIN
+    shop_domain = os.getenv("NGROK_URL", settings.BASE_DOMAIN)
+
+    redirects = list(
+        SubdomainRedirect.objects.filter(is_active=True, expires_at__gt=now)
+        .order_by("old_subdomain", "-created_at")
+        .values_list("old_subdomain", "new_subdomain", "redirect_type")
+    )
+
+    host_redirects = {"301": {}, "302": {}}
+    shop_redirects = {}
+    for old_subdomain, new_subdomain, redirect_type in redirects:
+        # 同一舊子網域有多筆時以最新的一筆為準
+        if old_subdomain in shop_redirects:
+            continue
+        # nginx 的 $host 一律為小寫，與中介層比對主機名稱的方式相同
+        host_redirects.get(redirect_type, host_redirects["301"])[
+            f"{old_subdomain.lower()}.{base_domain}"
+        ] = f"{new_subdomain}.{base_domain}"
+        shop_redirects[old_subdomain] = f"{new_subdomain}.{shop_domain}"
+
+    # 與中介層相同，舊子網域重導向優先於同名的商家子網域
+    for subdomain in Merchant.objects.order_by("subdomain").values_list(
+        "subdomain", flat=True
+    ):
+        shop_redirects.setdefault(subdomain, f"{subdomain}.{shop_domain}")
+
+    return HEADER + "\n".join(
+        [
+            _map_block(
+                "$host",
+                "truepay_host_redirect_301",
+                sorted(host_redirects["301"].items()),
+            ),
+            _map_block(
+                "$host",
+                "truepay_host_redirect_302",
+                sorted(host_redirects["302"].items()),
+            ),
+            _map_block(
+                "$uri",
+                "truepay_shop_slug",
+                [],
+                extra_lines=['"~^/shop/(?<slug>[^/]+)(/pay/\\d+)?/?$" $slug;'],
+            ),
+            _map_block(
+                "$truepay_shop_slug",
+                "truepay_shop_redirect",
+                sorted(shop_redirects.items()),
+            ),
+        ]
+    )
+
+
+def _write_if_changed(path, content):
+    """內容有變動時以 rename 原子性寫入，回傳是否有變動"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return True
+
+
+def reload_nginx():
+    """執行 NGINX_RELOAD_COMMAND；未設定時略過（例如由 nginx 容器自行監看檔案變動）"""
+    command = settings.NGINX_RELOAD_COMMAND
+    if not command:
+        return False
+    subprocess.run(shlex.split(command), check=True, timeout=30)
+    return True
+
+
+def export_nginx_redirects(directory=None, reload=True):
+    """
+    匯出 nginx 重導向設定，內容有變動時重新載入 nginx
+
+    Args:
+        directory (str): 輸出目錄，預設為 NGINX_REDIRECT_DIR
+        reload (bool): 內容變動時是否執行 NGINX_RELOAD_COMMAND
+
+    Returns:
+        dict: changed / reloaded / path
+    """
+    directory = directory or settings.NGINX_REDIRECT_DIR
+    if not directory:
+        raise ValueError("未設定 NGINX_REDIRECT_DIR")
+    os.makedirs(directory, exist_ok=True)
+
+    # 先寫 map 再寫規則，規則引用的變數一定已經存在
+    changed = _write_if_changed(
+        os.path.join(directory, MAPS_FILENAME), build_nginx_redirect_maps()
+    )
+    changed = _write_if_changed(os.path.join(directory, RULES_FILENAME), RULES) or changed
+
+    reloaded = reload_nginx() if changed and reload else False
+    return {"changed": changed, "reloaded": reloaded, "path": directory}
+
+
+def schedule_nginx_redirect_export():
+    """
+    交易提交後排程匯出任務；未設定 NGINX_REDIRECT_DIR 時不做任何事，
+    EXPORT_DELAY_SECONDS 內的多次變動只排程一次
+    """
+    if not settings.NGINX_REDIRECT_DIR:
+        return
+
+    def enqueue():
+        if not cache.add(EXPORT_PENDING_KEY, True, EXPORT_DELAY_SECONDS):
+            return
+        from .tasks import export_nginx_redirects_task
+
+        try:
+            export_nginx_redirects_task.apply_async(countdown=EXPORT_DELAY_SECONDS)
+        except Exception as e:
+            cache.delete(EXPORT_PENDING_KEY)
+            logger.error(f"nginx 重導向匯出任務排程失敗: {e}")
+
+    transaction.on_commit(enqueue)
@@ -0,0 +1,62 @@
+"""
+商家登入狀態與 session 綁定
+登入時把商家 ID 與子網域存入 session，之後商家後台的每個請求只需以主鍵
+（連同 member）查詢一次商家，不必再以子網域查詢商家並比對 member.email
+"""
+
+from .models import Merchant
+
+SESSION_MERCHANT_ID_KEY = "merchant_id"
+SESSION_MERCHANT_SUBDOMAIN_KEY = "merchant_subdomain"
+
+# 同一請求中已驗證過的商家（merchant_verified_required 疊在 no_cache_required 上時不重複查詢）
+VERIFIED_MERCHANT_ATTR = "_verified_merchant"
+
+
+def bind_merchant_session(request, merchant):
+    """登入或修改子網域後，把商家綁定到目前的 session"""
+    if request.session.get(SESSION_MERCHANT_ID_KEY) != merchant.pk:
+        request.session[SESSION_MERCHANT_ID_KEY] = merchant.pk
+    if request.session.get(SESSION_MERCHANT_SUBDOMAIN_KEY) != merchant.subdomain:
+        request.session[SESSION_MERCHANT_SUBDOMAIN_KEY] = merchant.subdomain
+
+
+def get_authenticated_merchant(request, subdomain):
+    """
+    取得目前登入會員在此子網域的商家（已 select_related member）
+
+    session 綁定的子網域與網址相同時直接以主鍵查詢；不同時（如舊的 session、
+    其他登入方式）以子網域查詢並確認擁有者，成功後重新綁定 session
+
+    Returns:
+        Merchant: 目前會員不是此子網域的商家時回傳 None
+
+    Raises:
+        Merchant.DoesNotExist: 子網域不存在
+    """
+    verified = getattr(request, VERIFIED_MERCHANT_ATTR, None)
+    if verified is not None and verified.subdomain == subdomain:
+        return verified
+
+    user = request.user
+    if not user.is_authenticated or user.member_type != "merchant":
+        # 與原本的行為相同，不存在的子網域仍回應 404
+        if not Merchant.objects.filter(subdomain=subdomain).exists():
+            raise Merchant.DoesNotExist
+        return None
+
+    merchants = Merchant.objects.select_related("member")
+    merchant = None
+    merchant_id = request.session.get(SESSION_MERCHANT_ID_KEY)
+    if merchant_id and request.session.get(SESSION_MERCHANT_SUBDOMAIN_KEY) == subdomain:
+        merchant = merchants.filter(pk=merchant_id, subdomain=subdomain).first()
+
+    if merchant is None:
+        merchant = merchants.get(subdomain=subdomain)
+
+    if merchant.member_id != user.pk:
+        return None
+
+    bind_merchant_session(request, merchant)
+    setattr(request, VERIFIED_MERCHANT_ATTR, merchant)
+    return merchant
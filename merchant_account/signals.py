@@ -1,8 +1,26 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import Merchant
+from .models import Merchant, SubdomainRedirect
+from .nginx_redirects import schedule_nginx_redirect_export
+from .subdomain_cache import invalidate_subdomains
+
+
+@receiver(post_save, sender=Merchant)
+@receiver(post_delete, sender=Merchant)
+def invalidate_merchant_subdomain_cache(sender, instance, **kwargs):
+    """商家資料變動時清除子網域解析快取（快取中存的是整個商家物件）"""
+    invalidate_subdomains(instance.subdomain)
+    schedule_nginx_redirect_export()
+
+
+@receiver(post_save, sender=SubdomainRedirect)
+@receiver(post_delete, sender=SubdomainRedirect)
+def invalidate_redirect_subdomain_cache(sender, instance, **kwargs):
+    """重導向啟用狀態或目標變動時清除舊子網域的解析快取"""
+    invalidate_subdomains(instance.old_subdomain)
+    schedule_nginx_redirect_export()
 
 
 @receiver(post_save, sender=Merchant)
@@ -0,0 +1,133 @@
+"""
+商家統計服務
+以條件聚合 (conditional aggregate) 一次查詢計算票券與訂單的各項 KPI，
+供 Dashboard、售出票券列表與報表頁共用；
+報表、圖表與匯出則讀取 MerchantDailyStats 每日彙總，不再掃描訂單歷史
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+from payments.models import MerchantDailyStats, Order, OrderItem
+
+
+def get_ticket_stats(merchant, paid_only=False, since=None, expiring_within=None):
+    """
+    以單一查詢計算商家的票券統計
+
+    Args:
+        merchant: 商家物件
+        paid_only (bool): 是否只統計已付款訂單的票券
+        since (datetime): 只統計此時間之後建立的票券
+        expiring_within (timedelta): 「即將到期」的時間範圍，預設 24 小時
+
+    Returns:
+        dict: total / unused / used / expired / overdue / expiring_soon / revenue
+              overdue 為已超過有效期限但狀態仍為 unused 的票券
+    """
+    if expiring_within is None:
+        expiring_within = timedelta(hours=24)
+
+    now = timezone.now()
+    tickets = OrderItem.objects.filter(merchant=merchant)
+    if paid_only:
+        tickets = tickets.filter(order__status="paid")
+    if since is not None:
+        tickets = tickets.filter(created_at__gte=since)
+
+    stats = tickets.aggregate(
+        total=Count("id"),
+        unused=Count("id", filter=Q(status="unused")),
+        used=Count("id", filter=Q(status="used")),
+        expired=Count("id", filter=Q(status="expired")),
+        overdue=Count("id", filter=Q(status="unused", valid_until__lt=now)),
+        expiring_soon=Count(
+            "id",
+            filter=Q(
+                status="unused",
+                valid_until__gt=now,
+                valid_until__lte=now + expiring_within,
+            ),
+        ),
+        revenue=Sum("order__amount"),
+    )
+    stats["revenue"] = stats["revenue"] or 0
+    return stats
+
+
+def get_order_stats(merchant, since=None):
+    """
+    以單一查詢計算商家的訂單統計
+
+    Args:
+        merchant: 商家物件
+        since (datetime): 只統計此時間之後建立的訂單
+
+    Returns:
+        dict: total_orders / paid_orders / total_revenue / avg_order_value
+    """
+    orders = Order.objects.filter(merchant=merchant)
+    if since is not None:
+        orders = orders.filter(created_at__gte=since)
+
+    stats = orders.aggregate(
+        total_orders=Count("id"),
+        paid_orders=Count("id", filter=Q(status="paid")),
+        total_revenue=Sum("amount", filter=Q(status="paid")),
+        avg_order_value=Avg("amount", filter=Q(status="paid")),
+    )
+    stats["total_revenue"] = stats["total_revenue"] or 0
+    stats["avg_order_value"] = stats["avg_order_value"] or 0
+    return stats
+
+
+def get_usage_rate(used, total):
+    """票券使用率（百分比）"""
+    return round(used / max(total, 1) * 100, 1)
+
+
+def get_daily_stats(merchant, since):
+    """取得商家自指定時間起的每日統計彙總"""
+    return MerchantDailyStats.objects.filter(
+        merchant=merchant, date__gte=timezone.localdate(since)
+    )
+
+
+def get_period_summary(merchant, since):
+    """
+    從每日統計彙總計算期間總覽
+
+    Returns:
+        dict: order_count / paid_order_count / revenue / tickets_issued /
+              tickets_used / tickets_expired / tickets_unused 及各核銷時段數量
+    """
+    fields = [
+        "order_count",
+        "paid_order_count",
+        "revenue",
+        "tickets_issued",
+        "tickets_used",
+        "tickets_expired",
+    ] + [field for field, _, _ in MerchantDailyStats.TIME_BUCKETS]
+
+    summary = get_daily_stats(merchant, since).aggregate(
+        **{field: Sum(field) for field in fields}
+    )
+    summary = {field: summary[field] or 0 for field in fields}
+    summary["tickets_unused"] = (
+        summary["tickets_issued"] - summary["tickets_used"] - summary["tickets_expired"]
+    )
+    return summary
+
+
+def get_order_status_counts(merchant, since):
+    """取得期間內各訂單狀態的數量（依數量由多到少排序）"""
+    status_counts = Counter()
+    for counts in get_daily_stats(merchant, since).values_list(
+        "order_status_counts", flat=True
+    ):
+        status_counts.update(counts)
+    return status_counts.most_common()
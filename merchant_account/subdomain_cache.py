@@ -0,0 +1,154 @@
+"""
+子網域解析快取
+SubdomainRedirectMiddleware 每個請求都要把子網域解析成商家或舊子網域重導向，
+這裡以兩層快取避免每次查詢資料庫：
+
+1. 程序內 LRU（SUBDOMAIN_LOCAL_CACHE_SIZE 筆、SUBDOMAIN_LOCAL_CACHE_TIMEOUT 秒）
+2. 共用快取 (django.core.cache)，所有程序共享，SUBDOMAIN_CACHE_TIMEOUT 秒
+
+查無資料的子網域也會快取（SUBDOMAIN_NEGATIVE_CACHE_TIMEOUT 秒），
+避免不存在的主機名稱每次都打到資料庫。
+商家或重導向資料變動時由 invalidate_subdomains 清除；
+其他程序的程序內快取最多延遲 SUBDOMAIN_LOCAL_CACHE_TIMEOUT 秒才會更新
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# 共用快取中代表「查無資料」的值（cache.get 找不到時回傳 None，不能直接存 None）
+MISSING = "__missing__"
+
+MERCHANT_KEY = "subdomain:v1:merchant:{}"
+REDIRECT_KEY = "subdomain:v1:redirect:{}"
+
+
+class LocalLRUCache:
+    """執行緒安全、有存活時間的程序內 LRU 快取"""
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """回傳 (是否命中, 值)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalLRUCache(
+    maxsize=settings.SUBDOMAIN_LOCAL_CACHE_SIZE,
+    timeout=settings.SUBDOMAIN_LOCAL_CACHE_TIMEOUT,
+)
+
+
+def _resolve(key, loader):
+    """依序查詢程序內快取、共用快取、資料庫，回傳資料或 None"""
+    hit, value = local_cache.get(key)
+    if not hit:
+        value = cache.get(key)
+        if value is None:
+            value = loader()
+            if value is None:
+                cache.set(key, MISSING, settings.SUBDOMAIN_NEGATIVE_CACHE_TIMEOUT)
+            else:
+                cache.set(key, value, settings.SUBDOMAIN_CACHE_TIMEOUT)
+        elif value == MISSING:
+            value = None
+        local_cache.set(key, value)
+
+    # 程序內快取的物件會被多個請求共用，回傳複本避免請求間互相影響
+    return copy.deepcopy(value)
+
+
+def get_merchant_by_subdomain(subdomain):
+    """
+    取得子網域對應的商家
+
+    Returns:
+        Merchant: 查無商家時回傳 None
+    """
+    from .models import Merchant
+
+    def load():
+        return Merchant.objects.filter(subdomain=subdomain).first()
+
+    return _resolve(MERCHANT_KEY.format(subdomain), load)
+
+
+def get_active_redirect(old_subdomain):
+    """
+    取得舊子網域對應的啟用中重導向
+
+    是否過期由呼叫端以 is_valid() 判斷；同一舊子網域有多筆啟用中的重導向時
+    與原本的 get() 相同會拋出 MultipleObjectsReturned（不快取）
+
+    Returns:
+        SubdomainRedirect: 查無重導向時回傳 None
+    """
+    from .models import SubdomainRedirect
+
+    def load():
+        try:
+            return SubdomainRedirect.objects.select_related("merchant").get(
+                old_subdomain=old_subdomain, is_active=True
+            )
+        except SubdomainRedirect.DoesNotExist:
+            return None
+
+    return _resolve(REDIRECT_KEY.format(old_subdomain), load)
+
+
+def _delete_keys(keys):
+    cache.delete_many(keys)
+    for key in keys:
+        local_cache.delete(key)
+
+
+def invalidate_subdomains(*subdomains):
+    """
+    清除子網域的解析快取
+
+    立即清除一次，並在交易提交後再清除一次，
+    避免交易進行中其他請求把舊資料重新寫回快取
+    """
+    keys = []
+    for subdomain in subdomains:
+        if subdomain:
+            keys.append(MERCHANT_KEY.format(subdomain))
+            keys.append(REDIRECT_KEY.format(subdomain))
+    if not keys:
+        return
+
+    _delete_keys(keys)
+    transaction.on_commit(lambda: _delete_keys(keys))
@@ -0,0 +1,155 @@
+"""
+TruePay Merchant Celery Tasks
+商家報表相關的 Celery 異步任務
+"""
+
+import io
+import logging
+import tempfile
+import uuid
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.utils import timezone
+from truepay.db_router import using_replica
+
+from .exports import (
+    EXPORT_FAILED_KEY,
+    get_export_filename,
+    get_export_path,
+    get_export_storage,
+    write_csv,
+    write_xlsx,
+)
+from .models import Merchant
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, name="merchant_account.generate_report_export")
+@using_replica
+def generate_report_export(
+    self, merchant_id, report_type, days=30, file_format="xlsx", export_id=None
+):
+    """
+    在背景產生報表明細檔案並上傳至不公開的 exports 儲存空間
+    完成與否由商家下載頁檢查檔案是否存在，重試後仍失敗時記錄於快取
+
+    Args:
+        merchant_id (int): 商家 ID
+        report_type (str): 報表類型（sales / tickets / products）
+        days (int): 統計最近幾天
+        file_format (str): xlsx 或 csv
+        export_id (str): 匯出 ID（存放目錄）
+
+    Returns:
+        dict: 匯出 ID 與檔案路徑
+    """
+    export_id = export_id or uuid.uuid4().hex
+    try:
+        start_time = timezone.now()
+        merchant = Merchant.objects.get(id=merchant_id)
+        since = start_time - timedelta(days=days)
+        storage_path = get_export_path(
+            merchant.id, export_id, get_export_filename(merchant, report_type, file_format)
+        )
+
+        # 先寫入暫存檔，避免整份報表留在記憶體中
+        with tempfile.TemporaryFile() as tmp:
+            if file_format == "csv":
+                text_file = io.TextIOWrapper(tmp, encoding="utf-8", newline="")
+                write_csv(merchant, report_type, since, text_file)
+                text_file.flush()
+                text_file.detach()
+            else:
+                write_xlsx(merchant, report_type, since, tmp)
+
+            tmp.seek(0)
+            saved_path = get_export_storage().save(storage_path, File(tmp))
+
+        execution_time = (timezone.now() - start_time).total_seconds()
+        logger.info(
+            f"報表匯出完成 - 商家: {merchant_id}, 類型: {report_type}, "
+            f"路徑: {saved_path}, 執行時間: {execution_time:.2f}秒"
+        )
+
+        return {
+            "task_name": "generate_report_export",
+            "execution_time": execution_time,
+            "export_id": export_id,
+            "path": saved_path,
+        }
+
+    except Exception as e:
+        logger.error(f"報表匯出失敗 (商家 {merchant_id}, 類型 {report_type}): {e}")
+        if self.request.retries >= 3:
+            cache.set(
+                EXPORT_FAILED_KEY.format(export_id),
+                True,
+                settings.REPORT_EXPORT_RETENTION_HOURS * 3600,
+            )
+        raise self.retry(exc=e, countdown=60, max_retries=3)
+
+
+@shared_task(bind=True, name="merchant_account.cleanup_report_exports")
+def cleanup_report_exports(self):
+    """
+    刪除超過 REPORT_EXPORT_RETENTION_HOURS 的報表匯出檔案
+    bucket 已設定 exports/ 生命週期規則時，這裡只會刪除尚未到期的少量檔案
+
+    Returns:
+        dict: 刪除的檔案數
+    """
+    storage = get_export_storage()
+    cutoff = timezone.now() - timedelta(hours=settings.REPORT_EXPORT_RETENTION_HOURS)
+    deleted = 0
+    try:
+        merchant_dirs, _ = storage.listdir("")
+        for merchant_dir in merchant_dirs:
+            export_dirs, _ = storage.listdir(merchant_dir)
+            for export_dir in export_dirs:
+                _, files = storage.listdir(f"{merchant_dir}/{export_dir}")
+                for filename in files:
+                    path = f"{merchant_dir}/{export_dir}/{filename}"
+                    if storage.get_modified_time(path) < cutoff:
+                        storage.delete(path)
+                        deleted += 1
+    except FileNotFoundError:
+        # 尚未產生過任何匯出檔案
+        pass
+    except Exception as e:
+        logger.error(f"報表匯出檔案清除失敗: {e}")
+        raise self.retry(exc=e, countdown=300, max_retries=3)
+
+    if deleted:
+        logger.info(f"已刪除 {deleted} 個過期的報表匯出檔案")
+    return {"task_name": "cleanup_report_exports", "deleted": deleted}
+
+
+@shared_task(bind=True, name="merchant_account.export_nginx_redirects")
+def export_nginx_redirects_task(self):
+    """
+    匯出 nginx 重導向設定，內容變動時重新載入 nginx
+    子網域或重導向變動時排程執行，並每小時執行一次以移除已過期的重導向
+
+    Returns:
+        dict: 執行結果
+    """
+    from .nginx_redirects import export_nginx_redirects
+
+    if not settings.NGINX_REDIRECT_DIR:
+        return {"task_name": "export_nginx_redirects", "skipped": True}
+
+    try:
+        result = export_nginx_redirects()
+        logger.info(
+            f"nginx 重導向設定匯出完成 - 變動: {result['changed']}, "
+            f"重新載入: {result['reloaded']}"
+        )
+        return {"task_name": "export_nginx_redirects", **result}
+    except Exception as e:
+        logger.error(f"nginx 重導向設定匯出失敗: {e}")
+        raise self.retry(exc=e, countdown=60, max_retries=3)
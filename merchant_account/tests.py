@@ -1,8 +1,12 @@
-from django.test import TestCase, Client
+import os
+import unittest
+
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
-from .models import Merchant
+from truepay.counters import flush_counters
+from .models import Merchant, SubdomainRedirect
 from .forms import RegisterForm, LoginForm, MerchantProfileUpdateForm
 from customers_account.models import Customer
 
@@ -167,6 +171,61 @@ class MerchantLoginLogoutTestCase(TestCase):
         # 檢查是否已登入
         self.assertTrue(self.client.session.get('_auth_user_id'))
 
+    def test_login_binds_merchant_to_session(self):
+        """測試登入後 session 綁定商家，後台請求以一次查詢取得帶 member 的商家"""
+        from django.test import RequestFactory
+        from .session import get_authenticated_merchant
+
+        self.client.post(self.login_url, {
+            'email': 'merchant@example.com',
+            'password': 'testpass123'
+        })
+        session = self.client.session
+        self.assertEqual(session['merchant_id'], self.merchant.pk)
+        self.assertEqual(session['merchant_subdomain'], 'testshop')
+
+        request = RequestFactory().get('/')
+        request.user = self.member
+        request.session = session
+        with self.assertNumQueries(1):
+            merchant = get_authenticated_merchant(request, 'testshop')
+            self.assertEqual(merchant.member.email, 'merchant@example.com')
+        with self.assertNumQueries(0):
+            get_authenticated_merchant(request, 'testshop')
+
+    def test_other_merchant_subdomain_redirects_to_login(self):
+        """測試登入商家無法進入其他商家的後台"""
+        other_member = Member.objects.create_user(
+            username='other@example.com',
+            email='other@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        Merchant.objects.create(
+            member=other_member,
+            ShopName='其他商店',
+            UnifiedNumber='87654321',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='測試地址',
+            Cellphone='0912345678',
+            subdomain='othershop'
+        )
+        self.client.post(self.login_url, {
+            'email': 'merchant@example.com',
+            'password': 'testpass123'
+        })
+
+        response = self.client.get(
+            reverse('merchant_account:subdomain_management', args=['othershop'])
+        )
+        self.assertRedirects(response, self.login_url, fetch_redirect_response=False)
+
+        response = self.client.get(
+            reverse('merchant_account:subdomain_management', args=['testshop'])
+        )
+        self.assertEqual(response.status_code, 200)
+
     def test_merchant_duplicate_login_redirect(self):
         """測試已登入商家再次訪問登入頁面會重導向"""
         # 先登入
@@ -614,4 +673,515 @@ class MerchantProfileUpdateAutoApprovalTestCase(TestCase):
         updated_merchant = form.save()
 
         # 檢查狀態保持已通過審核（因為原本就是approved，不會重審）
-        self.assertEqual(updated_merchant.verification_status, 'approved')
\ No newline at end of file
+        self.assertEqual(updated_merchant.verification_status, 'approved')
+
+class MerchantStatsTestCase(TestCase):
+    def setUp(self):
+        from merchant_marketplace.models import Product
+
+        self.member = Member.objects.create_user(
+            username='stats@example.com',
+            email='stats@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        self.merchant = Merchant.objects.create(
+            member=self.member,
+            ShopName='統計商店',
+            UnifiedNumber='11223344',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='statsshop'
+        )
+        customer_member = Member.objects.create_user(
+            username='buyer@example.com',
+            email='buyer@example.com',
+            password='testpass123',
+            member_type='customer'
+        )
+        self.customer = Customer.objects.create(member=customer_member, name='買家')
+        self.product = Product.objects.create(
+            name='測試票券',
+            description='測試',
+            price=100,
+            stock=10,
+            phone_number='0912345678',
+            merchant=self.merchant,
+        )
+
+    def _create_order(self, status, quantity=1):
+        from payments.models import Order
+
+        return Order.objects.create(
+            provider='newebpay',
+            status=status,
+            amount=0,
+            item_description=self.product.name,
+            product=self.product,
+            customer=self.customer,
+            quantity=quantity,
+            unit_price=self.product.price,
+        )
+
+    def test_ticket_and_order_stats(self):
+        """測試票券與訂單統計以單一查詢計算"""
+        from payments.models import OrderItem
+        from .stats import get_order_stats, get_ticket_stats
+
+        self._create_order('paid', quantity=3)
+        self._create_order('pending')
+
+        tickets = list(OrderItem.objects.order_by('id'))
+        tickets[0].status = 'used'
+        tickets[0].save()
+        tickets[1].valid_until = timezone.now() + timezone.timedelta(hours=2)
+        tickets[1].save()
+
+        with self.assertNumQueries(1):
+            ticket_stats = get_ticket_stats(self.merchant)
+        self.assertEqual(ticket_stats['total'], 3)
+        self.assertEqual(ticket_stats['used'], 1)
+        self.assertEqual(ticket_stats['unused'], 2)
+        self.assertEqual(ticket_stats['expiring_soon'], 1)
+
+        with self.assertNumQueries(1):
+            order_stats = get_order_stats(self.merchant)
+        self.assertEqual(order_stats['total_orders'], 2)
+        self.assertEqual(order_stats['paid_orders'], 1)
+        self.assertEqual(order_stats['total_revenue'], 300)
+
+    def test_daily_stats_rollup_follows_order_and_ticket_transitions(self):
+        """測試每日統計彙總隨訂單付款與票券核銷更新"""
+        from payments.models import MerchantDailyStats, OrderItem
+        from payments.tasks import rebuild_merchant_daily_stats
+        from .stats import get_order_status_counts, get_period_summary
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            order = self._create_order('pending', quantity=2)
+            order.status = 'paid'
+            order.save()
+            self._create_order('cancelled')
+
+        # 訂單異動時不在寫入流程中重新計算，交易提交後才排程背景任務
+        self.assertTrue(callbacks)
+        self.assertFalse(MerchantDailyStats.objects.filter(merchant=self.merchant).exists())
+        rebuild_merchant_daily_stats(self.merchant.pk, timezone.localdate().isoformat())
+
+        since = timezone.now() - timezone.timedelta(days=30)
+        summary = get_period_summary(self.merchant, since)
+        self.assertEqual(summary['order_count'], 2)
+        self.assertEqual(summary['paid_order_count'], 1)
+        self.assertEqual(summary['revenue'], 200)
+        self.assertEqual(summary['tickets_issued'], 2)
+        self.assertEqual(summary['tickets_unused'], 2)
+        self.assertEqual(
+            dict(get_order_status_counts(self.merchant, since)),
+            {'paid': 1, 'cancelled': 1},
+        )
+
+        ticket = OrderItem.objects.select_related('order', 'product').first()
+        success, _ = ticket.use_ticket(self.merchant)
+        self.assertTrue(success)
+
+        summary = get_period_summary(self.merchant, since)
+        self.assertEqual(summary['tickets_used'], 1)
+        self.assertEqual(summary['tickets_unused'], 1)
+        self.assertEqual(
+            sum(summary[field] for field, _, _ in MerchantDailyStats.TIME_BUCKETS), 1
+        )
+
+        # 重新計算結果應與即時累加一致
+        MerchantDailyStats.rebuild_range(days=1)
+        self.assertEqual(get_period_summary(self.merchant, since), summary)
+
+        # 統計列尚未建立時累加不會寫入，核銷提交後排程的重新計算會補上
+        MerchantDailyStats.objects.filter(merchant=self.merchant).delete()
+        ticket = OrderItem.objects.select_related('order', 'product').get(status='unused')
+        with self.captureOnCommitCallbacks() as callbacks:
+            success, _ = ticket.use_ticket(self.merchant)
+        self.assertTrue(success)
+        self.assertEqual(len(callbacks), 1)
+        rebuild_merchant_daily_stats(self.merchant.pk, timezone.localdate().isoformat())
+        self.assertEqual(get_period_summary(self.merchant, since)['tickets_used'], 2)
+
+    def test_ticket_export_streams_csv(self):
+        """測試票券明細以 CSV 串流匯出"""
+        self._create_order('paid', quantity=2)
+        self.client.force_login(self.member)
+
+        response = self.client.get(
+            reverse('merchant_account:export_tickets', args=['statsshop']),
+            {'format': 'csv'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(',')[0], '票券代碼')
+        self.assertEqual(len(lines), 3)
+
+    def test_async_export_is_private_and_reports_readiness(self):
+        """測試背景匯出存放於不公開的儲存空間，完成後才能由自己的商家下載"""
+        import tempfile
+        import uuid
+        from django.test import override_settings
+        from .tasks import generate_report_export
+
+        self._create_order('paid', quantity=2)
+        self.client.force_login(self.member)
+
+        response = self.client.post(
+            reverse('merchant_account:export_async', args=['tickets', 'statsshop']),
+            {'days': 'abc'},
+        )
+        self.assertEqual(response.status_code, 400)
+
+        with tempfile.TemporaryDirectory() as export_dir, override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            'exports': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': export_dir, 'base_url': '/signed/'},
+            },
+        }):
+            export_id = uuid.uuid4().hex
+            status_url = reverse('merchant_account:export_status', args=[export_id, 'statsshop'])
+            download_url = reverse('merchant_account:export_download', args=[export_id, 'statsshop'])
+
+            self.assertEqual(self.client.get(status_url).json(), {'success': True, 'ready': False})
+            self.assertEqual(self.client.get(download_url).status_code, 404)
+
+            generate_report_export(self.merchant.id, 'tickets', 30, 'csv', export_id)
+
+            data = self.client.get(status_url).json()
+            self.assertTrue(data['ready'])
+            response = self.client.get(data['download_url'])
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response['Location'].startswith(f'/signed/{self.merchant.id}/{export_id}/'))
+
+    def test_order_and_tickets_carry_merchant(self):
+        """測試訂單與票券帶有商家欄位，且可由回補命令補齊"""
+        from io import StringIO
+        from django.core.management import call_command
+        from payments.models import Order, OrderItem
+
+        order = self._create_order('paid', quantity=2)
+        self.assertEqual(order.merchant_id, self.merchant.id)
+        self.assertEqual(
+            OrderItem.objects.filter(merchant=self.merchant).count(), 2
+        )
+
+        Order.objects.update(merchant=None)
+        OrderItem.objects.update(merchant=None)
+        call_command('backfill_order_merchant', batch_size=1, stdout=StringIO())
+
+        self.assertFalse(Order.objects.filter(merchant__isnull=True).exists())
+        self.assertFalse(OrderItem.objects.filter(merchant__isnull=True).exists())
+
+    def test_sold_tickets_cursor_pagination(self):
+        """測試售出票券以游標分頁，JSON 可前後翻頁且不重複"""
+        self._create_order('paid', quantity=5)
+        self._create_order('paid', quantity=5)
+        self._create_order('paid', quantity=5)
+        self._create_order('paid', quantity=10)
+        self.client.force_login(self.member)
+        url = reverse('merchant_account:sold_tickets', args=['statsshop'])
+
+        first_page = self.client.get(url, {'format': 'json'}).json()
+        self.assertEqual(len(first_page['results']), 20)
+        self.assertTrue(first_page['has_next'])
+        self.assertFalse(first_page['has_previous'])
+
+        second_page = self.client.get(
+            url, {'format': 'json', 'cursor': first_page['next_cursor']}
+        ).json()
+        self.assertEqual(len(second_page['results']), 5)
+        self.assertFalse(second_page['has_next'])
+
+        ticket_ids = [
+            ticket['id'] for ticket in first_page['results'] + second_page['results']
+        ]
+        self.assertEqual(len(set(ticket_ids)), 25)
+
+        previous_page = self.client.get(
+            url, {'format': 'json', 'cursor': second_page['previous_cursor']}
+        ).json()
+        self.assertEqual(previous_page['results'], first_page['results'])
+        self.assertFalse(previous_page['has_previous'])
+
+        response = self.client.get(url, {'cursor': first_page['next_cursor']})
+        self.assertEqual(response.status_code, 200)
+
+
+class SubdomainResolutionCacheTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .subdomain_cache import local_cache
+
+        cache.clear()
+        local_cache.clear()
+        self.member = Member.objects.create_user(
+            username='cache@example.com',
+            email='cache@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        self.merchant = Merchant.objects.create(
+            member=self.member,
+            ShopName='快取商店',
+            UnifiedNumber='99887766',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='cacheshop'
+        )
+
+    def test_resolution_is_cached_and_invalidated_on_subdomain_change(self):
+        """測試子網域解析穩定後不查詢資料庫，修改子網域後快取立即失效"""
+        from .subdomain_cache import get_active_redirect, get_merchant_by_subdomain
+
+        self.assertEqual(get_merchant_by_subdomain('cacheshop').pk, self.merchant.pk)
+        self.assertIsNone(get_active_redirect('cacheshop'))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                get_merchant_by_subdomain('cacheshop').pk, self.merchant.pk
+            )
+            self.assertIsNone(get_active_redirect('cacheshop'))
+
+        self.merchant.change_subdomain('cacheshop2')
+
+        self.assertIsNone(get_merchant_by_subdomain('cacheshop'))
+        self.assertEqual(get_active_redirect('cacheshop').new_subdomain, 'cacheshop2')
+        self.assertEqual(get_merchant_by_subdomain('cacheshop2').pk, self.merchant.pk)
+
+        response = self.client.get('/', HTTP_HOST='cacheshop.truepay.tw')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], 'http://cacheshop2.truepay.tw/')
+
+    def test_unknown_subdomain_is_negatively_cached(self):
+        """測試不存在的子網域也會快取，建立商家後快取失效"""
+        from .subdomain_cache import get_merchant_by_subdomain
+
+        self.assertIsNone(get_merchant_by_subdomain('newshop'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_merchant_by_subdomain('newshop'))
+
+        self.merchant.subdomain = 'newshop'
+        self.merchant.save()
+
+        self.assertEqual(get_merchant_by_subdomain('newshop').pk, self.merchant.pk)
+
+
+class BufferedRedirectCounterTestCase(TestCase):
+    def setUp(self):
+        member = Member.objects.create_user(
+            username='counter@example.com',
+            email='counter@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        self.merchant = Merchant.objects.create(
+            member=member,
+            ShopName='計數商店',
+            UnifiedNumber='44556677',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='countershop'
+        )
+        self.redirect = SubdomainRedirect.create_redirect(
+            old_subdomain='oldcounter',
+            new_subdomain='countershop',
+            merchant=self.merchant,
+        )
+
+    @override_settings(REDIS_URL=None)
+    def test_redirect_hits_are_written_directly_without_redis(self):
+        """測試未設定 Redis 時重導向計數直接寫入資料庫"""
+        for _ in range(5):
+            self.redirect.use_redirect()
+
+        self.redirect.refresh_from_db()
+        self.assertEqual(self.redirect.redirect_count, 5)
+        self.assertIsNotNone(self.redirect.last_used)
+        self.assertEqual(flush_counters(), 0)
+
+    @unittest.skipUnless(os.getenv('TEST_REDIS_URL'), '需要 TEST_REDIS_URL')
+    def test_redirect_hits_are_kept_in_redis_and_flushed_in_one_update(self):
+        """測試重導向計數累積在 Redis，定期寫入時合併為一次 UPDATE"""
+        from truepay.counters import _counter_keys
+        from truepay.redis_client import get_redis_client
+
+        with override_settings(REDIS_URL=os.getenv('TEST_REDIS_URL')):
+            client = get_redis_client()
+            client.delete(*_counter_keys('subdomain_redirect_hits'))
+
+            with self.assertNumQueries(0):
+                for _ in range(5):
+                    self.redirect.use_redirect()
+
+            self.redirect.refresh_from_db()
+            self.assertEqual(self.redirect.redirect_count, 0)
+
+            # 上次寫入中斷留下的處理中資料會先寫入，之後的計數留到下一次
+            client.rename(*_counter_keys('subdomain_redirect_hits')[::2])
+            self.redirect.use_redirect()
+            self.assertEqual(flush_counters(), 1)
+
+            self.redirect.refresh_from_db()
+            self.assertEqual(self.redirect.redirect_count, 5)
+            self.assertIsNotNone(self.redirect.last_used)
+
+            # 其他程序寫入中時不重複寫入
+            with client.lock('truepay:counters:flush_lock', timeout=5):
+                self.assertEqual(flush_counters(), 0)
+            self.assertEqual(flush_counters(), 1)
+            self.redirect.refresh_from_db()
+            self.assertEqual(self.redirect.redirect_count, 6)
+            self.assertEqual(flush_counters(), 0)
+
+
+class NginxRedirectExportTestCase(TestCase):
+    def setUp(self):
+        member = Member.objects.create_user(
+            username='nginx@example.com',
+            email='nginx@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        self.merchant = Merchant.objects.create(
+            member=member,
+            ShopName='nginx 商店',
+            UnifiedNumber='33445566',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='nginxshop'
+        )
+
+    def test_map_contains_active_redirects_and_merchant_subdomains(self):
+        """測試 map 只包含啟用中且未過期的重導向，並涵蓋所有商家子網域"""
+        from .nginx_redirects import build_nginx_redirect_maps
+
+        SubdomainRedirect.create_redirect('oldnginx', 'nginxshop', self.merchant)
+        expired = SubdomainRedirect.create_redirect(
+            'expirednginx', 'nginxshop', self.merchant
+        )
+        expired.expires_at = timezone.now() - timezone.timedelta(days=1)
+        expired.save()
+
+        content = build_nginx_redirect_maps()
+
+        self.assertIn('"oldnginx.truepay.tw" "nginxshop.truepay.tw";', content)
+        self.assertNotIn('expirednginx', content)
+        self.assertIn('"nginxshop" "nginxshop.', content)
+        self.assertIn('"oldnginx" "nginxshop.', content)
+
+    def test_export_only_reports_change_when_content_differs(self):
+        """測試內容沒有變動時不重寫檔案、不重新載入"""
+        import os
+        import tempfile
+        from .nginx_redirects import MAPS_FILENAME, RULES_FILENAME, export_nginx_redirects
+
+        with tempfile.TemporaryDirectory() as directory:
+            result = export_nginx_redirects(directory=directory, reload=False)
+            self.assertTrue(result['changed'])
+            self.assertTrue(os.path.exists(os.path.join(directory, MAPS_FILENAME)))
+            self.assertTrue(os.path.exists(os.path.join(directory, RULES_FILENAME)))
+
+            result = export_nginx_redirects(directory=directory, reload=False)
+            self.assertFalse(result['changed'])
+
+            SubdomainRedirect.create_redirect('oldnginx', 'nginxshop', self.merchant)
+            result = export_nginx_redirects(directory=directory, reload=False)
+            self.assertTrue(result['changed'])
+
+
+class ReplicaRouterTestCase(TestCase):
+    def setUp(self):
+        from django.test import RequestFactory
+        from truepay.db_router import ReplicaRouter
+
+        self.router = ReplicaRouter()
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def test_reads_use_replica_only_inside_using_replica(self):
+        """測試只有 using_replica 範圍內的讀取導向副本，寫入一律使用主資料庫"""
+        from unittest.mock import patch
+        from truepay.db_router import using_replica
+
+        with patch('truepay.db_router.replica_configured', return_value=True):
+            self.assertIsNone(self.router.db_for_read(Merchant))
+            with using_replica():
+                self.assertEqual(self.router.db_for_read(Merchant), 'replica')
+                self.assertEqual(self.router.db_for_write(Merchant), 'default')
+            self.assertIsNone(self.router.db_for_read(Merchant))
+
+        # 未設定副本時不導向
+        with using_replica():
+            self.assertIsNone(self.router.db_for_read(Merchant))
+
+    def test_view_reads_primary_after_recent_write(self):
+        """測試使用者剛寫入後，裝飾的 view 仍讀主資料庫"""
+        import time
+        from unittest.mock import patch
+        from truepay.db_router import SESSION_PINNED_UNTIL_KEY, using_replica
+
+        @using_replica
+        def report_view(request):
+            return self.router.db_for_read(Merchant)
+
+        with patch('truepay.db_router.replica_configured', return_value=True):
+            self.assertEqual(report_view(self.request), 'replica')
+
+            self.request.session[SESSION_PINNED_UNTIL_KEY] = time.time() + 10
+            self.assertIsNone(report_view(self.request))
+
+            self.request.session[SESSION_PINNED_UNTIL_KEY] = time.time() - 1
+            self.assertEqual(report_view(self.request), 'replica')
+
+    def test_stickiness_middleware_pins_session_after_write(self):
+        """測試請求中有寫入時，middleware 在 session 記錄固定讀主資料庫的期間"""
+        from unittest.mock import patch
+        from django.http import HttpResponse
+        from truepay.db_router import SESSION_PINNED_UNTIL_KEY, ReplicaStickinessMiddleware
+
+        def read_only_view(request):
+            return HttpResponse()
+
+        def writing_view(request):
+            self.router.db_for_write(Merchant)
+            return HttpResponse()
+
+        with patch('truepay.db_router.replica_configured', return_value=True):
+            ReplicaStickinessMiddleware(read_only_view)(self.request)
+            self.assertNotIn(SESSION_PINNED_UNTIL_KEY, self.request.session)
+
+            ReplicaStickinessMiddleware(writing_view)(self.request)
+            self.assertIn(SESSION_PINNED_UNTIL_KEY, self.request.session)
+
+    def test_raw_sql_write_pins_session(self):
+        """測試不經過路由的原生 SQL 寫入以 mark_primary_write 記錄後同樣固定讀主資料庫"""
+        from unittest.mock import patch
+        from django.http import HttpResponse
+        from truepay.db_router import (
+            SESSION_PINNED_UNTIL_KEY,
+            ReplicaStickinessMiddleware,
+            mark_primary_write,
+        )
+
+        def raw_sql_view(request):
+            mark_primary_write()
+            return HttpResponse()
+
+        # 請求以外呼叫不影響
+        mark_primary_write()
+        with patch('truepay.db_router.replica_configured', return_value=True):
+            ReplicaStickinessMiddleware(raw_sql_view)(self.request)
+            self.assertIn(SESSION_PINNED_UNTIL_KEY, self.request.session)
@@ -22,6 +22,20 @@ urlpatterns = [
     path(
         "ticket/scan_restart/<slug:subdomain>/", views.restart_scan, name="restart_scan"
     ),
+    path(
+        "ticket/batch/<slug:subdomain>/", views.batch_tickets, name="batch_tickets"
+    ),
+    # 離線掃描器：下載票券清單、上傳批次核銷
+    path(
+        "ticket/scanner/manifest/<slug:subdomain>/",
+        views.scanner_manifest,
+        name="scanner_manifest",
+    ),
+    path(
+        "ticket/scanner/sync/<slug:subdomain>/",
+        views.scanner_sync,
+        name="scanner_sync",
+    ),
     path(
         "verification_records/<slug:subdomain>/",
         views.verification_records,
@@ -70,6 +84,21 @@ urlpatterns = [
         views.export_product_report,
         name="export_products",
     ),
+    path(
+        "export/async/<str:report_type>/<slug:subdomain>/",
+        views.export_report_async,
+        name="export_async",
+    ),
+    path(
+        "export/status/<str:export_id>/<slug:subdomain>/",
+        views.export_report_status,
+        name="export_status",
+    ),
+    path(
+        "export/download/<str:export_id>/<slug:subdomain>/",
+        views.export_report_download,
+        name="export_download",
+    ),
     # 圖表數據API端點
     path(
         "api/chart-data/sales/<slug:subdomain>/",
@@ -1,22 +1,26 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.core.paginator import Paginator
 from django.contrib.auth import login as django_login
 from django.contrib.auth import logout as django_logout
-from django.core.paginator import Paginator
 from django.db.models import Sum, Count, Q, Avg, Case, When, IntegerField
 from django.db.models.functions import TruncDate, ExtractHour
 from django.views.decorators.http import require_POST
 from django.utils import timezone
-from django.db.models import Sum
-from django.http import HttpResponse, JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.http import Http404, HttpResponse, JsonResponse
 from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
 from datetime import datetime, timedelta
+import json
+import uuid
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
 
 
+from truepay.db_router import using_replica
 from truepay.decorators import no_cache_required, merchant_verified_required
+from truepay.pagination import CursorPaginator
 from .forms import (
     RegisterForm,
     LoginForm,
@@ -27,10 +31,31 @@ from .forms import (
 from customers_account.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 from .models import Merchant, SubdomainRedirect
-from payments.models import Order, OrderItem, TicketValidation
+from .session import bind_merchant_session
+from .exports import (
+    EXPORT_FAILED_KEY,
+    EXPORT_MAX_DAYS,
+    EXPORT_TYPES,
+    find_export_file,
+    get_export_storage,
+    stream_csv_response,
+)
+from .tasks import generate_report_export
+from .stats import (
+    get_daily_stats,
+    get_order_stats,
+    get_order_status_counts,
+    get_period_summary,
+    get_ticket_stats,
+    get_usage_rate,
+)
+from payments.audit import log_ticket_validation
+from payments.models import MerchantDailyStats, Order, OrderItem, TicketValidation
+from payments.redemption import redeem_ticket, redeem_ticket_batch
+from payments.scanner import build_scanner_manifest
+from payments.serializers import serialize_order, serialize_ticket
+from payments.ticket_tokens import is_ticket_token, verify_ticket_token
 from merchant_marketplace.models import Product
-from payments.models import Order
-from datetime import datetime
 
 
 def register(req):
@@ -58,6 +83,7 @@ def register(req):
                     merchant.member,
                     backend="django.contrib.auth.backends.ModelBackend",
                 )
+                bind_merchant_session(req, merchant)
                 messages.success(req, "註冊成功！歡迎加入 TruePay！")
                 return redirect(
                     "merchant_account:dashboard", subdomain=merchant.subdomain
@@ -101,6 +127,7 @@ def login(req):
             django_login(
                 req, member, backend="django.contrib.auth.backends.ModelBackend"
             )
+            bind_merchant_session(req, merchant)
 
             # 檢查商家審核狀態
             if merchant.verification_status == "pending":
@@ -175,49 +202,34 @@ def dashboard(request, subdomain):
     recent_products = products.order_by("-created_at")[:5]
 
     # 獲取交易記錄統計
-    orders = Order.objects.filter(product__merchant=request.merchant)
-    total_orders = orders.count()
+    orders = Order.objects.filter(merchant=request.merchant)
     recent_orders = orders.select_related("product", "customer").order_by(
         "-created_at"
     )[:5]
+    order_stats = get_order_stats(request.merchant)
 
-    # 計算總收入（只計算已付款的訂單，使用鏈式操作更高效）
-    total_revenue = (
-        orders.filter(status="paid").aggregate(total=Sum("amount"))["total"] or 0
-    )
-
-    # 票券統計數據
+    # 票券統計數據（單一條件聚合查詢）
     tickets = OrderItem.objects.select_related("order", "product", "customer").filter(
-        product__merchant=request.merchant
+        merchant=request.merchant
     )
-
-    # 計算各種票券狀態
-    now = timezone.now()
+    stats = get_ticket_stats(request.merchant)
     ticket_stats = {
-        "total": tickets.count(),
-        "unused": tickets.filter(status="unused").count(),
-        "used": tickets.filter(status="used").count(),
-        "expired": tickets.filter(
-            Q(status="expired") | Q(valid_until__lt=now, status="unused")
-        ).count(),
+        "total": stats["total"],
+        "unused": stats["unused"],
+        "used": stats["used"],
+        "expired": stats["expired"] + stats["overdue"],
+        # 即將到期的票券（未來24小時內）
+        "expiring_soon": stats["expiring_soon"],
     }
 
-    # 計算即將到期的票券（未來24小時內）
-    expiring_soon = tickets.filter(
-        status="unused",
-        valid_until__lte=now + timezone.timedelta(hours=24),
-        valid_until__gt=now,
-    ).count()
-    ticket_stats["expiring_soon"] = expiring_soon
-
     # 最近售出的票券（最近5張）
     recent_tickets = tickets.order_by("-created_at")[:5]
 
     context = {
         "merchant": request.merchant,
         "total_products": total_products,
-        "total_orders": total_orders,
-        "total_revenue": total_revenue,
+        "total_orders": order_stats["total_orders"],
+        "total_revenue": order_stats["total_revenue"],
         "recent_products": recent_products,
         "recent_orders": recent_orders,
         "ticket_stats": ticket_stats,
@@ -234,16 +246,16 @@ def transaction_history(request, subdomain):
     orders = (
         Order.objects.select_related("customer", "product")
         .prefetch_related("items")  # 預載入票券資料
-        .filter(product__merchant=request.merchant)
+        .filter(merchant=request.merchant)
         .order_by("-created_at")
     )
 
-    order_items = orders
+    # 游標分頁處理
+    paginator = CursorPaginator(orders, 10)  # 每頁顯示10筆記錄
+    page_obj = paginator.get_page(request.GET)
 
-    # 分頁處理
-    paginator = Paginator(order_items, 10)  # 每頁顯示10筆記錄
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    if request.GET.get("format") == "json":
+        return JsonResponse(page_obj.to_json(serialize_order))
 
     context = {
         "merchant": request.merchant,
@@ -272,12 +284,12 @@ def validate_ticket(request, subdomain):
     ticket_code = request.POST.get("ticket_code", "").strip().upper()
     validation_method = request.POST.get("method", "manual")
 
-    # 記錄驗證嘗試
+    # 記錄驗證失敗（批次非同步寫入，見 payments.audit）
     def create_validation_record(ticket, status, reason=""):
-        return TicketValidation.objects.create(
-            ticket=ticket,
-            merchant=merchant,
-            status=status,
+        log_ticket_validation(
+            ticket.pk,
+            merchant.pk,
+            status,
             failure_reason=reason,
             validation_method=validation_method,
             ip_address=request.META.get("REMOTE_ADDR"),
@@ -290,11 +302,26 @@ def validate_ticket(request, subdomain):
         }
         return render(request, "merchant_account/partials/ticket_error.html", context)
 
+    if is_ticket_token(ticket_code):
+        # QR code 簽章 token：簽章、商家與期限在本機驗證，無效時不查詢資料庫
+        token, error = verify_ticket_token(ticket_code, merchant_id=merchant.pk)
+        if error:
+            context = {
+                "error_message": error,
+                "merchant": merchant,
+            }
+            return render(
+                request, "merchant_account/partials/ticket_error.html", context
+            )
+        ticket_lookup = {"pk": token.ticket_id}
+    else:
+        ticket_lookup = {"ticket_code": ticket_code}
+
     try:
         # 查找票券（OrderItem）
         ticket = OrderItem.objects.select_related(
             "order", "product__merchant", "customer"
-        ).get(ticket_code=ticket_code)
+        ).get(**ticket_lookup)
 
         # 檢查票券有效性
         is_valid, message = ticket.is_valid()
@@ -321,7 +348,7 @@ def validate_ticket(request, subdomain):
 
         # 票券驗證成功，顯示確認頁面
         context = {
-            "ticket_code": ticket_code,
+            "ticket_code": ticket.ticket_code,
             "ticket_info": ticket.ticket_info,
             "merchant": merchant,
         }
@@ -350,42 +377,29 @@ def use_ticket(request, subdomain):
         }
         return render(request, "merchant_account/partials/ticket_error.html", context)
 
-    try:
-        ticket = OrderItem.objects.select_related(
-            "order", "product__merchant", "customer"
-        ).get(ticket_code=ticket_code)
-
-        # 使用票券
-        success, message = ticket.use_ticket(merchant)
-
-        if success:
-            # ticket.use_ticket() 已經更新票券狀態到資料庫，不需要額外記錄
-
-            context = {
-                "message": message,
-                "ticket_value": ticket.order.unit_price,
-                "used_at": ticket.used_at,
-                "merchant": merchant,
-            }
-            return render(
-                request, "merchant_account/partials/ticket_used.html", context
-            )
-        else:
-            context = {
-                "error_message": message,
-                "merchant": merchant,
-            }
-            return render(
-                request, "merchant_account/partials/ticket_error.html", context
-            )
+    # 檢查與核銷在同一個條件式 UPDATE 中完成，多台掃描器同時掃描也不會重複核銷
+    redemption = redeem_ticket(
+        ticket_code,
+        merchant,
+        validation_method=request.POST.get("method", "manual"),
+        ip_address=request.META.get("REMOTE_ADDR"),
+    )
 
-    except OrderItem.DoesNotExist:
+    if not redemption.success:
         context = {
-            "error_message": "找不到此票券代碼",
+            "error_message": redemption.message,
             "merchant": merchant,
         }
         return render(request, "merchant_account/partials/ticket_error.html", context)
 
+    context = {
+        "message": redemption.message,
+        "ticket_value": redemption.ticket_value,
+        "used_at": redemption.used_at,
+        "merchant": merchant,
+    }
+    return render(request, "merchant_account/partials/ticket_used.html", context)
+
 
 @no_cache_required
 @require_POST
@@ -395,7 +409,142 @@ def restart_scan(request, subdomain):
     return render(request, "merchant_account/partials/scan_ready.html", context)
 
 
+# === 離線掃描器 API ===
+
+
+def _parse_scan_time(value):
+    """解析掃描器傳來的 ISO 時間，未帶時區時視為當地時間；格式錯誤時拋出 ValueError"""
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
 @no_cache_required
+def scanner_manifest(request, subdomain):
+    """
+    下載離線掃描器的票券清單，帶 since 時只回傳差異
+
+    清單分頁回傳，next_cursor 不為 null 時以相同的 since 加上 cursor 下載下一頁
+    """
+    if request.method != "GET":
+        return JsonResponse({"success": False, "error": "Method not allowed"}, status=405)
+
+    since = request.GET.get("since")
+    try:
+        since = _parse_scan_time(since) if since else None
+    except ValueError:
+        return JsonResponse({"success": False, "error": "同步時間格式錯誤"}, status=400)
+
+    try:
+        manifest = build_scanner_manifest(
+            request.merchant, since=since, cursor=request.GET.get("cursor")
+        )
+    except ValueError:
+        return JsonResponse({"success": False, "error": "分頁游標格式錯誤"}, status=400)
+    return JsonResponse({"success": True, **manifest})
+
+
+@no_cache_required
+@require_POST
+def scanner_sync(request, subdomain):
+    """
+    上傳離線掃描器的核銷記錄，於伺服器端以單一交易批次核銷
+
+    請求內容: {"redemptions": [{"ticket": 票券代碼或 QR code 內容, "scanned_at": ISO 時間}]}
+    已被其他掃描器核銷的票券回傳 conflict 與核銷時間
+    """
+    try:
+        redemptions = json.loads(request.body)["redemptions"]
+        scans = [
+            (
+                str(item["ticket"]),
+                _parse_scan_time(item["scanned_at"]) if item.get("scanned_at") else None,
+            )
+            for item in redemptions
+        ]
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+        return JsonResponse({"success": False, "error": "無效的請求格式"}, status=400)
+
+    if len(scans) > settings.SCANNER_SYNC_MAX_BATCH:
+        return JsonResponse(
+            {
+                "success": False,
+                "error": f"每次最多上傳 {settings.SCANNER_SYNC_MAX_BATCH} 筆核銷記錄",
+            },
+            status=400,
+        )
+
+    results = redeem_ticket_batch(
+        request.merchant,
+        scans,
+        validation_method="qr_code",
+        ip_address=request.META.get("REMOTE_ADDR"),
+    )
+    return _ticket_batch_response(results)
+
+
+def _ticket_batch_response(results):
+    """批次驗證／核銷的 JSON 回應：各狀態數量與每張票券的結果"""
+    counts = {"redeemed": 0, "valid": 0, "conflict": 0, "rejected": 0}
+    for result in results:
+        counts[result.status] += 1
+    return JsonResponse(
+        {
+            "success": True,
+            "redeemed": counts["redeemed"],
+            "valid": counts["valid"],
+            "conflicts": counts["conflict"],
+            "rejected": counts["rejected"],
+            "results": [result._asdict() for result in results],
+        }
+    )
+
+
+@no_cache_required
+@require_POST
+def batch_tickets(request, subdomain):
+    """
+    批次驗證或核銷票券（團體入場）
+
+    請求內容: {"ticket_codes": [票券代碼或 QR code 內容], "mode": "validate" 或 "redeem"}
+    不論票券數量，查詢數固定
+    """
+    try:
+        data = json.loads(request.body)
+        ticket_codes = data["ticket_codes"]
+        mode = data.get("mode", "validate")
+        if not isinstance(ticket_codes, list) or mode not in ("validate", "redeem"):
+            raise ValueError(mode)
+        scans = [(str(code), None) for code in ticket_codes]
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+        return JsonResponse({"success": False, "error": "無效的請求格式"}, status=400)
+
+    if not scans:
+        return JsonResponse({"success": False, "error": "請輸入票券驗證碼"}, status=400)
+    if len(scans) > settings.TICKET_BATCH_MAX_CODES:
+        return JsonResponse(
+            {
+                "success": False,
+                "error": f"每次最多處理 {settings.TICKET_BATCH_MAX_CODES} 張票券",
+            },
+            status=400,
+        )
+
+    results = redeem_ticket_batch(
+        request.merchant,
+        scans,
+        validation_method="qr_code" if data.get("method") == "qr_code" else "manual",
+        ip_address=request.META.get("REMOTE_ADDR"),
+        dry_run=mode == "validate",
+    )
+    return _ticket_batch_response(results)
+
+
+@no_cache_required
+@using_replica
 def verification_records(request, subdomain):
     """票券使用紀錄頁面 - 顯示該商家的已使用票券記錄"""
     merchant = request.merchant
@@ -408,8 +557,10 @@ def verification_records(request, subdomain):
 
     # 基本查詢：取得該商家的所有已使用票券
     used_tickets = (
-        OrderItem.objects.select_related("order__customer__member", "product", "order")
-        .filter(product__merchant=merchant, status="used")
+        OrderItem.objects.select_related(
+            "order__customer__member", "product", "order", "customer"
+        )
+        .filter(merchant=merchant, status="used")
         .order_by("-used_at")
     )
 
@@ -444,7 +595,7 @@ def verification_records(request, subdomain):
     # 統計資料（合併為單一 aggregate 查詢）
 
     all_used_tickets = OrderItem.objects.filter(
-        product__merchant=merchant, status="used"
+        merchant=merchant, status="used"
     )
     usage_stats = all_used_tickets.aggregate(
         total_tickets=Count("id"),
@@ -461,10 +612,12 @@ def verification_records(request, subdomain):
         .order_by("name")
     )
 
-    # 分頁處理
-    paginator = Paginator(used_tickets, 15)  # 每頁顯示15筆記錄
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # 游標分頁處理（依核銷時間排序）
+    paginator = CursorPaginator(used_tickets, 15, key_field="used_at")  # 每頁顯示15筆記錄
+    page_obj = paginator.get_page(request.GET)
+
+    if request.GET.get("format") == "json":
+        return JsonResponse(page_obj.to_json(serialize_ticket))
 
     context = {
         "merchant": merchant,
@@ -618,6 +771,7 @@ def subdomain_management(request, subdomain):
                 reason = form.cleaned_data.get("reason", "商家主動修改")
 
                 merchant.change_subdomain(new_subdomain, reason)
+                bind_merchant_session(request, merchant)
 
                 messages.success(request, f"子網域已成功修改為 {new_subdomain}")
 
@@ -656,7 +810,7 @@ def sold_tickets_list(request, subdomain):
 
     # 基本查詢：該廠商的所有已付款票券
     tickets = (
-        OrderItem.objects.filter(product__merchant=merchant, order__status="paid")
+        OrderItem.objects.filter(merchant=merchant, order__status="paid")
         .select_related("order", "customer", "customer__member", "product")
         .order_by("-created_at")
     )
@@ -690,37 +844,28 @@ def sold_tickets_list(request, subdomain):
             | Q(order__provider_order_id__icontains=search_query)
         )
 
-    # 統計資訊
-    all_tickets = OrderItem.objects.filter(
-        product__merchant=merchant, order__status="paid"
+    # 統計資訊（即將到期為7天內）
+    ticket_stats = get_ticket_stats(
+        merchant, paid_only=True, expiring_within=timedelta(days=7)
     )
-
     stats = {
-        "total_tickets": all_tickets.count(),
-        "unused_tickets": all_tickets.filter(status="unused").count(),
-        "used_tickets": all_tickets.filter(status="used").count(),
-        "expired_tickets": all_tickets.filter(status="expired").count(),
-        "total_revenue": all_tickets.aggregate(total=Sum("order__amount"))["total"]
-        or 0,
+        "total_tickets": ticket_stats["total"],
+        "unused_tickets": ticket_stats["unused"],
+        "used_tickets": ticket_stats["used"],
+        "expired_tickets": ticket_stats["expired"],
+        "total_revenue": ticket_stats["revenue"],
+        "expiring_soon": ticket_stats["expiring_soon"],
     }
 
-    # 即將到期的票券（7天內）
-    from datetime import timedelta
-
-    upcoming_expiry = timezone.now() + timedelta(days=7)
-    stats["expiring_soon"] = all_tickets.filter(
-        status="unused",
-        valid_until__lte=upcoming_expiry,
-        valid_until__gt=timezone.now(),
-    ).count()
-
     # 獲取廠商的所有商品（用於篩選下拉選單）
     merchant_products = Product.objects.filter(merchant=merchant).order_by("name")
 
-    # 分頁功能
-    paginator = Paginator(tickets, 20)  # 每頁20筆
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # 游標分頁
+    paginator = CursorPaginator(tickets, 20)  # 每頁20筆
+    page_obj = paginator.get_page(request.GET)
+
+    if request.GET.get("format") == "json":
+        return JsonResponse(page_obj.to_json(serialize_ticket))
 
     context = {
         "merchant": merchant,
@@ -743,6 +888,7 @@ def sold_tickets_list(request, subdomain):
 
 @no_cache_required
 @merchant_verified_required
+@using_replica
 def reports_dashboard(request, subdomain):
     """報表分析總覽頁面"""
     merchant = request.merchant
@@ -751,27 +897,18 @@ def reports_dashboard(request, subdomain):
     days = int(request.GET.get("days", 30))
     start_date = timezone.now() - timedelta(days=days)
 
-    # 基本統計數據
-    orders = Order.objects.filter(
-        product__merchant=merchant, created_at__gte=start_date
-    )
-    tickets = OrderItem.objects.filter(
-        order__product__merchant=merchant, created_at__gte=start_date
-    )
-    products = Product.objects.filter(merchant=merchant)
+    # 基本統計數據（讀取每日統計彙總）
+    summary = get_period_summary(merchant, start_date)
 
     context = {
         "merchant": merchant,
         "days": days,
-        "total_orders": orders.count(),
-        "total_revenue": orders.filter(status="paid").aggregate(Sum("amount"))[
-            "amount__sum"
-        ]
-        or 0,
-        "total_tickets": tickets.count(),
-        "total_products": products.count(),
-        "ticket_usage_rate": round(
-            tickets.filter(status="used").count() / max(tickets.count(), 1) * 100, 1
+        "total_orders": summary["order_count"],
+        "total_revenue": summary["revenue"],
+        "total_tickets": summary["tickets_issued"],
+        "total_products": Product.objects.filter(merchant=merchant).count(),
+        "ticket_usage_rate": get_usage_rate(
+            summary["tickets_used"], summary["tickets_issued"]
         ),
     }
 
@@ -779,12 +916,17 @@ def reports_dashboard(request, subdomain):
 
 
 @no_cache_required
+@using_replica
 def export_sales_report(request, subdomain):
     """匯出銷售分析報表"""
     merchant = request.merchant
     days = int(request.GET.get("days", 30))
     start_date = timezone.now() - timedelta(days=days)
 
+    # CSV 明細以串流方式輸出，不在記憶體中建立完整檔案
+    if request.GET.get("format") == "csv":
+        return stream_csv_response(merchant, "sales", start_date)
+
     # 建立工作簿
     wb = Workbook()
     ws = wb.active
@@ -808,24 +950,18 @@ def export_sales_report(request, subdomain):
     ws["A1"].alignment = Alignment(horizontal="center")
     ws["A2"].alignment = Alignment(horizontal="center")
 
-    # 營收趨勢數據
-    orders = Order.objects.filter(
-        product__merchant=merchant, created_at__gte=start_date
-    )
+    # 營收數據（讀取每日統計彙總）
+    summary = get_period_summary(merchant, start_date)
 
     # 總覽數據
     ws["A4"] = "營收總覽"
     ws["A4"].font = header_font
     ws["A4"].fill = header_fill
 
-    total_revenue = (
-        orders.filter(status="paid").aggregate(Sum("amount"))["amount__sum"] or 0
-    )
-    total_orders = orders.count()
-    paid_orders = orders.filter(status="paid").count()
-    avg_order_value = (
-        orders.filter(status="paid").aggregate(Avg("amount"))["amount__avg"] or 0
-    )
+    total_revenue = summary["revenue"]
+    total_orders = summary["order_count"]
+    paid_orders = summary["paid_order_count"]
+    avg_order_value = total_revenue / paid_orders if paid_orders else 0
 
     ws["A5"] = "總營收"
     ws["B5"] = f"NT$ {total_revenue:,}"
@@ -843,20 +979,18 @@ def export_sales_report(request, subdomain):
     ws["A11"].font = header_font
     ws["A11"].fill = header_fill
 
-    status_stats = (
-        orders.values("status").annotate(count=Count("id")).order_by("-count")
-    )
+    status_stats = get_order_status_counts(merchant, start_date)
 
     ws["A12"] = "狀態"
     ws["B12"] = "數量"
     ws["C12"] = "百分比"
 
     row = 13
-    for stat in status_stats:
-        status_display = dict(Order.STATUS_CHOICES).get(stat["status"], stat["status"])
-        percentage = stat["count"] / max(total_orders, 1) * 100
+    for status, count in status_stats:
+        status_display = dict(Order.STATUS_CHOICES).get(status, status)
+        percentage = count / max(total_orders, 1) * 100
         ws[f"A{row}"] = status_display
-        ws[f"B{row}"] = stat["count"]
+        ws[f"B{row}"] = count
         ws[f"C{row}"] = f"{percentage:.1f}%"
         row += 1
 
@@ -866,7 +1000,11 @@ def export_sales_report(request, subdomain):
     ws[f"A{row + 1}"].fill = header_fill
 
     provider_stats = (
-        orders.values("provider").annotate(count=Count("id")).order_by("-count")
+        get_daily_stats(merchant, start_date)
+        .values("provider")
+        .annotate(count=Sum("order_count"))
+        .filter(count__gt=0)
+        .order_by("-count")
     )
 
     row += 2
@@ -898,12 +1036,17 @@ def export_sales_report(request, subdomain):
 
 
 @no_cache_required
+@using_replica
 def export_ticket_report(request, subdomain):
     """匯出票券營運報表"""
     merchant = request.merchant
     days = int(request.GET.get("days", 30))
     start_date = timezone.now() - timedelta(days=days)
 
+    # CSV 明細以串流方式輸出，不在記憶體中建立完整檔案
+    if request.GET.get("format") == "csv":
+        return stream_csv_response(merchant, "tickets", start_date)
+
     wb = Workbook()
     ws = wb.active
     ws.title = "票券營運報表"
@@ -925,20 +1068,18 @@ def export_ticket_report(request, subdomain):
     ws["A1"].alignment = Alignment(horizontal="center")
     ws["A2"].alignment = Alignment(horizontal="center")
 
-    # 票券數據
-    tickets = OrderItem.objects.filter(
-        order__product__merchant=merchant, created_at__gte=start_date
-    )
+    # 票券數據（讀取每日統計彙總）
+    summary = get_period_summary(merchant, start_date)
 
     # 票券總覽
     ws["A4"] = "票券營運總覽"
     ws["A4"].font = header_font
     ws["A4"].fill = header_fill
 
-    total_tickets = tickets.count()
-    used_tickets = tickets.filter(status="used").count()
-    unused_tickets = tickets.filter(status="unused").count()
-    expired_tickets = tickets.filter(status="expired").count()
+    total_tickets = summary["tickets_issued"]
+    used_tickets = summary["tickets_used"]
+    unused_tickets = summary["tickets_unused"]
+    expired_tickets = summary["tickets_expired"]
     usage_rate = used_tickets / max(total_tickets, 1) * 100
 
     ws["A5"] = "總票券數"
@@ -976,8 +1117,11 @@ def export_ticket_report(request, subdomain):
         row += 1
 
     # 票券驗證統計
-    validations = TicketValidation.objects.filter(
-        ticket__order__product__merchant=merchant, validation_time__gte=start_date
+    validation_stats = TicketValidation.objects.filter(
+        ticket__merchant=merchant, validation_time__gte=start_date
+    ).aggregate(
+        total=Count("id"),
+        successful=Count("id", filter=Q(status="success")),
     )
 
     ws[f"A{row + 1}"] = "票券驗證統計"
@@ -985,8 +1129,8 @@ def export_ticket_report(request, subdomain):
     ws[f"A{row + 1}"].fill = header_fill
 
     row += 2
-    total_validations = validations.count()
-    successful_validations = validations.filter(status="success").count()
+    total_validations = validation_stats["total"]
+    successful_validations = validation_stats["successful"]
     success_rate = successful_validations / max(total_validations, 1) * 100
 
     ws[f"A{row}"] = "總驗證次數"
@@ -1010,12 +1154,17 @@ def export_ticket_report(request, subdomain):
 
 
 @no_cache_required
+@using_replica
 def export_product_report(request, subdomain):
     """匯出商品表現報表"""
     merchant = request.merchant
     days = int(request.GET.get("days", 30))
     start_date = timezone.now() - timedelta(days=days)
 
+    # CSV 明細以串流方式輸出，不在記憶體中建立完整檔案
+    if request.GET.get("format") == "csv":
+        return stream_csv_response(merchant, "products", start_date)
+
     wb = Workbook()
     ws = wb.active
     ws.title = "商品表現報表"
@@ -1037,21 +1186,19 @@ def export_product_report(request, subdomain):
     ws["A1"].alignment = Alignment(horizontal="center")
     ws["A2"].alignment = Alignment(horizontal="center")
 
-    # 商品銷售數據
-    products = (
-        Product.objects.filter(merchant=merchant)
-        .annotate(
-            order_count=Count(
-                "order",
-                filter=Q(order__created_at__gte=start_date, order__status="paid"),
-            ),
-            revenue=Sum(
-                "order__amount",
-                filter=Q(order__created_at__gte=start_date, order__status="paid"),
-            ),
-        )
-        .order_by("-order_count")
-    )
+    # 商品銷售數據（讀取每日統計彙總）
+    product_stats = {
+        item["product_id"]: item
+        for item in get_daily_stats(merchant, start_date)
+        .values("product_id")
+        .annotate(order_count=Sum("paid_order_count"), revenue=Sum("revenue"))
+    }
+    products = list(Product.objects.filter(merchant=merchant))
+    for product in products:
+        stat = product_stats.get(product.id, {})
+        product.order_count = stat.get("order_count") or 0
+        product.revenue = stat.get("revenue") or 0
+    products.sort(key=lambda product: product.order_count, reverse=True)
 
     # 商品銷售排行
     ws["A4"] = "商品銷售排行榜"
@@ -1090,8 +1237,8 @@ def export_product_report(request, subdomain):
     ws[f"A{row + 1}"].fill = header_fill
 
     row += 2
-    active_products = products.filter(is_active=True).count()
-    total_products = products.count()
+    active_products = sum(1 for product in products if product.is_active)
+    total_products = len(products)
 
     ws[f"A{row}"] = "商品總數"
     ws[f"B{row}"] = total_products
@@ -1143,10 +1290,73 @@ def export_product_report(request, subdomain):
     return response
 
 
+@no_cache_required
+@require_POST
+def export_report_async(request, subdomain, report_type):
+    """以背景任務產生報表明細檔案，完成狀態由 export_report_status 查詢"""
+    if report_type not in EXPORT_TYPES:
+        return JsonResponse({"success": False, "error": "不支援的報表類型"}, status=400)
+
+    try:
+        days = int(request.POST.get("days", 30))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= EXPORT_MAX_DAYS:
+        return JsonResponse(
+            {"success": False, "error": f"統計天數需介於 1 到 {EXPORT_MAX_DAYS} 天"},
+            status=400,
+        )
+
+    merchant = request.merchant
+    file_format = "csv" if request.POST.get("format") == "csv" else "xlsx"
+    export_id = uuid.uuid4().hex
+    generate_report_export.delay(merchant.id, report_type, days, file_format, export_id)
+
+    return JsonResponse(
+        {
+            "success": True,
+            "export_id": export_id,
+            "status_url": reverse(
+                "merchant_account:export_status", args=[export_id, subdomain]
+            ),
+            "message": "報表產生中，完成後即可下載",
+        }
+    )
+
+
+@no_cache_required
+def export_report_status(request, subdomain, export_id):
+    """查詢背景匯出是否完成（只能查詢自己商家的匯出）"""
+    merchant = request.merchant
+    if find_export_file(merchant.id, export_id):
+        return JsonResponse(
+            {
+                "success": True,
+                "ready": True,
+                "download_url": reverse(
+                    "merchant_account:export_download", args=[export_id, subdomain]
+                ),
+            }
+        )
+    if cache.get(EXPORT_FAILED_KEY.format(export_id)):
+        return JsonResponse({"success": False, "error": "報表產生失敗，請重新匯出"})
+    return JsonResponse({"success": True, "ready": False})
+
+
+@no_cache_required
+def export_report_download(request, subdomain, export_id):
+    """下載背景匯出的檔案：轉址到有時效的簽章網址"""
+    path = find_export_file(request.merchant.id, export_id)
+    if path is None:
+        raise Http404("找不到此匯出檔案")
+    return redirect(get_export_storage().url(path))
+
+
 # ===== 圖表數據API端點 =====
 
 
 @no_cache_required
+@using_replica
 def get_sales_chart_data(request, subdomain):
     """獲取銷售分析圖表數據"""
     if request.method != "GET":
@@ -1161,14 +1371,11 @@ def get_sales_chart_data(request, subdomain):
         trend_data = []
         trend_labels = []
 
-        # 使用 TruncDate 配合 annotate 一次性獲取所有日期的營收數據
+        # 讀取每日統計彙總，每天只需彙總少量資料列
+        daily_stats = get_daily_stats(merchant, start_date)
         daily_revenues = (
-            Order.objects.filter(
-                product__merchant=merchant, status="paid", created_at__gte=start_date
-            )
-            .annotate(date=TruncDate("created_at"))
-            .values("date")
-            .annotate(total_revenue=Sum("amount"))
+            daily_stats.values("date")
+            .annotate(total_revenue=Sum("revenue"))
             .order_by("date")
         )
 
@@ -1186,23 +1393,23 @@ def get_sales_chart_data(request, subdomain):
             current_date += timedelta(days=1)
 
         # 金流方式分析
-        orders = Order.objects.filter(
-            product__merchant=merchant, status="paid", created_at__gte=start_date
+        provider_revenues = (
+            daily_stats.values("provider", "payment_type")
+            .annotate(paid_count=Sum("paid_order_count"), total=Sum("revenue"))
+            .filter(paid_count__gt=0)
+            .order_by()
         )
 
         payment_stats = {}
-        for order in orders:
+        for item in provider_revenues:
             # 根據不同金流提供商確定支付方式
-            if order.provider == "newebpay":
-                method = order.newebpay_payment_type or "藍新金流"
-            elif order.provider == "linepay":
-                method = "LINE Pay"
-            else:
-                method = order.get_provider_display() or "其他"
+            method = MerchantDailyStats.get_payment_method_label(
+                item["provider"], item["payment_type"]
+            )
 
             if method not in payment_stats:
                 payment_stats[method] = 0
-            payment_stats[method] += float(order.amount)
+            payment_stats[method] += float(item["total"])
 
         payment_labels = list(payment_stats.keys())
         payment_data = list(payment_stats.values())
@@ -1224,6 +1431,7 @@ def get_sales_chart_data(request, subdomain):
 
 
 @no_cache_required
+@using_replica
 def get_tickets_chart_data(request, subdomain):
     """獲取票券營運圖表數據"""
     if request.method != "GET":
@@ -1234,53 +1442,23 @@ def get_tickets_chart_data(request, subdomain):
         days = int(request.GET.get("days", 30))
         start_date = timezone.now() - timedelta(days=days)
 
-        tickets = OrderItem.objects.filter(
-            order__product__merchant=merchant, created_at__gte=start_date
-        )
+        # 讀取每日統計彙總
+        summary = get_period_summary(merchant, start_date)
 
         # 使用率統計
-        used_tickets = tickets.filter(status="used").count()
-        unused_tickets = tickets.filter(status="unused").count()
-        expired_tickets = tickets.filter(status="expired").count()
-
         usage_labels = ["已使用", "未使用", "已過期"]
-        usage_data = [used_tickets, unused_tickets, expired_tickets]
-
-        # 驗證時間分布（按時間段） - 優化為資料庫層面聚合查詢
-        time_distribution = tickets.filter(
-            status="used", used_at__isnull=False
-        ).aggregate(
-            morning=Count(
-                Case(
-                    When(used_at__hour__gte=6, used_at__hour__lt=12, then=1),
-                    output_field=IntegerField(),
-                )
-            ),
-            afternoon=Count(
-                Case(
-                    When(used_at__hour__gte=12, used_at__hour__lt=18, then=1),
-                    output_field=IntegerField(),
-                )
-            ),
-            evening=Count(
-                Case(
-                    When(used_at__hour__gte=18, used_at__hour__lt=24, then=1),
-                    output_field=IntegerField(),
-                )
-            ),
-            night=Count(
-                Case(
-                    When(used_at__hour__gte=0, used_at__hour__lt=6, then=1),
-                    output_field=IntegerField(),
-                )
-            ),
-        )
+        usage_data = [
+            summary["tickets_used"],
+            summary["tickets_unused"],
+            summary["tickets_expired"],
+        ]
 
+        # 驗證時間分布（按時間段）
         time_stats = {
-            "早上 (6-12)": time_distribution["morning"],
-            "下午 (12-18)": time_distribution["afternoon"],
-            "晚上 (18-24)": time_distribution["evening"],
-            "深夜 (0-6)": time_distribution["night"],
+            "早上 (6-12)": summary["used_morning"],
+            "下午 (12-18)": summary["used_afternoon"],
+            "晚上 (18-24)": summary["used_evening"],
+            "深夜 (0-6)": summary["used_night"],
         }
 
         time_labels = list(time_stats.keys())
@@ -1303,6 +1481,7 @@ def get_tickets_chart_data(request, subdomain):
 
 
 @no_cache_required
+@using_replica
 def get_products_chart_data(request, subdomain):
     """獲取商品表現圖表數據"""
     if request.method != "GET":
@@ -1314,12 +1493,11 @@ def get_products_chart_data(request, subdomain):
         start_date = timezone.now() - timedelta(days=days)
 
         # 商品銷售排行 (TOP 10) - 使用資料庫聚合查詢優化
+        daily_stats = get_daily_stats(merchant, start_date)
         product_ranking = (
-            Order.objects.filter(
-                product__merchant=merchant, status="paid", created_at__gte=start_date
-            )
-            .values("product__name")
-            .annotate(sales_count=Count("id"))
+            daily_stats.values("product__name")
+            .annotate(sales_count=Sum("paid_order_count"))
+            .filter(sales_count__gt=0)
             .order_by("-sales_count")[:10]
         )
 
@@ -1328,11 +1506,11 @@ def get_products_chart_data(request, subdomain):
 
         # 商品營收排行 (TOP 6) - 使用資料庫聚合查詢優化
         category_revenue = (
-            Order.objects.filter(
-                product__merchant=merchant, status="paid", created_at__gte=start_date
+            daily_stats.values("product__name")
+            .annotate(
+                sales_count=Sum("paid_order_count"), total_revenue=Sum("revenue")
             )
-            .values("product__name")
-            .annotate(total_revenue=Sum("amount"))
+            .filter(sales_count__gt=0)
             .order_by("-total_revenue")[:6]
         )
 
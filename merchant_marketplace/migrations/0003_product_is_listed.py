@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:22
+
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+
+
+def compute_is_listed(apps, schema_editor):
+    Product = apps.get_model("merchant_marketplace", "Product")
+    Product.objects.exclude(
+        Q(is_active=True, is_deleted=False)
+        & (Q(ticket_expiry__isnull=True) | Q(ticket_expiry__gt=timezone.now()))
+    ).update(is_listed=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("merchant_account", "0004_alter_merchant_unifiednumber"),
+        ("merchant_marketplace", "0002_product_is_deleted"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="is_listed",
+            field=models.BooleanField(
+                default=True,
+                editable=False,
+                help_text="已上架、未刪除且票券未過期，儲存時自動計算",
+                verbose_name="前台可見",
+            ),
+        ),
+        migrations.RunPython(compute_is_listed, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_listed", True)),
+                fields=["merchant", "-created_at"],
+                name="products_listed_merchant_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_listed", True)),
+                fields=["-created_at"],
+                name="products_listed_created_idx",
+            ),
+        ),
+    ]
@@ -1,8 +1,26 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
 from merchant_account.models import Merchant
 from .validators import validate_image_file
 
 
+class ProductQuerySet(models.QuerySet):
+    def listed(self, now=None):
+        """
+        前台可見的商品（已上架、未刪除、票券未過期）
+
+        is_listed 由 Product.save 維護，由部分索引 products_listed_* 支援；
+        另外排除票券已過期但下架任務尚未執行的商品
+        """
+        return self.filter(is_listed=True).exclude(
+            ticket_expiry__lte=now or timezone.now()
+        )
+
+
 class Product(models.Model):
     VERIFICATION_TIMING_CHOICES = [
         ("before_payment", "付款前驗證"),
@@ -42,11 +60,66 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
     is_active = models.BooleanField(default=True, verbose_name="是否上架")
     is_deleted = models.BooleanField(default=False, verbose_name="是否已刪除")
+    is_listed = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name="前台可見",
+        help_text="已上架、未刪除且票券未過期，儲存時自動計算",
+    )
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = "商品"
         verbose_name_plural = "商品"
         ordering = ["-created_at"]
+        indexes = [
+            # 商店頁面：商家的前台商品
+            models.Index(
+                fields=["merchant", "-created_at"],
+                name="products_listed_merchant_idx",
+                condition=Q(is_listed=True),
+            ),
+            # 商品總覽：所有前台商品
+            models.Index(
+                fields=["-created_at"],
+                name="products_listed_created_idx",
+                condition=Q(is_listed=True),
+            ),
+        ]
 
     def __str__(self):
         return self.name
+
+    def compute_is_listed(self, now=None):
+        """依上架、刪除狀態與票券期限計算是否在前台顯示"""
+        return (
+            self.is_active
+            and not self.is_deleted
+            and (self.ticket_expiry is None or self.ticket_expiry > (now or timezone.now()))
+        )
+
+    def save(self, *args, **kwargs):
+        self.is_listed = self.compute_is_listed()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "is_listed" not in update_fields:
+            kwargs["update_fields"] = [*update_fields, "is_listed"]
+        super().save(*args, **kwargs)
+        transaction.on_commit(self.schedule_unlisting)
+
+    def schedule_unlisting(self):
+        """
+        票券即將到期時，以 ETA 任務在到期時間準時下架
+
+        只排程 PRODUCT_UNLIST_SCHEDULE_HORIZON 內到期的商品（broker 不適合保留太久的
+        ETA 訊息），較晚到期的由定期任務 auto_deactivate_expired_products 補排程
+        """
+        if not self.is_listed or self.ticket_expiry is None:
+            return
+        horizon = timedelta(seconds=settings.PRODUCT_UNLIST_SCHEDULE_HORIZON)
+        if self.ticket_expiry - timezone.now() > horizon:
+            return
+
+        from .tasks import schedule_product_unlisting
+
+        schedule_product_unlisting(self.pk, self.ticket_expiry)
@@ -1,3 +1,6 @@
+import posixpath
+from urllib.parse import quote
+
 from storages.backends.s3boto3 import S3Boto3Storage
 from django.conf import settings
 
@@ -13,3 +16,31 @@ class MediaStorage(S3Boto3Storage):
     }
     default_acl = None
     querystring_auth = False
+
+
+class ExportStorage(S3Boto3Storage):
+    """
+    報表匯出檔案（含客戶姓名與票券代碼）
+    不公開讀取，只能透過商家驗證後的下載頁取得有時效的簽章網址；
+    建議以 AWS_EXPORT_BUCKET_NAME 指定不公開的 bucket，並設定 exports/ 的生命週期規則
+    """
+
+    bucket_name = settings.AWS_EXPORT_BUCKET_NAME
+    region_name = settings.AWS_S3_REGION_NAME
+    location = "exports"
+    default_acl = None
+    file_overwrite = True
+    querystring_auth = True
+    querystring_expire = settings.REPORT_EXPORT_URL_EXPIRE
+    # 自訂網域的網址不會簽章，一律使用 S3 網址
+    custom_domain = None
+    object_parameters = {
+        "CacheControl": "private, no-store",
+    }
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
+        params["ContentDisposition"] = (
+            f"attachment; filename*=UTF-8''{quote(posixpath.basename(name))}"
+        )
+        return params
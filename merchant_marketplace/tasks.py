@@ -1,10 +1,93 @@
+import logging
+from datetime import datetime, timedelta
+
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from public_store.cache import bump_storefront_version
 from .models import Product
 
+logger = logging.getLogger(__name__)
+
+# 同一商品、同一到期時間只排程一次下架任務
+UNLIST_SCHEDULED_KEY = "product_unlist:v1:{}:{}"
+
+
+def schedule_product_unlisting(product_id, ticket_expiry):
+    """在票券到期時間排程 unlist_expired_product（重複呼叫只排程一次）"""
+    key = UNLIST_SCHEDULED_KEY.format(product_id, ticket_expiry.timestamp())
+    if not cache.add(key, True, settings.PRODUCT_UNLIST_SCHEDULE_HORIZON * 2):
+        return False
+
+    try:
+        unlist_expired_product.apply_async(
+            args=[product_id, ticket_expiry.isoformat()], eta=ticket_expiry
+        )
+    except Exception as e:
+        # 定期任務會再補排程，過期的商品也會由定期任務下架
+        cache.delete(key)
+        logger.error(f"商品 {product_id} 下架任務排程失敗: {e}")
+        return False
+    return True
+
+
+@shared_task(bind=True, name="merchant_marketplace.unlist_expired_product")
+def unlist_expired_product(self, product_id, ticket_expiry):
+    """
+    票券到期時下架商品
+
+    Args:
+        product_id (int): 商品 ID
+        ticket_expiry (str): 排程時的票券期限（ISO 格式），期限已被修改時不處理
+
+    Returns:
+        dict: 執行結果
+    """
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None or product.ticket_expiry is None:
+        return {"product_id": product_id, "unlisted": False}
+
+    if product.ticket_expiry != datetime.fromisoformat(ticket_expiry):
+        # 期限已變更，由重新儲存時排程的任務處理
+        return {"product_id": product_id, "unlisted": False}
+
+    if product.ticket_expiry > timezone.now():
+        # worker 提早取得任務（時鐘誤差），到期時再執行一次
+        raise self.retry(eta=product.ticket_expiry, max_retries=3)
+
+    if product.is_active:
+        product.is_active = False
+        product.save(update_fields=["is_active"])
+        logger.info(f"商品 {product_id} 票券已到期，已自動下架")
+    return {"product_id": product_id, "unlisted": True}
+
 
 @shared_task(name="merchant_marketplace.auto_deactivate_expired_products")
 def auto_deactivate_expired_products():
-    return Product.objects.filter(
-        ticket_expiry__lt=timezone.now(), is_active=True, is_deleted=False
-    ).update(is_active=False)
+    """
+    下架已過期的商品（下架任務遺失時的補償機制），
+    並為 PRODUCT_UNLIST_SCHEDULE_HORIZON 內到期的商品排程 ETA 下架任務
+
+    Returns:
+        dict: 下架數量與排程數量
+    """
+    now = timezone.now()
+    expired = Product.objects.filter(
+        ticket_expiry__lte=now, is_active=True, is_deleted=False
+    )
+    merchant_ids = set(expired.values_list("merchant_id", flat=True))
+    deactivated = expired.update(is_active=False, is_listed=False)
+    for merchant_id in merchant_ids:
+        bump_storefront_version(merchant_id)
+
+    horizon = now + timedelta(seconds=settings.PRODUCT_UNLIST_SCHEDULE_HORIZON)
+    scheduled = 0
+    for product_id, ticket_expiry in Product.objects.filter(
+        is_listed=True, ticket_expiry__gt=now, ticket_expiry__lte=horizon
+    ).values_list("pk", "ticket_expiry"):
+        scheduled += schedule_product_unlisting(product_id, ticket_expiry)
+
+    if deactivated:
+        logger.info(f"已下架 {deactivated} 個過期商品")
+    return {"deactivated": deactivated, "scheduled": scheduled}
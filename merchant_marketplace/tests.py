@@ -1,3 +1,109 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from merchant_account.models import Merchant
+from .models import Product
+from .tasks import auto_deactivate_expired_products, unlist_expired_product
+
+Member = get_user_model()
+
+
+class ProductListingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        merchant_member = Member.objects.create_user(
+            username='listing@example.com',
+            email='listing@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        self.merchant = Merchant.objects.create(
+            member=merchant_member,
+            ShopName='上架商店',
+            UnifiedNumber='22334455',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='listingshop'
+        )
+
+    def create_product(self, **kwargs):
+        return Product.objects.create(
+            name='上架票券',
+            description='測試',
+            price=100,
+            phone_number='0912345678',
+            merchant=self.merchant,
+            **kwargs
+        )
+
+    def test_is_listed_follows_status_and_expiry(self):
+        """測試儲存時依上下架、刪除與票券期限維護 is_listed"""
+        product = self.create_product()
+        self.assertTrue(product.is_listed)
+
+        product.is_active = False
+        product.save(update_fields=['is_active'])
+        product.refresh_from_db()
+        self.assertFalse(product.is_listed)
+
+        expired = self.create_product(ticket_expiry=timezone.now() - timedelta(minutes=1))
+        self.assertFalse(expired.is_listed)
+
+        self.assertQuerySetEqual(Product.objects.listed(), [])
+
+    def test_expiring_product_schedules_eta_task(self):
+        """測試即將到期的商品在到期時間排程下架任務，且只排程一次"""
+        expiry = timezone.now() + timedelta(minutes=5)
+        with patch.object(unlist_expired_product, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = self.create_product(ticket_expiry=expiry)
+            with self.captureOnCommitCallbacks(execute=True):
+                product.save()
+
+        apply_async.assert_called_once_with(
+            args=[product.pk, expiry.isoformat()], eta=expiry
+        )
+
+        # 較晚到期的商品由定期任務補排程
+        with patch.object(unlist_expired_product, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_product(ticket_expiry=timezone.now() + timedelta(days=30))
+        apply_async.assert_not_called()
+
+    def test_unlist_task_deactivates_expired_product(self):
+        """測試下架任務只處理期限未變更且已到期的商品"""
+        product = self.create_product(ticket_expiry=timezone.now() + timedelta(minutes=5))
+        expiry = timezone.now() - timedelta(seconds=1)
+        Product.objects.filter(pk=product.pk).update(ticket_expiry=expiry)
+
+        result = unlist_expired_product.apply(
+            args=[product.pk, (expiry - timedelta(hours=1)).isoformat()]
+        ).get()
+        self.assertFalse(result['unlisted'])
+
+        result = unlist_expired_product.apply(args=[product.pk, expiry.isoformat()]).get()
+        self.assertTrue(result['unlisted'])
+        product.refresh_from_db()
+        self.assertFalse(product.is_active)
+        self.assertFalse(product.is_listed)
+
+    def test_sweep_deactivates_missed_expired_products(self):
+        """測試定期任務下架遺漏的過期商品"""
+        product = self.create_product()
+        Product.objects.filter(pk=product.pk).update(
+            ticket_expiry=timezone.now() - timedelta(minutes=1)
+        )
+
+        with patch.object(unlist_expired_product, 'apply_async'):
+            result = auto_deactivate_expired_products()
 
-# Create your tests here.
+        self.assertEqual(result['deactivated'], 1)
+        product.refresh_from_db()
+        self.assertFalse(product.is_listed)
@@ -1,7 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.paginator import Paginator
-from django.utils import timezone
-from django.db.models import Q
 from django.http import JsonResponse
 from django.middleware.csrf import get_token
 from django.conf import settings
@@ -15,11 +13,7 @@ def home(req):
 def marketplace(req):
     # 取得所有已發布的商品，排除已刪除的商品和過期商品，按照建立時間排序
     product_list = (
-        Product.objects.filter(
-            Q(ticket_expiry__isnull=True) | Q(ticket_expiry__gt=timezone.now()),
-            is_active=True,
-            is_deleted=False,
-        )
+        Product.objects.listed()
         .select_related("merchant")
         .order_by("-created_at")
     )
@@ -0,0 +1,155 @@
+"""
+票券驗證稽核記錄
+驗證失敗與無權限的嘗試（validate_ticket、核銷失敗、批次驗證）不在請求中寫入
+TicketValidation，而是以 RPUSH 放入 Redis 清單（REDIS_URL），由 Celery Beat 每
+TICKET_AUDIT_FLUSH_INTERVAL 秒執行 payments.flush_ticket_validations，每
+TICKET_AUDIT_BATCH_SIZE 筆以 bulk_create 一次寫入，尖峰時段不與核銷的寫入搶主資料庫。
+核銷成功的記錄仍與核銷在同一個語句／交易中寫入（payments.redemption）。
+
+事件在記錄當下就保存在 Redis，web 程序重新啟動或異常終止不會遺失。寫入時先讀取
+清單前段，寫入資料庫後才從清單移除；中斷後重新寫入的事件以 event_id 略過。
+未設定 REDIS_URL 或 Redis 無法使用時直接寫入
+"""
+
+import json
+import logging
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from truepay.redis_client import get_redis_client, redis_key
+
+logger = logging.getLogger(__name__)
+
+# 寫入資料庫時的 Redis 鎖逾時（秒），持有鎖的程序中斷後由其他程序接手
+FLUSH_LOCK_TIMEOUT = 300
+
+QUEUE_KEY = redis_key("ticket_validations")
+
+
+def log_ticket_validation(
+    ticket_id,
+    merchant_id,
+    status,
+    failure_reason="",
+    validation_method="manual",
+    ip_address=None,
+):
+    """記錄一次票券驗證（放入 Redis 清單），由 flush_ticket_validations 定期寫入"""
+    log_ticket_validations(
+        [(ticket_id, merchant_id, status, failure_reason, validation_method, ip_address)]
+    )
+
+
+def log_ticket_validations(validations):
+    """
+    一次記錄多筆票券驗證（批次核銷），只需一次 Redis 或資料庫寫入
+
+    Args:
+        validations (list): (票券 ID, 商家 ID, 驗證狀態, 失敗原因, 驗證方式, IP) 的列表
+    """
+    if not validations:
+        return
+
+    now = timezone.now().isoformat()
+    events = [[uuid.uuid4().hex, *validation, now] for validation in validations]
+
+    client = get_redis_client()
+    if client is not None:
+        try:
+            client.rpush(QUEUE_KEY, *(json.dumps(event) for event in events))
+            return
+        except Exception as e:
+            # Redis 無法使用時直接寫入，避免稽核記錄遺失
+            logger.warning(f"票券驗證記錄無法寫入 Redis，改為直接寫入資料庫: {e}")
+
+    write_ticket_validations(events)
+
+
+def flush_ticket_validations():
+    """
+    將 Redis 清單中的驗證記錄寫入資料庫
+
+    Returns:
+        int: 寫入的事件數
+    """
+    client = get_redis_client()
+    if client is None:
+        return 0
+
+    lock = client.lock(
+        redis_key("ticket_validations", "flush_lock"),
+        timeout=FLUSH_LOCK_TIMEOUT,
+        blocking=False,
+    )
+    if not lock.acquire():
+        # 上一次寫入尚未完成，留到下一次
+        return 0
+
+    batch_size = settings.TICKET_AUDIT_BATCH_SIZE
+    flushed = 0
+    try:
+        while True:
+            events = [
+                json.loads(event)
+                for event in client.lrange(QUEUE_KEY, 0, batch_size - 1)
+            ]
+            if not events:
+                return flushed
+
+            write_ticket_validations(events)
+            client.ltrim(QUEUE_KEY, len(events), -1)
+            flushed += len(events)
+    finally:
+        lock.release()
+
+
+def write_ticket_validations(events):
+    """
+    以 bulk_create 寫入驗證記錄
+
+    Args:
+        events (list): [事件 ID, 票券 ID, 商家 ID, 驗證狀態, 失敗原因, 驗證方式, IP, 驗證時間 ISO 字串] 的列表
+
+    Returns:
+        int: 送出寫入的記錄筆數（已刪除的票券不計）
+    """
+    from .models import OrderItem, TicketValidation
+
+    # 記錄後才被刪除的票券無法寫入（外鍵），略過
+    ticket_ids = set(
+        OrderItem.objects.filter(
+            pk__in={event[1] for event in events}
+        ).values_list("pk", flat=True)
+    )
+    validations = [
+        TicketValidation(
+            event_id=uuid.UUID(event_id),
+            ticket_id=ticket_id,
+            merchant_id=merchant_id,
+            status=status,
+            failure_reason=failure_reason,
+            validation_method=validation_method,
+            ip_address=ip_address,
+            validation_time=datetime.fromisoformat(validation_time),
+        )
+        for (
+            event_id,
+            ticket_id,
+            merchant_id,
+            status,
+            failure_reason,
+            validation_method,
+            ip_address,
+            validation_time,
+        ) in events
+        if ticket_id in ticket_ids
+    ]
+    if len(validations) != len(events):
+        logger.warning(f"略過 {len(events) - len(validations)} 筆票券已刪除的驗證記錄")
+
+    # 中斷後重新寫入時，已寫入的事件以 event_id 唯一限制略過
+    TicketValidation.objects.bulk_create(validations, ignore_conflicts=True)
+    return len(validations)
@@ -0,0 +1,74 @@
+"""
+訂單 / 票券商家欄位回補管理命令
+部署新增 merchant 欄位的 migration 後執行，依主鍵分批將 product.merchant 寫入
+orders.merchant_id 與 order_items.merchant_id，避免單一長交易鎖住整張資料表
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from merchant_marketplace.models import Product
+from payments.models import MerchantDailyStats, Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = '回補訂單與票券的商家欄位（merchant_id）'
+
+    def add_arguments(self, parser):
+        """新增命令參數"""
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='每批更新的筆數（預設: 5000）',
+        )
+        parser.add_argument(
+            '--skip-stats',
+            action='store_true',
+            help='回補後不重新計算商家每日統計',
+        )
+
+    def handle(self, *args, **options):
+        """執行命令的主要邏輯"""
+        start_time = timezone.now()
+        batch_size = options['batch_size']
+
+        for model, label in ((Order, '訂單'), (OrderItem, '票券')):
+            updated_count = self._backfill(model, batch_size)
+            self.stdout.write(f'[完成] {label}: 回補 {updated_count} 筆')
+
+        if not options['skip_stats']:
+            # 回補前商家欄位為空的資料不會進入每日統計，回補後重新計算
+            rebuilt_count = MerchantDailyStats.rebuild_range(days=365)
+            self.stdout.write(f'[完成] 重新計算 {rebuilt_count} 組商家每日統計')
+
+        execution_time = (timezone.now() - start_time).total_seconds()
+        self.stdout.write(
+            self.style.SUCCESS(f'[完成] 商家欄位回補完成，耗時 {execution_time:.2f} 秒')
+        )
+
+    def _backfill(self, model, batch_size):
+        """依主鍵範圍分批以 UPDATE ... SET merchant_id = (子查詢) 回補"""
+        merchant_subquery = Subquery(
+            Product.objects.filter(pk=OuterRef('product_id')).values('merchant_id')[:1]
+        )
+        pending = model.objects.filter(merchant__isnull=True)
+        updated_count = 0
+        last_pk = 0
+
+        while True:
+            batch_pks = list(
+                pending.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch_pks:
+                break
+
+            updated_count += model.objects.filter(pk__in=batch_pks).update(
+                merchant_id=merchant_subquery
+            )
+            last_pk = batch_pks[-1]
+            self.stdout.write(f'  {model._meta.verbose_name}: 已處理至 ID {last_pk}')
+
+        return updated_count
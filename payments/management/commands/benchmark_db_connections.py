@@ -0,0 +1,106 @@
+"""
+資料庫連線模式效能測試管理命令
+模擬短請求（與 check_stock_api 相同的庫存查詢），比較每個請求重新連線、
+持久連線與連線池的 p50/p99 延遲。每種模式在獨立的子程序中以 DB_CONN_MODE 執行，
+確保使用的是該模式的完整設定
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from merchant_marketplace.models import Product
+
+
+class Command(BaseCommand):
+    help = '比較不同資料庫連線模式（DB_CONN_MODE）下短請求的 p50/p99 延遲'
+
+    def add_arguments(self, parser):
+        """新增命令參數"""
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='每種模式模擬的請求數（預設: 500）',
+        )
+        parser.add_argument(
+            '--modes',
+            type=str,
+            default='off,persistent,pool',
+            help='要比較的連線模式，以逗號分隔（預設: off,persistent,pool）',
+        )
+        parser.add_argument(
+            '--current',
+            action='store_true',
+            help='只以目前的 DB_CONN_MODE 執行並輸出 JSON（供子程序使用）',
+        )
+
+    def handle(self, *args, **options):
+        """執行命令的主要邏輯"""
+        if options['current']:
+            self.stdout.write(json.dumps(self._run_current(options['requests'])))
+            return
+
+        self.stdout.write(f'[開始] 每種模式模擬 {options["requests"]} 個請求')
+        self.stdout.write(f'{"模式":<12}{"p50 (ms)":>10}{"p99 (ms)":>10}{"平均 (ms)":>11}{"新建連線":>10}')
+
+        for mode in options['modes'].split(','):
+            mode = mode.strip()
+            result = subprocess.run(
+                [
+                    sys.executable, '-m', 'django', 'benchmark_db_connections',
+                    '--current', '--requests', str(options['requests']),
+                ],
+                env={**os.environ, 'DB_CONN_MODE': mode},
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode != 0:
+                error = result.stderr.strip().splitlines()[-1:] or ['未知錯誤']
+                self.stdout.write(self.style.ERROR(f'{mode:<12}執行失敗：{error[0]}'))
+                continue
+
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            self.stdout.write(
+                f'{mode:<12}{stats["p50"]:>10.2f}{stats["p99"]:>10.2f}'
+                f'{stats["mean"]:>11.2f}{stats["connections"]:>10}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('[完成] 連線模式效能比較結束'))
+
+    def _run_current(self, request_count):
+        """以目前的連線設定模擬請求，回傳延遲統計（毫秒）"""
+        product_id = Product.objects.values_list('pk', flat=True).first()
+        if product_id is None:
+            raise CommandError('請先建立至少一個商品')
+
+        created = []
+        connection_created.connect(lambda **kwargs: created.append(1), weak=False)
+        connections.close_all()
+
+        latencies = []
+        for _ in range(request_count):
+            start_time = time.perf_counter()
+            # request_started / request_finished 觸發 close_old_connections，
+            # 與實際請求相同地依 CONN_MAX_AGE 決定是否關閉連線
+            request_started.send(sender=self.__class__)
+            Product.objects.filter(
+                pk=product_id, is_active=True, is_deleted=False
+            ).values_list('stock', flat=True).first()
+            request_finished.send(sender=self.__class__)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+        percentiles = statistics.quantiles(latencies, n=100)
+        return {
+            'p50': percentiles[49],
+            'p99': percentiles[98],
+            'mean': statistics.fmean(latencies),
+            'connections': len(created),
+        }
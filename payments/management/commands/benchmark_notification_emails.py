@@ -0,0 +1,106 @@
+"""
+到期通知郵件產生效能測試管理命令
+以記憶體中的票券（不寫入資料庫、不實際寄信）量測模板渲染與 MIME 組裝速度，
+比較逐張通知與同商家摘要通知每秒可產生的郵件數
+"""
+
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from customers_account.models import Customer
+from merchant_account.models import Merchant
+from merchant_marketplace.models import Product
+from payments.models import Order, OrderItem
+from payments.notifications import (
+    build_batch_context,
+    build_expiry_digest,
+    get_email_templates,
+    group_tickets,
+)
+
+
+class Command(BaseCommand):
+    help = '量測到期通知郵件每秒可產生的數量（不寄信、不寫入資料庫）'
+
+    def add_arguments(self, parser):
+        """新增命令參數"""
+        parser.add_argument(
+            '--tickets',
+            type=int,
+            default=2000,
+            help='模擬的票券數量（預設: 2000）',
+        )
+        parser.add_argument(
+            '--group-size',
+            type=int,
+            default=20,
+            help='摘要通知中每位客戶在同一商家的票券數（預設: 20）',
+        )
+
+    def handle(self, *args, **options):
+        """執行命令的主要邏輯"""
+        ticket_count = options['tickets']
+        group_size = options['group_size']
+        now = timezone.now()
+
+        # 先載入模板，避免第一次編譯計入量測時間
+        get_email_templates()
+
+        self.stdout.write(f'[開始] 模擬 {ticket_count} 張即將到期的票券')
+
+        single_tickets = self._build_tickets(ticket_count, 1, now)
+        self._run('逐張通知', single_tickets, now)
+
+        digest_tickets = self._build_tickets(ticket_count, group_size, now)
+        self._run(f'摘要通知（每封 {group_size} 張）', digest_tickets, now)
+
+    def _build_tickets(self, ticket_count, group_size, now):
+        """建立記憶體中的票券，每 group_size 張屬於同一位客戶"""
+        Member = get_user_model()
+        merchant = Merchant(id=1, ShopName='效能測試商店')
+        product = Product(id=1, name='效能測試票券', price=100, merchant=merchant)
+        order = Order(id=1, unit_price=100, quantity=1)
+
+        tickets = []
+        customer = None
+        for i in range(ticket_count):
+            if i % group_size == 0:
+                customer_id = i // group_size + 1
+                customer = Customer(
+                    id=customer_id,
+                    name=f'客戶{customer_id}',
+                    member=Member(email=f'bench{customer_id}@example.com'),
+                )
+            tickets.append(
+                OrderItem(
+                    id=i + 1,
+                    ticket_code=f'BENCH{i:06d}',
+                    order=order,
+                    product=product,
+                    customer=customer,
+                    valid_until=now + timedelta(minutes=10),
+                )
+            )
+        return tickets
+
+    def _run(self, label, tickets, now):
+        start_time = time.perf_counter()
+
+        batch_context = build_batch_context(now)
+        emails_count = 0
+        for group in group_tickets(tickets):
+            # message() 組裝完整 MIME 內容，與實際寄信前的工作相同
+            build_expiry_digest(group, batch_context).message()
+            emails_count += 1
+
+        elapsed = time.perf_counter() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'[{label}] 郵件 {emails_count} 封，耗時 {elapsed:.2f} 秒，'
+                f'{emails_count / elapsed:.0f} 封/秒，'
+                f'{len(tickets) / elapsed:.0f} 張票券/秒'
+            )
+        )
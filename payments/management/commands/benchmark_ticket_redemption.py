@@ -0,0 +1,195 @@
+"""
+票券核銷並行效能測試管理命令
+模擬多台掃描器同時掃描同一批票券（每張票券都會被每台掃描器各掃一次），
+比較舊的「讀取 → 檢查 → save」流程與單一條件式 UPDATE（payments.redemption）的
+每秒掃描數與重複核銷數。
+
+測試資料（商品、已付款訂單與票券）建立在指定的商家下，結束後刪除。
+並行結果需以 PostgreSQL 測試，SQLite 會以資料庫鎖序列化所有寫入
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from customers_account.models import Customer
+from merchant_account.models import Merchant
+from merchant_marketplace.models import Product
+from payments.models import Order, OrderItem, TicketValidation
+from payments.redemption import redeem_ticket
+
+
+def legacy_redeem(ticket_code, merchant):
+    """原本的核銷流程：讀取票券與關聯資料，在程式中檢查後 save（沒有鎖）"""
+    ticket = OrderItem.objects.select_related("order", "product__merchant").get(
+        ticket_code=ticket_code
+    )
+    if ticket.product.merchant != merchant:
+        return False
+    is_valid, _ = ticket.is_valid()
+    if not is_valid:
+        return False
+    ticket.status = "used"
+    ticket.used_at = timezone.now()
+    ticket.save(update_fields=["status", "used_at"])
+    TicketValidation.objects.create(ticket=ticket, merchant=merchant, status="success")
+    return True
+
+
+def atomic_redeem(ticket_code, merchant):
+    return redeem_ticket(ticket_code, merchant).success
+
+
+MODES = {"legacy": legacy_redeem, "atomic": atomic_redeem}
+
+
+class Command(BaseCommand):
+    help = '比較多台掃描器並行核銷票券時的每秒掃描數與重複核銷數'
+
+    def add_arguments(self, parser):
+        """新增命令參數"""
+        parser.add_argument(
+            'subdomain',
+            type=str,
+            help='建立測試資料的商家子網域',
+        )
+        parser.add_argument(
+            '--tickets',
+            type=int,
+            default=200,
+            help='每種模式的票券數（預設: 200）',
+        )
+        parser.add_argument(
+            '--scanners',
+            type=int,
+            default=8,
+            help='同時掃描的掃描器（執行緒）數（預設: 8）',
+        )
+        parser.add_argument(
+            '--modes',
+            type=str,
+            default='legacy,atomic',
+            help='要比較的核銷方式，以逗號分隔（預設: legacy,atomic）',
+        )
+
+    def handle(self, *args, **options):
+        """執行命令的主要邏輯"""
+        try:
+            merchant = Merchant.objects.get(subdomain=options['subdomain'])
+        except Merchant.DoesNotExist:
+            raise CommandError(f'找不到商家: {options["subdomain"]}')
+
+        customer = Customer.objects.first()
+        if customer is None:
+            raise CommandError('請先建立至少一個客戶')
+
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING('[提示] 非 PostgreSQL 資料庫，並行結果僅供參考'))
+
+        self.stdout.write(
+            f'[開始] {options["tickets"]} 張票券 × {options["scanners"]} 台掃描器'
+        )
+        self.stdout.write(f'{"模式":<10}{"掃描/秒":>10}{"核銷成功":>10}{"重複核銷":>10}{"錯誤":>8}')
+
+        for mode in options['modes'].split(','):
+            mode = mode.strip()
+            if mode not in MODES:
+                raise CommandError(f'不支援的核銷方式: {mode}')
+
+            product, ticket_codes = self._create_tickets(merchant, customer, options['tickets'])
+            try:
+                stats = self._run(MODES[mode], merchant, ticket_codes, options['scanners'])
+            finally:
+                Order.objects.filter(product=product).delete()
+                product.delete()
+
+            style = self.style.SUCCESS if stats['double'] == 0 else self.style.ERROR
+            self.stdout.write(style(
+                f'{mode:<10}{stats["rate"]:>10.1f}{stats["redeemed"]:>10}'
+                f'{stats["double"]:>10}{stats["errors"]:>8}'
+            ))
+
+        self.stdout.write(self.style.SUCCESS('[完成] 票券核銷效能比較結束'))
+
+    def _create_tickets(self, merchant, customer, count):
+        """建立測試商品、已付款訂單與票券（直接建立，不觸發付款後的通知與 QR code 產生）"""
+        product = Product.objects.create(
+            name='核銷效能測試',
+            description='benchmark_ticket_redemption 建立，結束後刪除',
+            price=100,
+            stock=count,
+            phone_number='0900000000',
+            merchant=merchant,
+            is_active=False,
+        )
+        order = Order.objects.create(
+            provider='newebpay',
+            status='pending',
+            amount=count * 100,
+            item_description=product.name,
+            product=product,
+            customer=customer,
+            merchant=merchant,
+            quantity=count,
+            unit_price=100,
+        )
+        prefix = f'BENCH{order.pk}'
+        valid_until = timezone.now() + timezone.timedelta(days=1)
+        OrderItem.objects.bulk_create(
+            OrderItem(
+                order=order,
+                product=product,
+                customer=customer,
+                merchant=merchant,
+                ticket_code=f'{prefix}{i:06d}',
+                status='unused',
+                valid_until=valid_until,
+            )
+            for i in range(count)
+        )
+        Order.objects.filter(pk=order.pk).update(status='paid')
+        return product, [f'{prefix}{i:06d}' for i in range(count)]
+
+    def _run(self, redeem, merchant, ticket_codes, scanner_count):
+        """每台掃描器以不同順序掃描全部票券，回傳每秒掃描數與重複核銷數"""
+        successes = Counter()
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(scanner_count)
+
+        def scanner():
+            codes = random.sample(ticket_codes, len(ticket_codes))
+            try:
+                barrier.wait()
+                for code in codes:
+                    try:
+                        redeemed = redeem(code, merchant)
+                    except Exception:
+                        with lock:
+                            errors.append(code)
+                        continue
+                    if redeemed:
+                        with lock:
+                            successes[code] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=scanner) for _ in range(scanner_count)]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+
+        return {
+            'rate': len(ticket_codes) * scanner_count / elapsed,
+            'redeemed': len(successes),
+            'double': sum(successes.values()) - len(successes),
+            'errors': len(errors),
+        }
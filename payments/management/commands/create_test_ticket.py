@@ -36,6 +36,7 @@ class Command(BaseCommand):
             order=order,
             product=order.product,
             customer=order.customer,
+            merchant_id=order.product.merchant_id,
             ticket_code=test_code,
             status='unused',
             valid_until=timezone.now() + timezone.timedelta(minutes=minutes)
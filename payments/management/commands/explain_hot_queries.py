@@ -0,0 +1,145 @@
+"""
+熱門查詢執行計畫檢查管理命令
+對訂單 / 票券的主要存取路徑執行 EXPLAIN ANALYZE，
+用於確認資料庫是否使用 payments 的複合索引與部分索引
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from customers_account.models import Customer
+from merchant_account.models import Merchant
+from payments.models import Order, OrderItem, TicketValidation
+
+
+class Command(BaseCommand):
+    help = '對訂單 / 票券的熱門查詢執行 EXPLAIN ANALYZE，檢查索引使用情況'
+
+    def add_arguments(self, parser):
+        """新增命令參數"""
+        parser.add_argument(
+            '--merchant',
+            type=int,
+            default=None,
+            help='用於商家相關查詢的商家 ID（預設: 第一個商家）',
+        )
+        parser.add_argument(
+            '--customer',
+            type=int,
+            default=None,
+            help='用於消費者相關查詢的消費者 ID（預設: 第一個消費者）',
+        )
+        parser.add_argument(
+            '--no-analyze',
+            action='store_true',
+            help='只顯示執行計畫，不實際執行查詢',
+        )
+
+    def handle(self, *args, **options):
+        """執行命令的主要邏輯"""
+        merchant = self._get_object(Merchant, options['merchant'], '商家')
+        customer = self._get_object(Customer, options['customer'], '消費者')
+
+        # EXPLAIN ANALYZE 只有 PostgreSQL 支援，其他資料庫只顯示執行計畫
+        explain_options = {}
+        if connection.vendor == 'postgresql' and not options['no_analyze']:
+            explain_options = {'analyze': True, 'buffers': True}
+        elif connection.vendor != 'postgresql':
+            self.stdout.write(
+                self.style.WARNING(
+                    f'[提醒] 目前資料庫為 {connection.vendor}，只顯示執行計畫'
+                )
+            )
+
+        seq_scan_count = 0
+        for title, queryset in self._get_hot_queries(merchant, customer):
+            plan = queryset.explain(**explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n=== {title} ==='))
+            self.stdout.write(plan)
+
+            if 'Seq Scan on orders' in plan or 'Seq Scan on order_items' in plan:
+                seq_scan_count += 1
+                self.stdout.write(
+                    self.style.WARNING('[警告] 訂單 / 票券資料表使用循序掃描')
+                )
+
+        if seq_scan_count:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'\n[完成] {seq_scan_count} 個查詢仍使用循序掃描'
+                    '（資料量少時屬正常現象，可先執行 ANALYZE 更新統計資訊）'
+                )
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS('\n[完成] 所有查詢皆未使用循序掃描'))
+
+    def _get_object(self, model, pk, label):
+        queryset = model.objects.order_by('id')
+        obj = queryset.filter(pk=pk).first() if pk else queryset.first()
+        if obj is None:
+            raise CommandError(f'找不到{label}資料')
+        return obj
+
+    def _get_hot_queries(self, merchant, customer):
+        """回傳 (說明, queryset) 列表，對應各頁面與排程任務的查詢"""
+        now = timezone.now()
+        return [
+            (
+                '待付款訂單數量限制（付款流程）',
+                Order.objects.filter(
+                    customer=customer,
+                    status='pending',
+                    created_at__gte=now - timedelta(minutes=10),
+                ),
+            ),
+            (
+                '消費者購買記錄',
+                Order.objects.filter(customer=customer).order_by('-created_at')[:10],
+            ),
+            (
+                '票券錢包',
+                OrderItem.objects.filter(customer=customer).order_by('-created_at')[:10],
+            ),
+            (
+                '票券錢包過期票券標記',
+                OrderItem.objects.filter(
+                    customer=customer, status='unused', valid_until__lt=now
+                ),
+            ),
+            (
+                '商家交易記錄',
+                Order.objects.filter(merchant=merchant).order_by(
+                    '-created_at'
+                )[:20],
+            ),
+            (
+                '商家售出票券',
+                OrderItem.objects.filter(
+                    merchant=merchant, order__status='paid'
+                ).order_by('-created_at')[:20],
+            ),
+            (
+                '商家核銷記錄',
+                OrderItem.objects.filter(
+                    merchant=merchant, status='used'
+                ).order_by('-used_at')[:15],
+            ),
+            (
+                '商家驗證記錄',
+                TicketValidation.objects.filter(merchant=merchant).order_by(
+                    '-validation_time'
+                )[:20],
+            ),
+            (
+                '過期票券清理（cleanup_expired_tickets）',
+                OrderItem.objects.filter(
+                    status='unused', valid_until__lt=now, order__status='paid'
+                ),
+            ),
+            (
+                '到期通知票券（due_for_expiry_notice）',
+                OrderItem.objects.due_for_expiry_notice(now),
+            ),
+        ]
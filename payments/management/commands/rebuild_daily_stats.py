@@ -0,0 +1,43 @@
+"""
+商家每日統計重建管理命令
+用於首次部署時回補歷史資料，或手動校正彙總數據
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from payments.models import MerchantDailyStats
+
+
+class Command(BaseCommand):
+    help = '重新計算商家每日統計彙總（MerchantDailyStats）'
+
+    def add_arguments(self, parser):
+        """新增命令參數"""
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='重新計算最近幾天的資料（預設: 365 天）',
+        )
+        parser.add_argument(
+            '--merchant',
+            type=int,
+            default=None,
+            help='只重新計算指定商家 ID',
+        )
+
+    def handle(self, *args, **options):
+        """執行命令的主要邏輯"""
+        start_time = timezone.now()
+        self.stdout.write(f'[開始] 重新計算最近 {options["days"]} 天的商家每日統計')
+
+        rebuilt_count = MerchantDailyStats.rebuild_range(
+            days=options['days'], merchant_id=options['merchant']
+        )
+
+        execution_time = (timezone.now() - start_time).total_seconds()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'[完成] 共重新計算 {rebuilt_count} 組 (商家, 日期)，耗時 {execution_time:.2f} 秒'
+            )
+        )
@@ -77,34 +77,22 @@ class Command(BaseCommand):
 
     def simulate_notifications(self, minutes_before, verbose):
         """模擬執行通知發送"""
-        # 查找所有需要發送通知的票券
-        tickets_to_notify = OrderItem.objects.filter(
-            status='unused',
-            order__status='paid',
-            valid_until__isnull=False,
-            expiry_notification_sent__isnull=True,
-            customer__isnull=False,
-            customer__member__email__isnull=False,
-        ).select_related(
-            'customer', 
-            'customer__member', 
-            'product', 
-            'product__merchant',
-            'order'
-        )
+        # 查找目前落在通知時間窗口內的票券
+        tickets_to_notify = OrderItem.objects.due_for_expiry_notice(
+            minutes_before=minutes_before
+        ).select_related('customer__member')
         
         notifications_sent = 0
         total_checked = 0
         
         for ticket in tickets_to_notify:
             total_checked += 1
-            if ticket.should_send_expiry_notification(minutes_before):
-                notifications_sent += 1
-                if verbose:
-                    self.stdout.write(
-                        f'[模擬] 發送通知給: {ticket.customer.member.email} '
-                        f'(票券: {ticket.ticket_code})'
-                    )
+            notifications_sent += 1
+            if verbose:
+                self.stdout.write(
+                    f'[模擬] 發送通知給: {ticket.customer.member.email} '
+                    f'(票券: {ticket.ticket_code})'
+                )
         
         return {
             'total_checked': total_checked,
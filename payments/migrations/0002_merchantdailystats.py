@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant_account', '0004_alter_merchant_unifiednumber'),
+        ('merchant_marketplace', '0002_product_is_deleted'),
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MerchantDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='統計日期')),
+                ('provider', models.CharField(choices=[('newebpay', '藍新金流'), ('linepay', 'LINE Pay')], max_length=20, verbose_name='金流提供商')),
+                ('payment_type', models.CharField(blank=True, max_length=20, verbose_name='付款方式')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='訂單數')),
+                ('paid_order_count', models.PositiveIntegerField(default=0, verbose_name='已付款訂單數')),
+                ('revenue', models.PositiveBigIntegerField(default=0, verbose_name='營收')),
+                ('order_status_counts', models.JSONField(default=dict, verbose_name='各狀態訂單數')),
+                ('tickets_issued', models.PositiveIntegerField(default=0, verbose_name='發行票券數')),
+                ('tickets_used', models.PositiveIntegerField(default=0, verbose_name='已使用票券數')),
+                ('tickets_expired', models.PositiveIntegerField(default=0, verbose_name='已過期票券數')),
+                ('used_night', models.PositiveIntegerField(default=0, verbose_name='深夜核銷數 (0-6)')),
+                ('used_morning', models.PositiveIntegerField(default=0, verbose_name='早上核銷數 (6-12)')),
+                ('used_afternoon', models.PositiveIntegerField(default=0, verbose_name='下午核銷數 (12-18)')),
+                ('used_evening', models.PositiveIntegerField(default=0, verbose_name='晚上核銷數 (18-24)')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='merchant_account.merchant', verbose_name='商家')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='merchant_marketplace.product', verbose_name='商品')),
+            ],
+            options={
+                'verbose_name': '商家每日統計',
+                'verbose_name_plural': '商家每日統計',
+                'db_table': 'merchant_daily_stats',
+                'ordering': ['-date'],
+                'unique_together': {('merchant', 'date', 'product', 'provider', 'payment_type')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers_account', '0001_initial'),
+        ('merchant_account', '0004_alter_merchant_unifiednumber'),
+        ('merchant_marketplace', '0002_product_is_deleted'),
+        ('payments', '0002_merchantdailystats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'status', 'created_at'], name='orders_cust_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', '-created_at'], name='orders_cust_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['customer', '-created_at'], name='items_cust_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(condition=models.Q(('status', 'unused')), fields=['customer', 'valid_until'], name='items_cust_unused_valid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(condition=models.Q(('status', 'unused')), fields=['valid_until'], name='items_unused_valid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketvalidation',
+            index=models.Index(fields=['merchant', '-validation_time'], name='validations_merchant_time_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers_account', '0001_initial'),
+        ('merchant_account', '0004_alter_merchant_unifiednumber'),
+        ('merchant_marketplace', '0002_product_is_deleted'),
+        ('payments', '0003_add_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='merchant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='merchant_account.merchant', verbose_name='商家'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='merchant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='merchant_account.merchant', verbose_name='商家'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['merchant', 'status', 'created_at'], name='orders_merch_stat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['merchant', '-created_at'], name='orders_merch_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['merchant', 'status', 'created_at'], name='items_merch_stat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['merchant', '-created_at'], name='items_merch_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(condition=models.Q(('status', 'used')), fields=['merchant', '-used_at'], name='items_merch_used_idx'),
+        ),
+    ]
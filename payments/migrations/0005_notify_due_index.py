@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers_account', '0001_initial'),
+        ('merchant_account', '0004_alter_merchant_unifiednumber'),
+        ('merchant_marketplace', '0002_product_is_deleted'),
+        ('payments', '0004_order_merchant'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(condition=models.Q(('expiry_notification_sent__isnull', True), ('status__in', ['unused', 'expired'])), fields=['valid_until'], name='items_notify_due_idx'),
+        ),
+    ]
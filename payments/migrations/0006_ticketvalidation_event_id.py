@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_notify_due_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketvalidation',
+            name='event_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True, verbose_name='事件ID'),
+        ),
+        migrations.AlterField(
+            model_name='ticketvalidation',
+            name='validation_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='驗證時間'),
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
 from django.utils import timezone
 from django.conf import settings
+from django.core.cache import cache
 import random
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.db import transaction
@@ -9,9 +12,16 @@ import qrcode
 from io import BytesIO
 import base64
 import json
+import logging
+from datetime import datetime, time, timedelta
+from functools import reduce
+from operator import or_
 
 # Local imports
-from truepay.qr_utils import generate_qr_code_with_logo
+from truepay.qr_utils import generate_qr_code_png
+from .ticket_tokens import is_ticket_token, make_ticket_token, verify_ticket_token
+
+logger = logging.getLogger(__name__)
 
 
 def default_provider_raw_data():
@@ -56,6 +66,14 @@ class Order(models.Model):
     customer = models.ForeignKey(
         "customers_account.Customer", on_delete=models.CASCADE, verbose_name="客戶"
     )
+    # 反正規化自 product.merchant，商家查詢不需再 JOIN 商品表
+    merchant = models.ForeignKey(
+        "merchant_account.Merchant",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name="商家",
+    )
 
     # === 時間記錄 ===
     created_at = models.DateTimeField("建立時間", auto_now_add=True)
@@ -86,6 +104,25 @@ class Order(models.Model):
         ordering = ["-created_at"]
         verbose_name = "訂單"
         verbose_name_plural = "訂單"
+        indexes = [
+            # 待付款訂單限制、消費者 Dashboard 統計
+            models.Index(
+                fields=["customer", "status", "created_at"],
+                name="orders_cust_status_created_idx",
+            ),
+            # 消費者購買記錄
+            models.Index(
+                fields=["customer", "-created_at"], name="orders_cust_created_idx"
+            ),
+            # 商家交易記錄、報表、Dashboard 統計
+            models.Index(
+                fields=["merchant", "status", "created_at"],
+                name="orders_merch_stat_created_idx",
+            ),
+            models.Index(
+                fields=["merchant", "-created_at"], name="orders_merch_created_idx"
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -110,6 +147,10 @@ class Order(models.Model):
         if self.unit_price:
             self.amount = int(self.unit_price * self.quantity)
 
+        # 商家欄位跟隨商品
+        if self.merchant_id is None and self.product_id:
+            self.merchant_id = self.product.merchant_id
+
         super().save(*args, **kwargs)
 
     def is_paid(self):
@@ -165,6 +206,47 @@ class Order(models.Model):
         return getattr(self.customer, "phone", "")
 
 
+# 票券過期後仍會補發到期通知的時間（分鐘）
+NOTIFY_AFTER_EXPIRY_MINUTES = 30
+
+
+def get_notification_window(now, minutes_before):
+    """
+    到期通知時間窗口：到期前 (minutes_before + 1) 分鐘到過期後 30 分鐘
+
+    Returns:
+        tuple: (valid_until 下限, valid_until 上限)
+    """
+    return (
+        now - timedelta(minutes=NOTIFY_AFTER_EXPIRY_MINUTES),
+        now + timedelta(minutes=minutes_before + 1),
+    )
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def due_for_expiry_notice(self, now=None, minutes_before=30):
+        """
+        目前應發送到期通知的票券
+
+        時間窗口以 valid_until 範圍條件表示，
+        由部分索引 items_notify_due_idx 支援，每次只掃描窗口內尚未通知的票券
+        """
+        window_start, window_end = get_notification_window(
+            now or timezone.now(), minutes_before
+        )
+        return (
+            self.filter(
+                status__in=["unused", "expired"],
+                expiry_notification_sent__isnull=True,
+                valid_until__gte=window_start,
+                valid_until__lte=window_end,
+                order__status="paid",
+                customer__member__email__isnull=False,
+            )
+            .exclude(customer__member__email="")
+        )
+
+
 class OrderItem(models.Model):
     """票券模型 - 訂單付款成功後產生的獨立票券"""
 
@@ -201,12 +283,63 @@ class OrderItem(models.Model):
         null=True,
         verbose_name="客戶",
     )
+    # 反正規化自 product.merchant，商家查詢不需再 JOIN 商品表
+    merchant = models.ForeignKey(
+        "merchant_account.Merchant",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name="商家",
+    )
+
+    objects = OrderItemQuerySet.as_manager()
 
     class Meta:
         db_table = "order_items"
         ordering = ["-created_at"]
         verbose_name = "票券"
         verbose_name_plural = "票券"
+        indexes = [
+            # 票券錢包
+            models.Index(
+                fields=["customer", "-created_at"], name="items_cust_created_idx"
+            ),
+            # 票券錢包進入時將消費者過期票券標記為 expired
+            models.Index(
+                fields=["customer", "valid_until"],
+                name="items_cust_unused_valid_idx",
+                condition=Q(status="unused"),
+            ),
+            # cleanup_expired_tickets：只掃描未使用票券
+            models.Index(
+                fields=["valid_until"],
+                name="items_unused_valid_idx",
+                condition=Q(status="unused"),
+            ),
+            # 到期通知（due_for_expiry_notice）：只掃描尚未通知的票券
+            models.Index(
+                fields=["valid_until"],
+                name="items_notify_due_idx",
+                condition=Q(
+                    expiry_notification_sent__isnull=True,
+                    status__in=["unused", "expired"],
+                ),
+            ),
+            # 商家售出票券列表、統計
+            models.Index(
+                fields=["merchant", "status", "created_at"],
+                name="items_merch_stat_created_idx",
+            ),
+            models.Index(
+                fields=["merchant", "-created_at"], name="items_merch_created_idx"
+            ),
+            # 商家核銷記錄
+            models.Index(
+                fields=["merchant", "-used_at"],
+                name="items_merch_used_idx",
+                condition=Q(status="used"),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.ticket_code} - {self.get_status_display()}"
@@ -227,23 +360,17 @@ class OrderItem(models.Model):
 
         return True, "票券有效"
 
-    def use_ticket(self, merchant):
-        """使用票券（需驗證商家權限）"""
-        # 檢查是否為該商家的票券
-        if self.product.merchant != merchant:
-            return False, "您無權限驗證此票券"
-
-        # 檢查票券是否有效
-        is_valid, message = self.is_valid()
-        if not is_valid:
-            return False, message
+    def use_ticket(self, merchant, validation_method="manual", ip_address=None):
+        """使用票券（需驗證商家權限），檢查與核銷以單一條件式 UPDATE 完成，見 payments.redemption"""
+        from .redemption import redeem_ticket
 
-        # 使用票券
-        self.status = "used"
-        self.used_at = timezone.now()
-        self.save(update_fields=["status", "used_at"])
-
-        return True, "票券使用成功"
+        redemption = redeem_ticket(
+            self.ticket_code, merchant, validation_method, ip_address
+        )
+        if redemption.success:
+            self.status = "used"
+            self.used_at = redemption.used_at
+        return redemption.success, redemption.message
 
     def should_send_expiry_notification(self, minutes_before=30):
         """
@@ -255,13 +382,24 @@ class OrderItem(models.Model):
         Returns:
             bool: 是否應該發送通知
         """
-        # 檢查基本條件
+        # 先檢查票券本身的欄位，不符合時不需再讀取訂單與客戶資料
         if not self.valid_until:
             return False
 
         if self.status not in ["unused", "expired"]:
             return False
 
+        # 檢查是否已經發送過通知
+        if self.expiry_notification_sent:
+            return False
+
+        # 只在通知時間窗口內發送通知（與 due_for_expiry_notice 相同）
+        window_start, window_end = get_notification_window(
+            timezone.now(), minutes_before
+        )
+        if not window_start <= self.valid_until <= window_end:
+            return False
+
         if not self.order.is_paid():
             return False
 
@@ -272,27 +410,7 @@ class OrderItem(models.Model):
         ):
             return False
 
-        # 檢查是否已經發送過通知
-        if self.expiry_notification_sent:
-            return False
-
-        # 檢查是否在通知時間範圍內
-        now = timezone.now()
-        notification_time = self.valid_until - timezone.timedelta(
-            minutes=minutes_before
-        )
-
-        # 定義通知時間窗口：到期前6分鐘到過期後30分鐘
-        window_start = notification_time - timezone.timedelta(
-            minutes=1
-        )  # 到期前6分鐘開始
-        window_end = self.valid_until + timezone.timedelta(minutes=30)  # 過期後30分鐘內
-
-        # 只在合理的時間窗口內發送通知
-        if window_start <= now <= window_end:
-            return True
-
-        return False
+        return True
 
     def send_expiry_notification(self):
         """
@@ -301,156 +419,29 @@ class OrderItem(models.Model):
         Returns:
             bool: 發送是否成功
         """
-        from django.core.mail import send_mail
-        from django.conf import settings
-        from django.urls import reverse
+        from .notifications import send_notification_batch
 
         if not self.should_send_expiry_notification():
             return False
 
-        try:
-            customer_email = self.customer.member.email
-            customer_name = self.customer.name or "親愛的用戶"
-
-            # 根據票券是否已過期調整標題和內容
-            now = timezone.now()
-            if now > self.valid_until:
-                subject = "⏰ TruePay 通知 - 您的票券已過期"
-                timing_message = "您的票券已過期"
-                urgency_level = "提醒"
-            else:
-                subject = "🚨 TruePay 緊急提醒 - 您的票券即將到期！"
-                timing_message = "您的票券即將到期"
-                urgency_level = "緊急提醒"
-
-            # 生成消費者登入和票券錢包連結
-            base_url = (
-                f"https://{settings.NGROK_URL}"
-                if hasattr(settings, "NGROK_URL")
-                else "https://truepay.tw"
-            )
-            login_url = f"{base_url}/customers/login/"
-            wallet_url = f"{base_url}/customers/ticket-wallet/"
-
-            # 純文字版本
-            text_message = f"""{customer_name}，您好！
-
-{urgency_level}：{timing_message}！
-
-=== 票券資訊 ===
-🏪 商家名稱：{self.product.merchant.ShopName}
-🛍️ 商品名稱：{self.product.name}
-💰 票券價值：NT$ {self.order.unit_price}
-⏰ 到期時間：{timezone.localtime(self.valid_until).strftime("%Y年%m月%d日 %H:%M")}
-
-=== 查看票券詳情 ===
-請登入您的 TruePay 帳戶查看完整票券資訊：
-📱 票券錢包：{wallet_url}
-
-如果您尚未登入，請先登入：
-🔐 登入連結：{login_url}
-
-=== 商家聯絡資訊 ===
-🏪 {self.product.merchant.ShopName}
-📞 如需協助請直接聯繫商家
-
-=== 重要提醒 ===
-• 請在票券錢包中查看完整的票券資訊和 QR Code
-• 前往商家時請出示票券 QR Code 進行核銷
-• 如有疑問請直接聯繫商家或 TruePay 客服
-
-感謝您使用 TruePay！
-TruePay 客服團隊
-            """
-
-            # HTML 版本
-            html_message = f"""
-<div style='font-family: Arial, sans-serif; font-size: 16px; color: #222;'>
-<p>{customer_name}，您好！</p>
-<p><b>{urgency_level}：</b>{timing_message}！</p>
-<hr style='margin: 18px 0;'>
-<b>📋 票券資訊</b><br>
-🏪 商家名稱：{self.product.merchant.ShopName}<br>
-🛍️ 商品名稱：{self.product.name}<br>
-💰 票券價值：NT$ {self.order.unit_price}<br>
-⏰ 到期時間：{timezone.localtime(self.valid_until).strftime("%Y年%m月%d日 %H:%M")}<br>
-<hr style='margin: 18px 0;'>
-<b>🔗 查看票券詳情</b><br>
-請登入您的 TruePay 帳戶查看完整票券資訊：<br>
-📱 票券錢包：<a href='{wallet_url}' style='color: #0056B3;' target='_blank'>{wallet_url}</a><br>
-如果您尚未登入，請先登入：<br>
-🔐 登入連結：<a href='{login_url}' style='color: #0056B3;' target='_blank'>{login_url}</a><br>
-<hr style='margin: 18px 0;'>
-<b>📞 商家聯絡資訊</b><br>
-🏪 {self.product.merchant.ShopName}<br>
-📞 如需協助請直接聯繫商家<br>
-<hr style='margin: 18px 0;'>
-⚠️ <b>重要提醒：</b><br>
-• 請在票券錢包中查看完整的票券資訊和 QR Code<br>
-• 前往商家時請出示票券 QR Code 進行核銷<br>
-• 如有疑問請直接聯繫商家或 TruePay 客服<br>
-<br>
-感謝您使用 TruePay！<br>
-TruePay 客服團隊
-</div>
-            """
-            send_mail(
-                subject=subject,
-                message=text_message,  # 純文字版本
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[customer_email],
-                fail_silently=False,
-                html_message=html_message,  # HTML 版本
-            )
-
-            # 記錄通知發送時間
-            self.expiry_notification_sent = timezone.now()
-            self.save(update_fields=["expiry_notification_sent"])
-
-            return True
-
-        except Exception as e:
-            # 這裡可以記錄錯誤日誌
-            return False
+        notifications_sent, _, _ = send_notification_batch([self.pk])
+        self.refresh_from_db(fields=["expiry_notification_sent"])
+        return notifications_sent == 1
 
     @classmethod
-    def send_all_expiry_notifications(cls):
+    def send_all_expiry_notifications(cls, minutes_before=30):
         """
-        發送所有即將到期或已過期但尚未通知的票券通知
+        發送所有即將到期或已過期但尚未通知的票券通知（批次發送，見 payments.notifications）
+
+        Args:
+            minutes_before (int): 到期前幾分鐘開始通知
+
         Returns:
             dict: 執行結果統計
         """
-        tickets_to_notify = cls.objects.filter(
-            status__in=["unused", "expired"],
-            order__status="paid",
-            valid_until__isnull=False,
-            expiry_notification_sent__isnull=True,
-            customer__isnull=False,
-            customer__member__email__isnull=False,
-        ).select_related(
-            "customer", "customer__member", "product", "product__merchant", "order"
-        )
+        from .notifications import send_expiry_notifications
 
-        notifications_sent = 0
-        errors_count = 0
-        total_checked = 0
-        now = timezone.now()
-        for ticket in tickets_to_notify:
-            total_checked += 1
-            # 讓 send_expiry_notification 內部統一處理時間窗口判斷
-            if ticket.send_expiry_notification():
-                notifications_sent += 1
-            else:
-                errors_count += 1
-        result = {
-            "total_checked": total_checked,
-            "notifications_sent": notifications_sent,
-            "errors_count": errors_count,
-            "success_rate": (
-                (notifications_sent / total_checked * 100) if total_checked > 0 else 0
-            ),
-        }
-        return result
+        return send_expiry_notifications(minutes_before=minutes_before)
 
     @property
     def ticket_info(self):
@@ -468,32 +459,55 @@ TruePay 客服團隊
         }
 
     def generate_qr_code_data(self):
-        """生成QR code資料內容"""
-        qr_data = {
-            "ticket_code": self.ticket_code,
-            "type": "ticket_voucher",
-            "version": "1.0",
-            "product_id": self.product.id,
-            "merchant_id": self.product.merchant.id,
-        }
-        return json.dumps(qr_data)
+        """生成QR code資料內容（簽章 token，見 payments.ticket_tokens）"""
+        return make_ticket_token(self)
 
-    def generate_qr_code_image(self):
-        """生成帶有 TruePay logo 的票券 QR code"""
+    @property
+    def qr_code_cache_key(self):
+        # token 內含有效期限，期限變更時需重新產生
+        expiry = int(self.valid_until.timestamp()) if self.valid_until else 0
+        return f"ticket_qr:v2:{self.ticket_code}:{expiry}"
 
-        # 獲取QR code資料
-        qr_data = self.generate_qr_code_data()
+    def get_qr_code_png(self):
+        """
+        取得帶有 TruePay logo 的票券 QR code PNG
 
-        # 使用帶 logo 的 QR Code 生成器
-        return generate_qr_code_with_logo(
-            data=qr_data,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,  # 票券需要中等錯誤修正
-            logo_size_ratio=0.2,  # logo 稍微小一點，確保掃描穩定性
-        )
+        QR code 內容只由票券、商家與有效期限決定，不會變動，
+        因此依 ticket_code 與有效期限存入快取，只有第一次需要產生圖片
+        """
+        png = cache.get(self.qr_code_cache_key)
+        if png is None:
+            png = generate_qr_code_png(
+                data=self.generate_qr_code_data(),
+                error_correction=qrcode.constants.ERROR_CORRECT_M,  # 票券需要中等錯誤修正
+                logo_size_ratio=0.2,  # logo 稍微小一點，確保掃描穩定性
+            )
+            cache.set(self.qr_code_cache_key, png, settings.TICKET_QR_CACHE_TIMEOUT)
+        return png
+
+    def generate_qr_code_image(self):
+        """生成帶有 TruePay logo 的票券 QR code（base64）"""
+        return base64.b64encode(self.get_qr_code_png()).decode()
 
     @classmethod
-    def get_ticket_from_qr_data(cls, qr_data):
-        """從QR code資料中取得票券"""
+    def get_ticket_from_qr_data(cls, qr_data, merchant=None):
+        """
+        從QR code資料中取得票券
+
+        簽章 token 先在本機驗證簽章、商家與有效期限，無效時不查詢資料庫；
+        舊版 JSON 內容仍以票券代碼查詢
+        """
+        if is_ticket_token(qr_data):
+            token, error = verify_ticket_token(
+                qr_data, merchant_id=merchant.pk if merchant else None
+            )
+            if error:
+                return None, error
+            try:
+                return cls.objects.get(pk=token.ticket_id), None
+            except cls.DoesNotExist:
+                return None, "找不到對應的票券"
+
         try:
             data = json.loads(qr_data)
             if data.get("type") != "ticket_voucher":
@@ -528,8 +542,10 @@ class TicketValidation(models.Model):
         "merchant_account.Merchant", on_delete=models.CASCADE, verbose_name="驗證商家"
     )
 
-    # 驗證資訊
-    validation_time = models.DateTimeField("驗證時間", auto_now_add=True)
+    # 驗證資訊（驗證失敗記錄由 payments.audit 批次寫入，驗證時間為驗證當下而非寫入時間）
+    validation_time = models.DateTimeField(
+        "驗證時間", default=timezone.now, editable=False
+    )
     status = models.CharField(
         "驗證狀態", max_length=20, choices=VALIDATION_STATUS_CHOICES
     )
@@ -549,16 +565,308 @@ class TicketValidation(models.Model):
     # IP記錄
     ip_address = models.GenericIPAddressField("IP位址", null=True, blank=True)
 
+    # 批次寫入的事件 ID，任務重新執行時不會重複寫入
+    event_id = models.UUIDField(
+        "事件ID", null=True, blank=True, unique=True, editable=False
+    )
+
     class Meta:
         db_table = "ticket_validations"
         ordering = ["-validation_time"]
         verbose_name = "票券驗證記錄"
         verbose_name_plural = "票券驗證記錄"
+        indexes = [
+            models.Index(
+                fields=["merchant", "-validation_time"],
+                name="validations_merchant_time_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.ticket.ticket_code} - {self.merchant.ShopName} - {self.get_status_display()}"
 
 
+class MerchantDailyStats(models.Model):
+    """商家每日統計彙總 - 報表與圖表直接讀取，避免每次重新掃描訂單歷史
+
+    每列代表 (商家, 日期, 商品, 金流, 付款方式) 的彙總：
+    訂單相關欄位依訂單建立日期歸檔，票券相關欄位依票券建立日期歸檔
+    """
+
+    TIME_BUCKETS = [
+        ("used_night", 0, 6),
+        ("used_morning", 6, 12),
+        ("used_afternoon", 12, 18),
+        ("used_evening", 18, 24),
+    ]
+
+    # === 維度 ===
+    merchant = models.ForeignKey(
+        "merchant_account.Merchant",
+        on_delete=models.CASCADE,
+        related_name="daily_stats",
+        verbose_name="商家",
+    )
+    product = models.ForeignKey(
+        "merchant_marketplace.Product", on_delete=models.CASCADE, verbose_name="商品"
+    )
+    date = models.DateField("統計日期")
+    provider = models.CharField(
+        "金流提供商", max_length=20, choices=Order.PROVIDER_CHOICES
+    )
+    payment_type = models.CharField("付款方式", max_length=20, blank=True)
+
+    # === 訂單統計（依訂單建立日期） ===
+    order_count = models.PositiveIntegerField("訂單數", default=0)
+    paid_order_count = models.PositiveIntegerField("已付款訂單數", default=0)
+    revenue = models.PositiveBigIntegerField("營收", default=0)
+    order_status_counts = models.JSONField("各狀態訂單數", default=dict)
+
+    # === 票券統計（依票券建立日期） ===
+    tickets_issued = models.PositiveIntegerField("發行票券數", default=0)
+    tickets_used = models.PositiveIntegerField("已使用票券數", default=0)
+    tickets_expired = models.PositiveIntegerField("已過期票券數", default=0)
+    used_night = models.PositiveIntegerField("深夜核銷數 (0-6)", default=0)
+    used_morning = models.PositiveIntegerField("早上核銷數 (6-12)", default=0)
+    used_afternoon = models.PositiveIntegerField("下午核銷數 (12-18)", default=0)
+    used_evening = models.PositiveIntegerField("晚上核銷數 (18-24)", default=0)
+
+    updated_at = models.DateTimeField("更新時間", auto_now=True)
+
+    class Meta:
+        db_table = "merchant_daily_stats"
+        ordering = ["-date"]
+        verbose_name = "商家每日統計"
+        verbose_name_plural = "商家每日統計"
+        unique_together = ["merchant", "date", "product", "provider", "payment_type"]
+
+    def __str__(self):
+        return f"{self.merchant_id} - {self.date} - {self.product_id}"
+
+    @staticmethod
+    def get_payment_method_label(provider, payment_type):
+        """取得付款方式顯示名稱（與圖表標籤一致）"""
+        if provider == "newebpay":
+            return payment_type or "藍新金流"
+        elif provider == "linepay":
+            return "LINE Pay"
+        return dict(Order.PROVIDER_CHOICES).get(provider) or "其他"
+
+    @classmethod
+    def get_time_bucket(cls, hour):
+        """依小時取得核銷時段欄位名稱"""
+        for field, start, end in cls.TIME_BUCKETS:
+            if start <= hour < end:
+                return field
+
+    @classmethod
+    def rebuild(cls, merchant_id, day):
+        """
+        重新計算指定商家某一天的統計資料（冪等，可重複執行）
+
+        Args:
+            merchant_id (int): 商家 ID
+            day (date): 統計日期（當地時區）
+        """
+        if merchant_id is None:
+            # 尚未回補商家欄位的舊資料（見 backfill_order_merchant）
+            return
+
+        with transaction.atomic():
+            # 鎖定商家資料列，同一商家的重新計算依序執行，不會同時刪除與寫入同一天的統計
+            merchant_model = cls._meta.get_field("merchant").related_model
+            list(
+                merchant_model.objects.select_for_update()
+                .filter(pk=merchant_id)
+                .values_list("pk", flat=True)
+            )
+            rows = cls._collect_day(merchant_id, day)
+            cls.objects.filter(merchant_id=merchant_id, date=day).delete()
+            cls.objects.bulk_create(rows.values())
+
+    @classmethod
+    def _collect_day(cls, merchant_id, day):
+        """彙總商家某一天的訂單與票券，回傳以 (商品, 金流, 付款方式) 為鍵的統計列"""
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        end = start + timedelta(days=1)
+        rows = {}
+
+        def get_row(product_id, provider, payment_type):
+            key = (product_id, provider, payment_type or "")
+            if key not in rows:
+                rows[key] = cls(
+                    merchant_id=merchant_id,
+                    date=day,
+                    product_id=product_id,
+                    provider=provider,
+                    payment_type=payment_type or "",
+                    order_status_counts={},
+                )
+            return rows[key]
+
+        order_groups = (
+            Order.objects.filter(
+                merchant_id=merchant_id,
+                created_at__gte=start,
+                created_at__lt=end,
+            )
+            .values("product_id", "provider", "newebpay_payment_type", "status")
+            .annotate(count=Count("id"), amount=Sum("amount"))
+            .order_by()
+        )
+        for group in order_groups:
+            row = get_row(
+                group["product_id"], group["provider"], group["newebpay_payment_type"]
+            )
+            row.order_count += group["count"]
+            row.order_status_counts[group["status"]] = group["count"]
+            if group["status"] == "paid":
+                row.paid_order_count += group["count"]
+                row.revenue += group["amount"] or 0
+
+        bucket_counts = {
+            field: Count(
+                "id",
+                filter=Q(
+                    status="used", used_at__hour__gte=start_hour, used_at__hour__lt=end_hour
+                ),
+            )
+            for field, start_hour, end_hour in cls.TIME_BUCKETS
+        }
+        ticket_groups = (
+            OrderItem.objects.filter(
+                merchant_id=merchant_id,
+                created_at__gte=start,
+                created_at__lt=end,
+            )
+            .values("product_id", "order__provider", "order__newebpay_payment_type")
+            .annotate(
+                issued=Count("id"),
+                used=Count("id", filter=Q(status="used")),
+                expired=Count("id", filter=Q(status="expired")),
+                **bucket_counts,
+            )
+            .order_by()
+        )
+        for group in ticket_groups:
+            row = get_row(
+                group["product_id"],
+                group["order__provider"],
+                group["order__newebpay_payment_type"],
+            )
+            row.tickets_issued = group["issued"]
+            row.tickets_used = group["used"]
+            row.tickets_expired = group["expired"]
+            for field, _, _ in cls.TIME_BUCKETS:
+                setattr(row, field, group[field])
+        return rows
+
+    @classmethod
+    def rebuild_range(cls, days=2, merchant_id=None):
+        """
+        重新計算最近 N 天內有異動的商家統計，用於定期校正與歷史資料回補
+
+        Returns:
+            int: 重新計算的 (商家, 日期) 組數
+        """
+        since = timezone.make_aware(
+            datetime.combine(timezone.localdate() - timedelta(days=days - 1), time.min)
+        )
+        pairs = set()
+        for queryset in (
+            Order.objects.filter(created_at__gte=since),
+            OrderItem.objects.filter(created_at__gte=since),
+        ):
+            if merchant_id is not None:
+                queryset = queryset.filter(merchant_id=merchant_id)
+            pairs.update(
+                queryset.annotate(day=TruncDate("created_at"))
+                .values_list("merchant_id", "day")
+                .distinct()
+            )
+
+        # 清除已無資料來源的舊統計
+        stale = cls.objects.filter(date__gte=since.date())
+        if merchant_id is not None:
+            stale = stale.filter(merchant_id=merchant_id)
+        pairs.update(stale.values_list("merchant_id", "date").distinct())
+
+        for pair_merchant_id, day in pairs:
+            cls.rebuild(pair_merchant_id, day)
+        return len(pairs)
+
+    @classmethod
+    def record_ticket_used(cls, ticket):
+        """票券核銷時累加對應的統計（單一 UPDATE，不需重新計算整天）"""
+        cls.record_tickets_used([ticket])
+
+    @classmethod
+    def record_tickets_used(cls, tickets):
+        """
+        批次核銷時累加統計，不論涉及幾個統計列（商家、日期、商品、金流）
+        都以一個 UPDATE 完成，各列的增量以 CASE 指定
+        """
+        rows = {}
+        for ticket in tickets:
+            key = (
+                ticket.merchant_id or ticket.product.merchant_id,
+                timezone.localdate(ticket.created_at),
+                ticket.product_id,
+                ticket.order.provider,
+                ticket.order.newebpay_payment_type or "",
+            )
+            bucket = cls.get_time_bucket(timezone.localtime(ticket.used_at).hour)
+            counts = rows.setdefault(key, {})
+            counts[bucket] = counts.get(bucket, 0) + 1
+        if not rows:
+            return
+
+        conditions = {
+            key: Q(
+                merchant_id=key[0],
+                date=key[1],
+                product_id=key[2],
+                provider=key[3],
+                payment_type=key[4],
+            )
+            for key in rows
+        }
+
+        def increment(field, counts):
+            whens = [When(conditions[key], then=Value(count)) for key, count in counts]
+            return F(field) + Case(*whens, default=Value(0))
+
+        values = {
+            "tickets_used": increment(
+                "tickets_used",
+                [(key, sum(counts.values())) for key, counts in rows.items()],
+            )
+        }
+        for field, _, _ in cls.TIME_BUCKETS:
+            bucket_counts = [
+                (key, counts[field]) for key, counts in rows.items() if field in counts
+            ]
+            if bucket_counts:
+                values[field] = increment(field, bucket_counts)
+        cls.objects.filter(reduce(or_, conditions.values())).update(**values)
+
+        days = {(key[0], key[1]) for key in rows}
+        # 累加不鎖定商家，與 rebuild 交錯時可能遺失，統計列尚未建立時也不會累加；
+        # 提交後排程重新計算票券建立日的統計，最終以重新計算的結果為準
+        for merchant_id, day in days:
+            schedule_daily_stats_rebuild_on_commit(merchant_id, day)
+
+
+def schedule_ticket_qr_warmup(ticket_codes):
+    """背景預先產生新票券的 QR code 快取，失敗時不影響付款流程"""
+    from .tasks import warm_ticket_qr_codes
+
+    try:
+        warm_ticket_qr_codes.delay(ticket_codes)
+    except Exception as e:
+        logger.warning(f"票券 QR code 預先產生排程失敗: {e}")
+
+
 # 當訂單付款成功時，透過信號自動生成票券
 @receiver(post_save, sender=Order)
 def create_tickets(sender, instance, **kwargs):
@@ -596,6 +904,7 @@ def create_tickets(sender, instance, **kwargs):
                         order=order,
                         product=order.product,
                         customer=order.customer,
+                        merchant_id=order.merchant_id or order.product.merchant_id,
                         ticket_code=ticket_code,
                         status="unused",
                         valid_until=valid_until,
@@ -605,3 +914,56 @@ def create_tickets(sender, instance, **kwargs):
             # 使用 bulk_create 進行批量創建以提升性能
             if items_to_create:
                 OrderItem.objects.bulk_create(items_to_create)
+                ticket_codes = [item.ticket_code for item in items_to_create]
+                transaction.on_commit(lambda: schedule_ticket_qr_warmup(ticket_codes))
+
+
+# 同一 (商家, 日期) 已排程重新計算，尚未開始執行
+DAILY_STATS_REBUILD_KEY = "merchant_daily_stats:rebuild:v1:{}:{}"
+
+
+def schedule_daily_stats_rebuild(merchant_id, day):
+    """
+    排程背景重新計算商家某一天的統計
+
+    DAILY_STATS_REBUILD_DELAY 秒後執行，期間同一 (商家, 日期) 的其他異動不再重複排程；
+    排程失敗時由每小時的 refresh_merchant_daily_stats 校正，不影響付款流程
+    """
+    from .tasks import rebuild_merchant_daily_stats
+
+    key = DAILY_STATS_REBUILD_KEY.format(merchant_id, day.isoformat())
+    if not cache.add(key, True, settings.DAILY_STATS_REBUILD_DELAY * 6):
+        return
+
+    try:
+        rebuild_merchant_daily_stats.apply_async(
+            args=[merchant_id, day.isoformat()],
+            countdown=settings.DAILY_STATS_REBUILD_DELAY,
+        )
+    except Exception as e:
+        cache.delete(key)
+        logger.warning(f"商家每日統計重新計算排程失敗 (商家 {merchant_id}, {day}): {e}")
+
+
+def schedule_daily_stats_rebuild_on_commit(merchant_id, day):
+    """目前交易提交後才排程重新計算（不在交易中時立即排程）"""
+    transaction.on_commit(lambda: schedule_daily_stats_rebuild(merchant_id, day))
+
+
+@receiver(post_save, sender=Order)
+def update_merchant_daily_stats(sender, instance, raw=False, update_fields=None, **kwargs):
+    """訂單異動時，於交易提交後排程重新計算該商家當日統計（不在付款流程中計算）"""
+    if raw or (update_fields and set(update_fields) <= {"updated_at"}):
+        return
+
+    merchant_id = instance.merchant_id or instance.product.merchant_id
+    if merchant_id is None:
+        return
+
+    days = {timezone.localdate(instance.created_at)}
+    if instance.status == "paid":
+        # 票券於付款當下產生，依票券建立日期歸檔
+        days.add(timezone.localdate())
+
+    for day in days:
+        schedule_daily_stats_rebuild_on_commit(merchant_id, day)
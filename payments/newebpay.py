@@ -18,6 +18,7 @@ from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
 from accounts.models import Member
+from public_store.cache import bump_storefront_version
 from .models import Order
 
 logger = logging.getLogger(__name__)
@@ -366,6 +367,8 @@ def _deduct_product_stock(order):
                 logger.info(
                     f"訂單 {order.provider_order_id} 成功扣減 {order.quantity} 件庫存"
                 )
+                # 收款頁面顯示庫存
+                bump_storefront_version(product.merchant_id)
 
     except Exception as e:
         logger.error(f"扣減庫存時發生錯誤: {e}")
@@ -0,0 +1,267 @@
+"""
+票券到期通知發送流程
+1. 以 OrderItem.objects.due_for_expiry_notice 篩選落在通知時間窗口內的票券 ID
+2. 依 EXPIRY_NOTIFICATION_BATCH_SIZE 分批（同一客戶、同一商家的票券不拆開），
+   多批時以執行緒池並行處理
+3. 同一客戶在同一商家的票券合併成一封摘要通知，內容由預先編譯的模板產生
+4. 每批先在短交易中標記 expiry_notification_sent，交易外共用一條 SMTP 連線
+   (get_connection + send_messages) 寄信，失敗的票券以一次 UPDATE 清除標記
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections, transaction
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import OrderItem
+
+logger = logging.getLogger(__name__)
+
+TEXT_TEMPLATE = "payments/emails/expiry_notification.txt"
+HTML_TEMPLATE = "payments/emails/expiry_notification.html"
+
+
+@lru_cache(maxsize=None)
+def get_email_templates():
+    """取得編譯後的純文字與 HTML 通知模板（每個程序只載入、編譯一次）"""
+    return get_template(TEXT_TEMPLATE), get_template(HTML_TEMPLATE)
+
+
+def get_base_url():
+    """通知信中連結使用的網站網址"""
+    ngrok_url = getattr(settings, "NGROK_URL", None)
+    return f"https://{ngrok_url}" if ngrok_url else "https://truepay.tw"
+
+
+def build_batch_context(now):
+    """整批通知共用的模板變數（網址只計算一次）"""
+    base_url = get_base_url()
+    return {
+        "now": now,
+        "login_url": f"{base_url}/customers/login/",
+        "wallet_url": f"{base_url}/customers/ticket-wallet/",
+    }
+
+
+def group_tickets(tickets):
+    """
+    依 (客戶, 商家) 分組，保留原本順序
+
+    Returns:
+        list: 每組為同一客戶在同一商家的票券列表
+    """
+    groups = {}
+    for ticket in tickets:
+        groups.setdefault((ticket.customer_id, ticket.product.merchant_id), []).append(
+            ticket
+        )
+    return list(groups.values())
+
+
+def build_expiry_digest(tickets, batch_context):
+    """
+    建立到期通知郵件：同一客戶、同一商家的多張票券合併為一封
+
+    Args:
+        tickets (list): 同一客戶、同一商家的票券（需 select_related
+                        customer__member、product__merchant、order）
+        batch_context (dict): build_batch_context 的回傳值
+    """
+    now = batch_context["now"]
+    first_ticket = tickets[0]
+    ticket_count = len(tickets)
+    all_expired = all(now > ticket.valid_until for ticket in tickets)
+
+    # 根據票券是否皆已過期調整標題和內容
+    if all_expired:
+        timing = "已過期"
+        subject_prefix = "⏰ TruePay 通知"
+        urgency_level = "提醒"
+    else:
+        timing = "即將到期"
+        subject_prefix = "🚨 TruePay 緊急提醒"
+        urgency_level = "緊急提醒"
+
+    if ticket_count > 1:
+        timing_message = f"您有 {ticket_count} 張票券{timing}"
+    else:
+        timing_message = f"您的票券{timing}"
+    subject = f"{subject_prefix} - {timing_message}" + ("" if all_expired else "！")
+
+    context = {
+        **batch_context,
+        "customer_name": first_ticket.customer.name or "親愛的用戶",
+        "merchant_name": first_ticket.product.merchant.ShopName,
+        "urgency_level": urgency_level,
+        "timing_message": timing_message,
+        "ticket_count": ticket_count,
+        "tickets": [
+            {
+                "product_name": ticket.product.name,
+                "unit_price": ticket.order.unit_price,
+                "valid_until_display": timezone.localtime(ticket.valid_until).strftime(
+                    "%Y年%m月%d日 %H:%M"
+                ),
+                "timing_label": "已過期" if now > ticket.valid_until else "即將到期",
+            }
+            for ticket in tickets
+        ],
+    }
+
+    text_template, html_template = get_email_templates()
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=text_template.render(context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[first_ticket.customer.member.email],
+    )
+    message.attach_alternative(html_template.render(context), "text/html")
+    return message
+
+
+def send_notification_batch(ticket_ids, now=None):
+    """
+    發送一批票券的到期通知
+
+    先在短交易中以 select_for_update(skip_locked=True) 鎖定票券並寫入
+    expiry_notification_sent（同時執行的其他批次會跳過，避免重複通知），提交後才在
+    交易外寄信，寄信期間不持有列鎖，不會擋住入口核銷同一批票券的 UPDATE。
+    同一客戶、同一商家的票券合併為一封，整批共用一條 SMTP 連線，寄送失敗的票券
+    以一次 UPDATE 清除標記，下次排程重新通知。標記後、寄信前程序中斷時，
+    該批票券不會再通知
+
+    Returns:
+        tuple: (通知成功票券數, 通知失敗票券數, 寄出郵件數)
+    """
+    now = now or timezone.now()
+    batch_context = build_batch_context(now)
+
+    with transaction.atomic():
+        claimed_ids = list(
+            OrderItem.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=ticket_ids, expiry_notification_sent__isnull=True)
+            .values_list("pk", flat=True)
+        )
+        if claimed_ids:
+            OrderItem.objects.filter(pk__in=claimed_ids).update(
+                expiry_notification_sent=now
+            )
+    if not claimed_ids:
+        return 0, 0, 0
+
+    tickets = list(
+        OrderItem.objects.filter(pk__in=claimed_ids)
+        .select_related("customer__member", "product__merchant", "order")
+        .order_by("valid_until")
+    )
+
+    sent_count = 0
+    failed_ids = []
+    emails_sent = 0
+    mail_connection = get_connection()
+    try:
+        mail_connection.open()
+        for group in group_tickets(tickets):
+            try:
+                mail_connection.send_messages(
+                    [build_expiry_digest(group, batch_context)]
+                )
+                sent_count += len(group)
+                emails_sent += 1
+            except Exception as e:
+                failed_ids.extend(ticket.pk for ticket in group)
+                ticket_codes = ", ".join(ticket.ticket_code for ticket in group)
+                logger.error(f"票券 {ticket_codes} 到期通知發送失敗: {e}")
+    except Exception as e:
+        logger.error(f"SMTP 連線失敗，本批 {len(tickets)} 張票券未發送: {e}")
+        sent_count, failed_ids, emails_sent = 0, [ticket.pk for ticket in tickets], 0
+    finally:
+        mail_connection.close()
+
+    if failed_ids:
+        OrderItem.objects.filter(
+            pk__in=failed_ids, expiry_notification_sent=now
+        ).update(expiry_notification_sent=None)
+
+    return sent_count, len(failed_ids), emails_sent
+
+
+def _send_notification_batch_in_thread(ticket_ids, now):
+    """執行緒池中的批次，結束時關閉該執行緒自己的資料庫連線"""
+    try:
+        return send_notification_batch(ticket_ids, now)
+    finally:
+        connections.close_all()
+
+
+def split_into_batches(rows, batch_size):
+    """
+    將 (票券 ID, 客戶 ID, 商家 ID) 依序切成批次，同一客戶、同一商家的票券不拆開，
+    確保每位客戶在每個商家只收到一封摘要通知
+    """
+    batches = []
+    current = []
+    current_key = None
+    for ticket_id, customer_id, merchant_id in rows:
+        key = (customer_id, merchant_id)
+        if len(current) >= batch_size and key != current_key:
+            batches.append(current)
+            current = []
+        current.append(ticket_id)
+        current_key = key
+    if current:
+        batches.append(current)
+    return batches
+
+
+def send_expiry_notifications(minutes_before=30, now=None):
+    """
+    發送所有落在通知時間窗口內且尚未通知的票券通知
+
+    Args:
+        minutes_before (int): 到期前幾分鐘開始通知
+
+    Returns:
+        dict: total_checked / notifications_sent / errors_count / emails_sent /
+              success_rate
+    """
+    now = now or timezone.now()
+    rows = list(
+        OrderItem.objects.due_for_expiry_notice(now, minutes_before)
+        .order_by("customer_id", "product__merchant_id", "valid_until")
+        .values_list("pk", "customer_id", "product__merchant_id")
+    )
+
+    batches = split_into_batches(rows, settings.EXPIRY_NOTIFICATION_BATCH_SIZE)
+    workers = min(settings.EXPIRY_NOTIFICATION_WORKERS, len(batches))
+    if not connections["default"].features.has_select_for_update_skip_locked:
+        # 不支援列鎖的資料庫（如 SQLite）無法安全並行寫入，改為依序處理
+        workers = 1
+
+    if workers <= 1:
+        results = [send_notification_batch(batch, now) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    _send_notification_batch_in_thread, batches, [now] * len(batches)
+                )
+            )
+
+    total_checked = len(rows)
+    notifications_sent = sum(sent for sent, _, _ in results)
+    errors_count = sum(errors for _, errors, _ in results)
+    return {
+        "total_checked": total_checked,
+        "notifications_sent": notifications_sent,
+        "errors_count": errors_count,
+        "emails_sent": sum(emails for _, _, emails in results),
+        "success_rate": (
+            (notifications_sent / total_checked * 100) if total_checked > 0 else 0
+        ),
+    }
@@ -0,0 +1,375 @@
+"""
+票券核銷
+以單一條件式 UPDATE 同時完成「檢查」與「標記為已使用」：票券代碼相符、尚未使用、
+未過期、訂單已付款且屬於此商家時才會更新。多台掃描器同時掃描同一張票券時，
+只有一個 UPDATE 能成功，不會重複核銷。
+
+PostgreSQL 以一個含資料修改 CTE 的語句完成核銷、寫入 TicketValidation 與
+累加 MerchantDailyStats，成功核銷只需一次資料庫往返；其他資料庫（如測試用的
+SQLite）在同一交易中依序執行相同的條件式 UPDATE 與寫入。累加不鎖定商家，
+提交後另外排程重新計算票券建立日的統計（同一商家同一天合併為一次）校正。
+
+核銷失敗時才讀取票券判斷原因，驗證失敗記錄交由 payments.audit 批次寫入。
+票券代碼也可以是 QR code 的簽章 token（payments.ticket_tokens），簽章、商家與期限
+在本機驗證，無效時不查詢資料庫
+
+redeem_ticket_batch 一次處理多張票券（離線掃描器上傳、團體入場），以固定數量的
+查詢完成：鎖定並讀取全部票券、一個 bulk UPDATE、一個 MerchantDailyStats UPDATE、
+一個 TicketValidation bulk_create（驗證失敗記錄同樣交由 payments.audit）。
+只驗證（dry_run）時不鎖定票券
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from merchant_marketplace.models import Product
+from truepay.db_router import mark_primary_write
+from .audit import log_ticket_validation, log_ticket_validations
+from .models import (
+    MerchantDailyStats,
+    Order,
+    OrderItem,
+    TicketValidation,
+    schedule_daily_stats_rebuild_on_commit,
+)
+from .ticket_tokens import is_ticket_token, verify_ticket_token
+
+Redemption = namedtuple(
+    "Redemption", ["success", "message", "ticket_id", "used_at", "ticket_value"]
+)
+
+ScanResult = namedtuple(
+    "ScanResult", ["ticket", "status", "message", "ticket_id", "used_at"]
+)
+
+SUCCESS_MESSAGE = "票券使用成功"
+UNAUTHORIZED_MESSAGE = "您無權限驗證此票券"
+NOT_FOUND_MESSAGE = "找不到此票券代碼"
+
+REDEEM_SQL = """
+WITH redeemed AS (
+    UPDATE {items} AS item
+    SET status = 'used', used_at = %(now)s
+    FROM {orders} AS o
+    WHERE item.{lookup_column} = %(lookup)s
+      AND item.status = 'unused'
+      AND (item.valid_until IS NULL OR item.valid_until > %(now)s)
+      AND (
+          item.merchant_id = %(merchant_id)s
+          OR (
+              item.merchant_id IS NULL
+              AND item.product_id IN (
+                  SELECT id FROM {products} WHERE merchant_id = %(merchant_id)s
+              )
+          )
+      )
+      AND o.id = item.order_id
+      AND o.status = 'paid'
+    RETURNING item.id, item.product_id, item.created_at,
+              o.unit_price, o.provider, o.newebpay_payment_type
+),
+validation AS (
+    INSERT INTO {validations} (
+        ticket_id, merchant_id, validation_time, status,
+        failure_reason, validation_method, ip_address
+    )
+    SELECT id, %(merchant_id)s, %(now)s, 'success', '',
+           %(validation_method)s, %(ip_address)s::inet
+    FROM redeemed
+),
+stats AS (
+    UPDATE {stats} AS s
+    SET tickets_used = s.tickets_used + 1, {bucket} = s.{bucket} + 1
+    FROM redeemed AS r
+    WHERE s.merchant_id = %(merchant_id)s
+      AND s.date = (r.created_at AT TIME ZONE %(time_zone)s)::date
+      AND s.product_id = r.product_id
+      AND s.provider = r.provider
+      AND s.payment_type = r.newebpay_payment_type
+)
+SELECT id, unit_price, created_at FROM redeemed
+"""
+
+
+def _owned_by(merchant):
+    """票券屬於此商家（尚未回填 merchant 的舊票券以商品判斷）"""
+    return Q(merchant=merchant) | Q(
+        merchant__isnull=True,
+        product_id__in=Product.objects.filter(merchant=merchant).values("pk"),
+    )
+
+
+def _redeem_postgresql(lookup, merchant, now, validation_method, ip_address):
+    bucket = MerchantDailyStats.get_time_bucket(timezone.localtime(now).hour)
+    sql = REDEEM_SQL.format(
+        items=OrderItem._meta.db_table,
+        orders=Order._meta.db_table,
+        products=Product._meta.db_table,
+        validations=TicketValidation._meta.db_table,
+        stats=MerchantDailyStats._meta.db_table,
+        bucket=bucket,
+        lookup_column=lookup[0],
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql,
+            {
+                "now": now,
+                "lookup": lookup[1],
+                "merchant_id": merchant.pk,
+                "validation_method": validation_method,
+                "ip_address": ip_address,
+                "time_zone": settings.TIME_ZONE,
+            },
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+
+    # 原生 SQL 不經過 ReplicaRouter，自行記錄寫入，之後的報表頁讀得到這次核銷
+    mark_primary_write()
+
+    # 與 MerchantDailyStats.record_tickets_used 相同，提交後重新計算票券建立日的統計
+    ticket_id, ticket_value, created_at = row
+    schedule_daily_stats_rebuild_on_commit(merchant.pk, timezone.localdate(created_at))
+    return ticket_id, ticket_value
+
+
+def _redeem_portable(lookup, merchant, now, validation_method, ip_address):
+    lookup_filter = {lookup[0]: lookup[1]}
+    with transaction.atomic():
+        updated = (
+            OrderItem.objects.filter(
+                _owned_by(merchant),
+                Exists(Order.objects.filter(pk=OuterRef("order_id"), status="paid")),
+                status="unused",
+                **lookup_filter,
+            )
+            .exclude(valid_until__lte=now)
+            .update(status="used", used_at=now)
+        )
+        if not updated:
+            return None
+
+        ticket = OrderItem.objects.select_related("order").get(**lookup_filter)
+        TicketValidation.objects.create(
+            ticket=ticket,
+            merchant=merchant,
+            status="success",
+            validation_method=validation_method,
+            ip_address=ip_address,
+        )
+        MerchantDailyStats.record_ticket_used(ticket)
+        return ticket.pk, ticket.order.unit_price
+
+
+def _record_failure(lookup, merchant, validation_method, ip_address):
+    """核銷失敗時判斷原因並記錄驗證失敗"""
+    ticket = (
+        OrderItem.objects.select_related("order")
+        .filter(**{lookup[0]: lookup[1]})
+        .first()
+    )
+    if ticket is None:
+        return Redemption(False, NOT_FOUND_MESSAGE, None, None, None)
+
+    owner_id = ticket.merchant_id or ticket.product.merchant_id
+    if owner_id != merchant.pk:
+        status, message = "unauthorized", UNAUTHORIZED_MESSAGE
+    else:
+        is_valid, message = ticket.is_valid()
+        if is_valid:
+            # 判斷原因時已被其他掃描器核銷
+            message = "票券已使用"
+        status = "failed"
+
+    log_ticket_validation(
+        ticket.pk,
+        merchant.pk,
+        status,
+        failure_reason=message,
+        validation_method=validation_method,
+        ip_address=ip_address,
+    )
+    return Redemption(False, message, ticket.pk, None, None)
+
+
+def redeem_ticket(ticket_code, merchant, validation_method="manual", ip_address=None):
+    """
+    核銷票券
+
+    Args:
+        ticket_code (str): 票券代碼或 QR code 的簽章 token
+        merchant (Merchant): 核銷的商家
+        validation_method (str): qr_code 或 manual
+        ip_address (str): 掃描裝置的 IP
+
+    Returns:
+        Redemption: success / message / ticket_id / used_at / ticket_value
+    """
+    now = timezone.now()
+    lookup = ("ticket_code", ticket_code)
+    if is_ticket_token(ticket_code):
+        token, error = verify_ticket_token(ticket_code, merchant_id=merchant.pk, now=now)
+        if error:
+            return Redemption(False, error, None, None, None)
+        lookup = ("id", token.ticket_id)
+
+    if connection.vendor == "postgresql":
+        row = _redeem_postgresql(lookup, merchant, now, validation_method, ip_address)
+    else:
+        row = _redeem_portable(lookup, merchant, now, validation_method, ip_address)
+
+    if row is None:
+        return _record_failure(lookup, merchant, validation_method, ip_address)
+
+    ticket_id, ticket_value = row
+    return Redemption(True, SUCCESS_MESSAGE, ticket_id, now, ticket_value)
+
+
+def _parse_scan(text, merchant, scanned_at):
+    """解析票券代碼或簽章 token，回傳 (查詢欄位, 值) 或錯誤訊息"""
+    text = text.strip().upper()
+    if not is_ticket_token(text):
+        return ("ticket_code", text), None
+    token, error = verify_ticket_token(text, merchant_id=merchant.pk, now=scanned_at)
+    if error:
+        return None, error
+    return ("id", token.ticket_id), None
+
+
+def _check_scan(ticket, merchant, scanned_at, scanned_ids):
+    """判斷批次中的一次掃描，回傳 (valid / conflict / rejected, 訊息)"""
+    owner_id = ticket.merchant_id or ticket.product.merchant_id
+    if owner_id != merchant.pk:
+        return "rejected", UNAUTHORIZED_MESSAGE
+    if ticket.pk in scanned_ids:
+        return "conflict", "同一批次重複掃描"
+    if ticket.status == "used":
+        return "conflict", "票券已使用"
+    if not ticket.order.is_paid():
+        return "rejected", "票券尚未付款"
+    # 定期任務可能在離線掃描後才將票券標記為 expired，以掃描時間判斷是否過期
+    if ticket.status not in ("unused", "expired") or (
+        ticket.valid_until and ticket.valid_until <= scanned_at
+    ):
+        return "rejected", "票券已過期"
+    return "valid", "票券有效"
+
+
+def redeem_ticket_batch(
+    merchant, scans, validation_method="qr_code", ip_address=None, dry_run=False
+):
+    """
+    批次核銷票券（離線掃描器上傳、團體入場）
+
+    票券在同一交易中以 SELECT ... FOR UPDATE 鎖定後判斷，與 redeem_ticket 同時
+    核銷同一張票券時只有一邊會成功（dry_run 只讀取不鎖定）。有效期限以掃描時間
+    （不晚於現在）判斷，離線掃描後才上傳的票券不會因上傳時已過期而被拒絕。
+
+    Args:
+        merchant (Merchant): 核銷的商家
+        scans (list): (票券代碼或簽章 token, 掃描時間) 的清單，掃描時間為 None 表示現在
+        validation_method (str): qr_code 或 manual
+        ip_address (str): 上傳裝置的 IP
+        dry_run (bool): 只驗證不核銷，有效的票券結果為 valid，不寫入驗證成功記錄
+
+    Returns:
+        list: 與 scans 順序相同的 ScanResult，status 為
+              redeemed / valid / conflict（已被核銷）/ rejected（無效的票券）
+    """
+    now = timezone.now()
+    results = [None] * len(scans)
+    pending = []
+    for index, (text, scanned_at) in enumerate(scans):
+        scanned_at = min(scanned_at or now, now)
+        lookup, error = _parse_scan(text, merchant, scanned_at)
+        if error:
+            results[index] = ScanResult(text, "rejected", error, None, None)
+        else:
+            pending.append((scanned_at, index, text, lookup))
+
+    if not pending:
+        return results
+
+    codes = [lookup[1] for _, _, _, lookup in pending if lookup[0] == "ticket_code"]
+    ids = [lookup[1] for _, _, _, lookup in pending if lookup[0] == "id"]
+
+    with transaction.atomic():
+        tickets = OrderItem.objects.select_related("order", "product")
+        if not dry_run:
+            # 只驗證時不鎖定，不擋住入口同時核銷同一批票券
+            tickets = tickets.select_for_update(of=("self",))
+        tickets = list(
+            tickets.filter(Q(ticket_code__in=codes) | Q(pk__in=ids)).order_by("pk")
+        )
+        by_lookup = {}
+        for ticket in tickets:
+            by_lookup[("ticket_code", ticket.ticket_code)] = ticket
+            by_lookup[("id", ticket.pk)] = ticket
+
+        redeemed = []
+        validations = []
+        failures = []
+        scanned_ids = set()
+        # 同一張票券在批次中掃描多次時，以最早的掃描為準
+        for scanned_at, index, text, lookup in sorted(pending, key=lambda p: p[:2]):
+            ticket = by_lookup.get(lookup)
+            if ticket is None:
+                results[index] = ScanResult(text, "rejected", NOT_FOUND_MESSAGE, None, None)
+                continue
+
+            status, message = _check_scan(ticket, merchant, scanned_at, scanned_ids)
+            if status == "valid":
+                scanned_ids.add(ticket.pk)
+                if not dry_run:
+                    ticket.status = "used"
+                    # used_at 記錄伺服器核銷時間，掃描器的差異同步（payments.scanner）才不會遺漏
+                    ticket.used_at = now
+                    redeemed.append(ticket)
+                    status, message = "redeemed", SUCCESS_MESSAGE
+
+            if message == UNAUTHORIZED_MESSAGE:
+                # 不回傳其他商家票券的資訊
+                results[index] = ScanResult(text, status, message, None, None)
+            else:
+                used_at = ticket.used_at if status in ("redeemed", "conflict") else None
+                results[index] = ScanResult(text, status, message, ticket.pk, used_at)
+
+            if status == "redeemed":
+                validations.append(
+                    TicketValidation(
+                        ticket=ticket,
+                        merchant=merchant,
+                        status="success",
+                        validation_method=validation_method,
+                        ip_address=ip_address,
+                    )
+                )
+            elif status != "valid":
+                failures.append(
+                    (
+                        ticket.pk,
+                        "unauthorized" if message == UNAUTHORIZED_MESSAGE else "failed",
+                        message,
+                    )
+                )
+
+        if redeemed:
+            OrderItem.objects.bulk_update(redeemed, ["status", "used_at"])
+            MerchantDailyStats.record_tickets_used(redeemed)
+        if validations:
+            TicketValidation.objects.bulk_create(validations)
+
+    log_ticket_validations(
+        [
+            (ticket_id, merchant.pk, validation_status, message, validation_method, ip_address)
+            for ticket_id, validation_status, message in failures
+        ]
+    )
+    return results
+
@@ -0,0 +1,108 @@
+"""
+離線掃描器票券清單
+掃描器先下載商家所有可核銷票券的精簡清單（manifest），之後只以上次回傳的
+同步時間（since）下載差異：新增的可核銷票券與已不可核銷（已使用、訂單不再是
+已付款）的票券 ID。網路中斷時掃描器以清單與商家的 token 金鑰在本機判斷，
+恢復連線後以 redeem_ticket_batch 批次上傳核銷。
+
+差異以 created_at、used_at 與訂單 updated_at 判斷，都是伺服器寫入的時間；
+回傳的同步時間往前保留 SCANNER_SYNC_OVERLAP_SECONDS，避免遺漏同步當下
+尚未提交的交易，掃描器重複收到的票券以 ID 去重即可。
+
+清單依票券 ID 分頁，每頁最多 SCANNER_MANIFEST_PAGE_SIZE 張，以回傳的 next_cursor
+（truepay.pagination 的游標）下載下一頁，大型商家也不會一次回傳數 MB 的 JSON；
+游標帶有第一頁的同步時間，各頁回傳相同的 since
+"""
+
+import base64
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from truepay.pagination import decode_cursor, encode_cursor
+from .models import OrderItem
+from .redemption import _owned_by
+from .ticket_tokens import get_merchant_token_key
+
+
+def _expiry_minutes(valid_until):
+    """有效期限（Unix 分鐘，與 QR code token 相同，0 表示無期限）"""
+    return math.ceil(valid_until.timestamp() / 60) if valid_until else 0
+
+
+def build_scanner_manifest(merchant, since=None, now=None, cursor=None):
+    """
+    產生掃描器票券清單（一頁）
+
+    Args:
+        merchant (Merchant): 商家
+        since (datetime): 上次同步回傳的時間，None 表示下載完整清單
+        now (datetime): 目前時間
+        cursor (str): 上一頁回傳的 next_cursor，None 表示第一頁
+
+    Returns:
+        dict: tickets 為 [票券 ID, 票券代碼, 有效期限（Unix 分鐘）] 的清單，
+              removed 為已不可核銷的票券 ID（只在第一頁回傳），since 為下次同步
+              使用的時間，next_cursor 為下一頁的游標（最後一頁為 None）
+
+    Raises:
+        ValueError: cursor 格式錯誤
+    """
+    now = now or timezone.now()
+    next_since = now - timedelta(seconds=settings.SCANNER_SYNC_OVERLAP_SECONDS)
+    after = None
+    if cursor is not None:
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            raise ValueError("cursor 格式錯誤")
+        next_since, after, _ = decoded
+
+    owned = OrderItem.objects.filter(_owned_by(merchant))
+
+    valid = owned.filter(status="unused", order__status="paid").exclude(
+        valid_until__lte=now
+    )
+    removed = []
+    if since is not None:
+        # 訂單在付款後才更新為已付款的票券也要加入
+        valid = valid.filter(Q(created_at__gte=since) | Q(order__updated_at__gte=since))
+        if after is None:
+            removed = list(
+                owned.filter(status="used", used_at__gte=since).values_list(
+                    "pk", flat=True
+                )
+            )
+            removed += owned.filter(order__updated_at__gte=since).exclude(
+                order__status="paid"
+            ).values_list("pk", flat=True)
+    if after is not None:
+        valid = valid.filter(pk__gt=after)
+
+    page_size = settings.SCANNER_MANIFEST_PAGE_SIZE
+    rows = list(
+        valid.order_by("pk").values_list("pk", "ticket_code", "valid_until")[
+            : page_size + 1
+        ]
+    )
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(next_since, rows[-1][0], "next")
+
+    tickets = [
+        [ticket_id, ticket_code, _expiry_minutes(valid_until)]
+        for ticket_id, ticket_code, valid_until in rows
+    ]
+
+    return {
+        "merchant_id": merchant.pk,
+        "token_key": base64.b64encode(get_merchant_token_key(merchant.pk)).decode(),
+        "full": since is None,
+        "since": next_since.isoformat(),
+        "tickets": tickets,
+        "removed": removed,
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,41 @@
+"""
+訂單 / 票券 JSON 序列化
+供分頁列表的 JSON 回應使用，呼叫端需先 select_related 相關欄位以避免 N+1 查詢
+"""
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def serialize_order(order):
+    """訂單摘要（需 select_related product）"""
+    return {
+        "id": order.id,
+        "order_number": order.provider_order_id,
+        "status": order.status,
+        "status_display": order.get_status_display(),
+        "provider": order.provider,
+        "product_name": order.product.name,
+        "quantity": order.quantity,
+        "unit_price": order.unit_price,
+        "amount": order.amount,
+        "created_at": _isoformat(order.created_at),
+        "paid_at": _isoformat(order.paid_at),
+    }
+
+
+def serialize_ticket(ticket):
+    """票券摘要（需 select_related order、product、customer）"""
+    return {
+        "id": ticket.id,
+        "ticket_code": ticket.ticket_code,
+        "status": ticket.status,
+        "status_display": ticket.get_status_display(),
+        "order_number": ticket.order.provider_order_id,
+        "product_name": ticket.product.name,
+        "customer_name": ticket.customer.name if ticket.customer else None,
+        "created_at": _isoformat(ticket.created_at),
+        "valid_until": _isoformat(ticket.valid_until),
+        "used_at": _isoformat(ticket.used_at),
+    }
@@ -4,9 +4,13 @@ TruePay Payments Celery Tasks
 """
 
 import logging
+from datetime import date
 from celery import shared_task
+from django.core.cache import cache
+from django.db.models.functions import TruncDate
 from django.utils import timezone
-from .models import OrderItem
+from truepay.db_router import using_replica
+from .models import DAILY_STATS_REBUILD_KEY, MerchantDailyStats, OrderItem
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +39,7 @@ def check_ticket_expiry(self):
             f"票券到期檢查任務完成 - "
             f"檢查數量: {result['total_checked']}, "
             f"通知發送: {result['notifications_sent']}, "
+            f"郵件數量: {result['emails_sent']}, "
             f"錯誤數量: {result['errors_count']}, "
             f"成功率: {result['success_rate']:.2f}%, "
             f"執行時間: {execution_time:.2f}秒"
@@ -81,9 +86,19 @@ def cleanup_expired_tickets(self):
         # 統計數量
         total_expired = expired_tickets.count()
         
+        # 記錄受影響的商家統計日期，更新後重新計算每日統計
+        affected_days = set(
+            expired_tickets.annotate(day=TruncDate('created_at'))
+            .values_list('merchant_id', 'day')
+            .distinct()
+        )
+        
         # 批量更新狀態為 'expired'
         updated_count = expired_tickets.update(status='expired')
         
+        for merchant_id, day in affected_days:
+            MerchantDailyStats.rebuild(merchant_id, day)
+        
         end_time = timezone.now()
         execution_time = (end_time - start_time).total_seconds()
         
@@ -108,6 +123,7 @@ def cleanup_expired_tickets(self):
 
 
 @shared_task(name='payments.send_daily_ticket_report')
+@using_replica
 def send_daily_ticket_report():
     """
     發送每日票券統計報表
@@ -158,4 +174,124 @@ def send_daily_ticket_report():
         
     except Exception as e:
         logger.error(f"每日票券統計報表生成失敗: {str(e)}")
-        return {'error': str(e)}
\ No newline at end of file
+        return {'error': str(e)}
+
+
+@shared_task(bind=True, name='payments.refresh_merchant_daily_stats')
+def refresh_merchant_daily_stats(self, days=2):
+    """
+    重新計算商家每日統計
+    每小時執行一次，校正最近幾天的彙總資料（即時更新失敗時的補償機制）
+    
+    Args:
+        days (int): 重新計算最近幾天的資料
+    
+    Returns:
+        dict: 執行結果統計
+    """
+    try:
+        logger.info("開始重新計算商家每日統計")
+        start_time = timezone.now()
+        
+        rebuilt_count = MerchantDailyStats.rebuild_range(days=days)
+        
+        end_time = timezone.now()
+        execution_time = (end_time - start_time).total_seconds()
+        
+        logger.info(
+            f"商家每日統計重新計算完成 - "
+            f"更新組數: {rebuilt_count}, "
+            f"執行時間: {execution_time:.2f}秒"
+        )
+        
+        return {
+            'task_name': 'refresh_merchant_daily_stats',
+            'execution_time': execution_time,
+            'timestamp': end_time.isoformat(),
+            'rebuilt_count': rebuilt_count
+        }
+        
+    except Exception as e:
+        logger.error(f"商家每日統計重新計算失敗: {str(e)}")
+        raise self.retry(exc=e, countdown=300, max_retries=3)
+
+
+@shared_task(bind=True, name='payments.rebuild_merchant_daily_stats')
+def rebuild_merchant_daily_stats(self, merchant_id, day):
+    """
+    重新計算商家某一天的統計（訂單異動後由 schedule_daily_stats_rebuild 排程）
+
+    Args:
+        merchant_id (int): 商家 ID
+        day (str): 統計日期（ISO 格式）
+
+    Returns:
+        dict: 執行結果
+    """
+    # 開始前清除排程標記，計算期間的新異動會再排程一次
+    cache.delete(DAILY_STATS_REBUILD_KEY.format(merchant_id, day))
+    try:
+        MerchantDailyStats.rebuild(merchant_id, date.fromisoformat(day))
+        return {
+            'task_name': 'rebuild_merchant_daily_stats',
+            'merchant_id': merchant_id,
+            'date': day,
+        }
+
+    except Exception as e:
+        logger.error(f"商家每日統計重新計算失敗 (商家 {merchant_id}, {day}): {str(e)}")
+        raise self.retry(exc=e, countdown=60, max_retries=3)
+
+
+@shared_task(bind=True, name='payments.warm_ticket_qr_codes')
+def warm_ticket_qr_codes(self, ticket_codes):
+    """
+    預先產生票券 QR code 並寫入快取
+    票券建立後觸發，讓消費者第一次開啟票券錢包時不需等待圖片產生
+    
+    Args:
+        ticket_codes (list): 票券代碼列表
+    
+    Returns:
+        dict: 執行結果統計
+    """
+    try:
+        tickets = OrderItem.objects.filter(ticket_code__in=ticket_codes).select_related(
+            'product'
+        )
+        warmed_count = 0
+        for ticket in tickets:
+            ticket.get_qr_code_png()
+            warmed_count += 1
+        
+        return {
+            'task_name': 'warm_ticket_qr_codes',
+            'warmed_count': warmed_count
+        }
+        
+    except Exception as e:
+        logger.error(f"票券 QR code 預先產生失敗: {str(e)}")
+        raise self.retry(exc=e, countdown=60, max_retries=3)
+
+
+@shared_task(bind=True, name='payments.flush_ticket_validations')
+def flush_ticket_validations(self):
+    """
+    將 Redis 中的票券驗證記錄批次寫入資料庫（payments.audit，由 Celery Beat 定期執行）
+
+    Returns:
+        dict: 執行結果統計
+    """
+    from . import audit
+
+    try:
+        flushed = audit.flush_ticket_validations()
+        logger.info(f"票券驗證記錄寫入完成 - 事件數: {flushed}")
+        return {
+            'task_name': 'flush_ticket_validations',
+            'events': flushed,
+        }
+
+    except Exception as e:
+        logger.error(f"票券驗證記錄寫入失敗: {str(e)}")
+        raise self.retry(exc=e, countdown=30, max_retries=5)
@@ -1,3 +1,490 @@
-from django.test import TestCase
+import os
+import unittest
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from customers_account.models import Customer
+from merchant_account.models import Merchant
+from merchant_marketplace.models import Product
+from .models import Order, OrderItem
+
+Member = get_user_model()
+
+
+class ExpiryNotificationTestCase(TestCase):
+    def setUp(self):
+        merchant_member = Member.objects.create_user(
+            username='notify-shop@example.com',
+            email='notify-shop@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        self.merchant = Merchant.objects.create(
+            member=merchant_member,
+            ShopName='通知商店',
+            UnifiedNumber='55667788',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='notifyshop'
+        )
+        customer_member = Member.objects.create_user(
+            username='notify-buyer@example.com',
+            email='notify-buyer@example.com',
+            password='testpass123',
+            member_type='customer'
+        )
+        self.customer = Customer.objects.create(member=customer_member, name='買家')
+        self.product = Product.objects.create(
+            name='測試票券',
+            description='測試',
+            price=100,
+            stock=10,
+            phone_number='0912345678',
+            merchant=self.merchant,
+        )
+        self.order = Order.objects.create(
+            provider='newebpay',
+            status='paid',
+            amount=0,
+            item_description=self.product.name,
+            product=self.product,
+            customer=self.customer,
+            quantity=3,
+            unit_price=self.product.price,
+        )
+        mail.outbox = []
+
+    def _set_valid_until(self, tickets, delta):
+        OrderItem.objects.filter(pk__in=[t.pk for t in tickets]).update(
+            valid_until=timezone.now() + delta
+        )
+
+    def test_only_tickets_in_window_are_notified_once(self):
+        """測試只通知時間窗口內的票券，同商家票券合併為一封，且不重複通知"""
+        tickets = list(self.order.items.order_by('id'))
+        self._set_valid_until(tickets[:2], timedelta(minutes=10))
+        self._set_valid_until(tickets[2:], timedelta(days=30))
+
+        result = OrderItem.send_all_expiry_notifications()
+
+        self.assertEqual(result['total_checked'], 2)
+        self.assertEqual(result['notifications_sent'], 2)
+        self.assertEqual(result['errors_count'], 0)
+        self.assertEqual(result['emails_sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('2 張票券即將到期', mail.outbox[0].subject)
+        self.assertEqual(mail.outbox[0].to, ['notify-buyer@example.com'])
+        self.assertEqual(
+            OrderItem.objects.filter(expiry_notification_sent__isnull=False).count(), 2
+        )
+
+        result = OrderItem.send_all_expiry_notifications()
+        self.assertEqual(result['total_checked'], 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_notifications_are_unmarked_for_retry(self):
+        """測試寄信在交易外進行，寄送失敗的票券清除通知標記，下次重新通知"""
+        from unittest import mock
+
+        tickets = list(self.order.items.order_by('id'))
+        self._set_valid_until(tickets, timedelta(minutes=10))
+
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=ConnectionError('SMTP 無回應'),
+        ):
+            result = OrderItem.send_all_expiry_notifications()
+        self.assertEqual((result['notifications_sent'], result['errors_count']), (0, 3))
+        self.assertFalse(
+            OrderItem.objects.filter(expiry_notification_sent__isnull=False).exists()
+        )
+
+        result = OrderItem.send_all_expiry_notifications()
+        self.assertEqual(result['notifications_sent'], 3)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_due_for_expiry_notice_matches_should_send(self):
+        """測試 due_for_expiry_notice 的 SQL 時間窗口與 should_send_expiry_notification 一致"""
+        tickets = list(self.order.items.order_by('id'))
+        self._set_valid_until(tickets[:1], timedelta(minutes=-20))
+        self._set_valid_until(tickets[1:2], timedelta(minutes=-40))
+        self._set_valid_until(tickets[2:], timedelta(minutes=45))
+
+        due_ids = set(
+            OrderItem.objects.due_for_expiry_notice().values_list('pk', flat=True)
+        )
+
+        self.assertEqual(due_ids, {tickets[0].pk})
+        for ticket in OrderItem.objects.all():
+            self.assertEqual(
+                ticket.should_send_expiry_notification(), ticket.pk in due_ids
+            )
+
+
+class TicketRedemptionTestCase(TestCase):
+    def setUp(self):
+        merchant_member = Member.objects.create_user(
+            username='redeem-shop@example.com',
+            email='redeem-shop@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        self.merchant = Merchant.objects.create(
+            member=merchant_member,
+            ShopName='核銷商店',
+            UnifiedNumber='66778899',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='redeemshop'
+        )
+        customer_member = Member.objects.create_user(
+            username='redeem-buyer@example.com',
+            email='redeem-buyer@example.com',
+            password='testpass123',
+            member_type='customer'
+        )
+        customer = Customer.objects.create(member=customer_member, name='買家')
+        product = Product.objects.create(
+            name='核銷票券',
+            description='測試',
+            price=100,
+            stock=10,
+            phone_number='0912345678',
+            merchant=self.merchant,
+        )
+        self.order = Order.objects.create(
+            provider='newebpay',
+            status='paid',
+            amount=0,
+            item_description=product.name,
+            product=product,
+            customer=customer,
+            quantity=2,
+            unit_price=product.price,
+        )
+        self.tickets = list(self.order.items.order_by('id'))
+
+    def test_ticket_is_redeemed_only_once(self):
+        """測試核銷成功會記錄驗證紀錄，同一張票券第二次核銷失敗"""
+        from .models import TicketValidation
+        from .redemption import redeem_ticket
+
+        code = self.tickets[0].ticket_code
+        redemption = redeem_ticket(code, self.merchant, 'qr_code', '127.0.0.1')
+        self.assertTrue(redemption.success)
+        self.assertEqual(redemption.ticket_value, 100)
+        ticket = OrderItem.objects.get(ticket_code=code)
+        self.assertEqual(ticket.status, 'used')
+        self.assertEqual(ticket.used_at, redemption.used_at)
+
+        redemption = redeem_ticket(code, self.merchant)
+        self.assertFalse(redemption.success)
+        self.assertEqual(redemption.message, '票券已使用')
+
+        self.assertEqual(
+            list(
+                TicketValidation.objects.filter(ticket=ticket)
+                .order_by('id')
+                .values_list('status', 'validation_method')
+            ),
+            [('success', 'qr_code'), ('failed', 'manual')],
+        )
+
+    def test_rejects_foreign_expired_and_unknown_tickets(self):
+        """測試其他商家、已過期與不存在的票券不會被核銷"""
+        from .redemption import redeem_ticket
+
+        other_member = Member.objects.create_user(
+            username='other-shop@example.com',
+            email='other-shop@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        other_merchant = Merchant.objects.create(
+            member=other_member,
+            ShopName='其他商店',
+            UnifiedNumber='99887766',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='othershop'
+        )
+
+        redemption = redeem_ticket(self.tickets[0].ticket_code, other_merchant)
+        self.assertEqual(
+            (redemption.success, redemption.message), (False, '您無權限驗證此票券')
+        )
+
+        OrderItem.objects.filter(pk=self.tickets[1].pk).update(
+            valid_until=timezone.now() - timedelta(minutes=1)
+        )
+        redemption = redeem_ticket(self.tickets[1].ticket_code, self.merchant)
+        self.assertEqual((redemption.success, redemption.message), (False, '票券已過期'))
+
+        redemption = redeem_ticket('TKTNOTEXIST', self.merchant)
+        self.assertEqual(
+            (redemption.success, redemption.message), (False, '找不到此票券代碼')
+        )
+        self.assertEqual(OrderItem.objects.filter(status='used').count(), 0)
+
+    def test_unpaid_order_tickets_are_not_redeemed(self):
+        """測試訂單未付款時不核銷"""
+        from .redemption import redeem_ticket
+
+        Order.objects.filter(pk=self.order.pk).update(status='refunded')
+        redemption = redeem_ticket(self.tickets[0].ticket_code, self.merchant)
+        self.assertEqual((redemption.success, redemption.message), (False, '票券尚未付款'))
+
+    def test_signed_qr_token_is_verified_locally(self):
+        """測試簽章 token 可在本機驗證，偽造、其他商家或過期的 token 不需查詢資料庫即可拒絕"""
+        from .ticket_tokens import verify_ticket_token
+
+        ticket = self.tickets[0]
+        token = ticket.generate_qr_code_data()
+        self.assertTrue(token.startswith('TP1:'))
+        self.assertLess(len(token), 50)
+
+        with self.assertNumQueries(0):
+            payload, error = verify_ticket_token(token, merchant_id=self.merchant.pk)
+            self.assertIsNone(error)
+            self.assertEqual(payload.ticket_id, ticket.pk)
+
+            forged = token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB')
+            self.assertEqual(verify_ticket_token(forged)[1], 'QR code簽章無效')
+            self.assertEqual(
+                verify_ticket_token(token, merchant_id=self.merchant.pk + 1)[1],
+                '您無權限驗證此票券',
+            )
+            self.assertEqual(
+                verify_ticket_token(token, now=ticket.valid_until + timedelta(minutes=2))[1],
+                '票券已過期',
+            )
+
+    def test_ticket_is_redeemed_with_signed_qr_token(self):
+        """測試以 QR code 的簽章 token 核銷票券"""
+        from .redemption import redeem_ticket
+
+        ticket = self.tickets[0]
+        redemption = redeem_ticket(ticket.generate_qr_code_data(), self.merchant, 'qr_code')
+        self.assertTrue(redemption.success)
+        self.assertEqual(redemption.ticket_id, ticket.pk)
+
+        found, error = OrderItem.get_ticket_from_qr_data(
+            ticket.generate_qr_code_data(), merchant=self.merchant
+        )
+        self.assertEqual((found, error), (ticket, None))
+
+    def test_offline_batch_is_reconciled_with_conflicts(self):
+        """測試離線批次核銷：以掃描時間判斷期限，已使用與同批重複的票券回報衝突"""
+        from .models import TicketValidation
+        from .redemption import redeem_ticket, redeem_ticket_batch
+
+        first, second = self.tickets
+        redeem_ticket(first.ticket_code, self.merchant)
+        # 離線掃描後才到期的票券仍可核銷
+        scanned_at = timezone.now() - timedelta(minutes=10)
+        OrderItem.objects.filter(pk=second.pk).update(
+            valid_until=timezone.now() - timedelta(minutes=5)
+        )
+
+        results = redeem_ticket_batch(
+            self.merchant,
+            [
+                (first.ticket_code, scanned_at),
+                (second.ticket_code, scanned_at),
+                (second.ticket_code, scanned_at + timedelta(seconds=30)),
+                ('TKTNOTEXIST', None),
+            ],
+        )
+        self.assertEqual(
+            [result.status for result in results],
+            ['conflict', 'redeemed', 'conflict', 'rejected'],
+        )
+        self.assertEqual(results[2].message, '同一批次重複掃描')
+        self.assertEqual(results[2].used_at, results[1].used_at)
+        self.assertEqual(OrderItem.objects.get(pk=second.pk).status, 'used')
+        self.assertEqual(
+            TicketValidation.objects.filter(ticket=second, status='success').count(), 1
+        )
+
+    def test_scanner_manifest_delta(self):
+        """測試掃描器清單：完整清單只含可核銷票券，差異同步回傳新核銷的票券 ID"""
+        from .redemption import redeem_ticket
+        from .scanner import build_scanner_manifest
+
+        first, second = self.tickets
+        manifest = build_scanner_manifest(self.merchant)
+        self.assertTrue(manifest['full'])
+        self.assertEqual(
+            [ticket[:2] for ticket in manifest['tickets']],
+            [[first.pk, first.ticket_code], [second.pk, second.ticket_code]],
+        )
+
+        since = timezone.now()
+        redeem_ticket(first.ticket_code, self.merchant)
+        delta = build_scanner_manifest(self.merchant, since=since)
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['tickets'], [])
+        self.assertEqual(delta['removed'], [first.pk])
+
+    @override_settings(SCANNER_MANIFEST_PAGE_SIZE=1)
+    def test_scanner_manifest_is_paged(self):
+        """測試掃描器清單分頁回傳，各頁的同步時間相同"""
+        import json
+
+        first, second = self.tickets
+        self.client.post(reverse('merchant_account:login'), {
+            'email': 'redeem-shop@example.com',
+            'password': 'testpass123'
+        })
+        url = reverse('merchant_account:scanner_manifest', args=['redeemshop'])
+
+        page = self.client.get(url).json()
+        self.assertEqual([ticket[0] for ticket in page['tickets']], [first.pk])
+        self.assertIsNotNone(page['next_cursor'])
+
+        next_page = self.client.get(url, {'cursor': page['next_cursor']}).json()
+        self.assertEqual([ticket[0] for ticket in next_page['tickets']], [second.pk])
+        self.assertIsNone(next_page['next_cursor'])
+        self.assertEqual(next_page['since'], page['since'])
+
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(json.loads(response.content)['success'])
+
+    def test_batch_validation_uses_constant_queries(self):
+        """測試批次驗證不鎖定也不核銷票券，批次核銷的查詢數不隨票券數與日期數增加"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import MerchantDailyStats
+        from .redemption import redeem_ticket_batch
+
+        order = Order.objects.create(
+            provider='newebpay',
+            status='paid',
+            amount=0,
+            item_description=self.order.item_description,
+            product=self.order.product,
+            customer=self.order.customer,
+            quantity=1,
+            unit_price=self.order.unit_price,
+        )
+        extra_tickets = list(order.items.order_by('id'))
+        # 票券建立於不同日期，統計累加仍為一個 UPDATE
+        yesterday = timezone.now() - timedelta(days=1)
+        OrderItem.objects.filter(pk=self.tickets[1].pk).update(created_at=yesterday)
+        for day in (timezone.localdate(), timezone.localdate(yesterday)):
+            MerchantDailyStats.rebuild(self.merchant.pk, day)
+
+        codes = [ticket.ticket_code for ticket in self.tickets]
+        with CaptureQueriesContext(connection) as validation:
+            results = redeem_ticket_batch(
+                self.merchant, [(code, None) for code in codes], dry_run=True
+            )
+        self.assertEqual([result.status for result in results], ['valid', 'valid'])
+        self.assertEqual(OrderItem.objects.filter(status='used').count(), 0)
+        self.assertFalse(
+            any('FOR UPDATE' in query['sql'] for query in validation.captured_queries)
+        )
+
+        with CaptureQueriesContext(connection) as single:
+            redeem_ticket_batch(self.merchant, [(extra_tickets[0].ticket_code, None)])
+        with CaptureQueriesContext(connection) as batch:
+            results = redeem_ticket_batch(
+                self.merchant,
+                [
+                    (codes[1], None),
+                    (codes[0], None),
+                    (codes[0], None),
+                    (extra_tickets[0].ticket_code, None),
+                    ('TKTNOTEXIST', None),
+                ],
+            )
+        # 驗證失敗記錄不論筆數都一次寫入（未設定 Redis 時為讀取票券與 bulk_create 兩個查詢）
+        self.assertEqual(len(batch), len(single) + 2)
+        self.assertEqual(
+            [result.status for result in results],
+            ['redeemed', 'redeemed', 'conflict', 'conflict', 'rejected'],
+        )
+        self.assertEqual(
+            sorted(
+                MerchantDailyStats.objects.filter(merchant=self.merchant).values_list(
+                    'date', 'tickets_used'
+                )
+            ),
+            [(timezone.localdate(yesterday), 1), (timezone.localdate(), 2)],
+        )
+
+    def test_batch_tickets_api(self):
+        """測試批次驗證／核銷 API 回傳每張票券的結果"""
+        import json
+
+        self.client.post(reverse('merchant_account:login'), {
+            'email': 'redeem-shop@example.com',
+            'password': 'testpass123'
+        })
+        url = reverse('merchant_account:batch_tickets', args=['redeemshop'])
+        codes = [ticket.ticket_code for ticket in self.tickets]
+
+        response = self.client.post(
+            url,
+            json.dumps({'ticket_codes': codes + ['TKTNOTEXIST'], 'mode': 'redeem'}),
+            content_type='application/json',
+        )
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual((data['redeemed'], data['rejected']), (2, 1))
+        self.assertEqual(data['results'][2]['message'], '找不到此票券代碼')
+
+        response = self.client.post(
+            url, json.dumps({'ticket_codes': 'not-a-list'}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipUnless(os.getenv('TEST_REDIS_URL'), '需要 TEST_REDIS_URL')
+    def test_audit_events_are_queued_in_redis_and_written_once(self):
+        """測試驗證失敗記錄先放入 Redis，定期寫入時保留驗證時間，重新寫入時不會重複"""
+        import json
+
+        from truepay.redis_client import get_redis_client
+        from .audit import (
+            QUEUE_KEY,
+            flush_ticket_validations,
+            log_ticket_validation,
+            write_ticket_validations,
+        )
+        from .models import TicketValidation
+
+        ticket = self.tickets[0]
+        with override_settings(REDIS_URL=os.getenv('TEST_REDIS_URL')):
+            client = get_redis_client()
+            client.delete(QUEUE_KEY)
+
+            with self.assertNumQueries(0):
+                log_ticket_validation(ticket.pk, self.merchant.pk, 'failed', '票券已使用')
+                log_ticket_validation(
+                    ticket.pk + 1000, self.merchant.pk, 'failed', '票券已使用'
+                )
+            events = [json.loads(event) for event in client.lrange(QUEUE_KEY, 0, -1)]
+            self.assertFalse(TicketValidation.objects.filter(ticket=ticket).exists())
+
+            with self.assertNumQueries(2):
+                self.assertEqual(flush_ticket_validations(), 2)
+            self.assertEqual(client.llen(QUEUE_KEY), 0)
+            self.assertEqual(flush_ticket_validations(), 0)
+
+        # 寫入後、移出清單前中斷時會重新寫入
+        self.assertEqual(write_ticket_validations(events), 1)
+        validation = TicketValidation.objects.get(ticket=ticket)
+        self.assertEqual(validation.validation_time.isoformat(), events[0][-1])
+        self.assertEqual(validation.failure_reason, '票券已使用')
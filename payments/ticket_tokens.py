@@ -0,0 +1,107 @@
+"""
+票券 QR code 簽章 token
+QR code 內容為 `TP1:<BASE32>`，BASE32 解開後是
+
+    版本 (1 byte) | 商家 ID (4 bytes) | 票券 ID (8 bytes) | 有效期限 (4 bytes，Unix 分鐘，0 表示無期限)
+    | HMAC-SHA256 前 10 bytes
+
+共 27 bytes，編碼後 48 個字元，且只使用 QR code 英數模式的字元（A-Z、2-7、:），
+比原本的 JSON 內容小很多，QR code 版本較低、產生與掃描都較快。
+
+HMAC 金鑰依商家由 TICKET_TOKEN_SECRET 衍生（get_merchant_token_key），掃描器只需
+持有自己商家的金鑰，就能在本機拒絕偽造、其他商家或已過期的票券；是否已使用仍以
+資料庫的核銷（payments.redemption）為準
+"""
+
+import base64
+import binascii
+import hmac
+import math
+import struct
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+TOKEN_PREFIX = "TP1:"
+TOKEN_VERSION = 1
+MAC_LENGTH = 10
+
+_PAYLOAD = struct.Struct(">BIQI")
+
+TicketToken = namedtuple("TicketToken", ["ticket_id", "merchant_id", "valid_until"])
+
+
+def get_merchant_token_key(merchant_id):
+    """商家的票券 token 金鑰（離線掃描器以此驗證簽章）"""
+    return salted_hmac(
+        "truepay.ticket_token.merchant",
+        str(merchant_id),
+        secret=settings.TICKET_TOKEN_SECRET,
+        algorithm="sha256",
+    ).digest()
+
+
+def _sign(merchant_id, payload):
+    return hmac.new(
+        get_merchant_token_key(merchant_id), payload, "sha256"
+    ).digest()[:MAC_LENGTH]
+
+
+def is_ticket_token(text):
+    """是否為簽章 token 格式（否則視為票券代碼或舊版 JSON）"""
+    return text.upper().startswith(TOKEN_PREFIX)
+
+
+def make_ticket_token(ticket):
+    """產生票券的簽章 token"""
+    merchant_id = ticket.merchant_id or ticket.product.merchant_id
+    expiry_minutes = (
+        math.ceil(ticket.valid_until.timestamp() / 60) if ticket.valid_until else 0
+    )
+    payload = _PAYLOAD.pack(TOKEN_VERSION, merchant_id, ticket.pk, expiry_minutes)
+    encoded = base64.b32encode(payload + _sign(merchant_id, payload)).decode()
+    return TOKEN_PREFIX + encoded.rstrip("=")
+
+
+def verify_ticket_token(token, merchant_id=None, now=None):
+    """
+    驗證簽章 token（不查詢資料庫）
+
+    Args:
+        token (str): QR code 內容
+        merchant_id (int): 掃描的商家，票券屬於其他商家時拒絕
+        now (datetime): 判斷是否過期的時間
+
+    Returns:
+        tuple: (TicketToken, None) 或 (None, 錯誤訊息)
+    """
+    if not is_ticket_token(token):
+        return None, "QR code格式錯誤"
+
+    encoded = token[len(TOKEN_PREFIX):].strip().upper()
+    try:
+        raw = base64.b32decode(encoded + "=" * (-len(encoded) % 8))
+    except (binascii.Error, ValueError):
+        return None, "QR code格式錯誤"
+    if len(raw) != _PAYLOAD.size + MAC_LENGTH:
+        return None, "QR code格式錯誤"
+
+    payload, mac = raw[:_PAYLOAD.size], raw[_PAYLOAD.size:]
+    version, token_merchant_id, ticket_id, expiry_minutes = _PAYLOAD.unpack(payload)
+    if version != TOKEN_VERSION:
+        return None, "不支援的QR code版本"
+    if not hmac.compare_digest(mac, _sign(token_merchant_id, payload)):
+        return None, "QR code簽章無效"
+    if merchant_id is not None and token_merchant_id != merchant_id:
+        return None, "您無權限驗證此票券"
+
+    valid_until = None
+    if expiry_minutes:
+        valid_until = datetime.fromtimestamp(expiry_minutes * 60, tz=dt_timezone.utc)
+        if (now or timezone.now()) > valid_until:
+            return None, "票券已過期"
+
+    return TicketToken(ticket_id, token_merchant_id, valid_until), None
@@ -1,6 +1,5 @@
 import logging
 from datetime import timedelta
-from functools import wraps
 from urllib.parse import urlencode
 
 from django.contrib import messages
@@ -11,11 +10,11 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
 
 
 from customers_account.models import Customer
+from truepay.decorators import customer_login_required
 from merchant_marketplace.models import Product
 from .linepay import process_linepay
 from .models import Order
@@ -24,24 +23,6 @@ from .newebpay import process_newebpay
 logger = logging.getLogger(__name__)
 
 
-# 增強版的 login_required decorator：加入防快取功能
-def customer_login_required(view_func):
-    @wraps(view_func)
-    @login_required(login_url="/customers/login/")
-    @never_cache
-    def _wrapped_view(request, *args, **kwargs):
-        # 設定防快取 headers
-        response = view_func(request, *args, **kwargs)
-        if hasattr(response, "__setitem__"):
-            response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response["Pragma"] = "no-cache"
-            response["Expires"] = "0"
-
-        return response
-
-    return _wrapped_view
-
-
 def _check_pending_order_limit(
     customer, time_window_minutes=10, max_pending_orders=3, is_retry=False
 ):
@@ -124,6 +105,7 @@ def _create_order_for_payment(customer, provider, product_id, quantity, product=
         item_description=product.name[:50],
         product=product,
         customer=customer,
+        merchant_id=product.merchant_id,
         quantity=quantity,
         unit_price=product.price,
         status="pending",
@@ -160,7 +142,9 @@ def create_payment(request):
             return redirect("pages:home")
 
         # 透過 user 找到對應的 Customer
-        customer = Customer.objects.get(member=request.user)
+        customer = request.customer
+        if not customer:
+            raise Customer.DoesNotExist
 
         # 獲取商品資訊以檢查驗證需求
         if not product_id:
@@ -256,7 +240,9 @@ def retry_payment(request, order_id):
     try:
         with transaction.atomic():
             order = get_object_or_404(Order.objects.select_for_update(), id=order_id)
-            customer = Customer.objects.get(member=request.user)
+            customer = request.customer
+            if not customer:
+                raise Customer.DoesNotExist
 
             # 檢查訂單狀態，只能重新付款待付款的訂單
             if order.status != "pending":
@@ -311,9 +297,8 @@ def payment_status(request, order_id):
     order = get_object_or_404(Order, id=order_id)
 
     # 透過 user 找到對應的 Customer
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -350,9 +335,8 @@ def order_limit_error(request):
 @customer_login_required
 def totp_verify(request):
     """TOTP 驗證頁面 - 用於付款前驗證"""
-    try:
-        customer = Customer.objects.get(member=request.user)
-    except Customer.DoesNotExist:
+    customer = request.customer
+    if not customer:
         messages.error(request, "客戶資料不存在")
         return redirect("pages:home")
 
@@ -4,4 +4,6 @@ from django.apps import AppConfig
 class PublicStoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'public_store'
-    verbose_name = '公開商店頁面'
\ No newline at end of file
+    verbose_name = '公開商店頁面'
+    def ready(self):
+        import public_store.signals
@@ -0,0 +1,125 @@
+"""
+商店頁面快取
+匿名訪客看到的商店總覽與收款頁面內容相同，以「商家 + 模板 + 商家版本號」為鍵快取
+渲染後的 HTML，不必每次都查詢商品並重新渲染模板。
+
+- 版本號：商品儲存、上下架、庫存扣減與商家資料（含模板）變動時遞增，舊的快取
+  因為鍵不同而自然失效，不必逐一刪除
+- CSRF：快取的 HTML 以佔位字串渲染 csrf_token，回應時才換成目前訪客的 token
+- ETag：以快取內容計算，瀏覽器帶 If-None-Match 時直接回應 304
+- 有效期限：不超過 STOREFRONT_CACHE_TIMEOUT，且不超過頁面上最早到期的商品票券期限
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils import timezone, translation
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+VERSION_KEY = "storefront:v1:version:{}"
+PAGE_KEY = "storefront:v1:page:{}:{}:{}:{}:{}:{}"
+
+CSRF_PLACEHOLDER = "__STOREFRONT_CSRF_TOKEN__"
+
+
+def _new_version():
+    # 以時間戳初始化，版本號被清除後重新建立時不會和舊的快取鍵重複
+    return time.time_ns()
+
+
+def get_storefront_version(merchant_id):
+    """取得商家目前的商店頁面版本號"""
+    key = VERSION_KEY.format(merchant_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_storefront_version(merchant_id):
+    """遞增商家的商店頁面版本號，讓所有已快取的頁面失效（交易提交後再遞增一次）"""
+    key = VERSION_KEY.format(merchant_id)
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+    bump()
+    # 交易提交前的請求可能把舊資料寫入新版本的快取
+    transaction.on_commit(bump)
+
+
+def _page_key(request, merchant, page, variant):
+    template_id = getattr(merchant, "store_template_id", "") or "modern"
+    variant_digest = hashlib.md5(variant.encode("utf-8")).hexdigest() if variant else ""
+    return PAGE_KEY.format(
+        merchant.pk,
+        get_storefront_version(merchant.pk),
+        template_id,
+        page,
+        translation.get_language(),
+        variant_digest,
+    )
+
+
+def _timeout_until(expires_at):
+    timeout = settings.STOREFRONT_CACHE_TIMEOUT
+    if expires_at is not None:
+        timeout = min(timeout, int((expires_at - timezone.now()).total_seconds()))
+    return timeout
+
+
+def cached_storefront_page(request, merchant, page, render_page, variant=""):
+    """
+    回應商店頁面，匿名訪客使用快取的 HTML
+
+    Args:
+        request: HttpRequest
+        merchant (Merchant): 商店所屬商家
+        page (str): 頁面名稱，如 "overview"、"pay:<商品 ID>"
+        render_page (callable): render_page(extra_context) 回傳 (HttpResponse, 內容到期時間或 None)
+        variant (str): 其他會影響內容的值（如模板中用到的完整路徑）
+
+    Returns:
+        HttpResponse
+    """
+    if request.user.is_authenticated:
+        response, _ = render_page({})
+        return response
+
+    key = _page_key(request, merchant, page, variant)
+    cached = cache.get(key)
+    if cached is None:
+        response, expires_at = render_page({"csrf_token": CSRF_PLACEHOLDER})
+        if response.status_code != 200:
+            return response
+
+        content = response.content
+        cached = {
+            "content": content,
+            "content_type": response["Content-Type"],
+            "etag": f'"{hashlib.md5(content).hexdigest()}"',
+        }
+        timeout = _timeout_until(expires_at)
+        if timeout > 0:
+            cache.set(key, cached, timeout)
+
+    response = HttpResponse(
+        cached["content"].replace(
+            CSRF_PLACEHOLDER.encode(), get_token(request).encode()
+        ),
+        content_type=cached["content_type"],
+    )
+    response["ETag"] = cached["etag"]
+    # 頁面含有每位訪客各自的 CSRF token，只允許瀏覽器快取，每次需以 ETag 驗證
+    patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+    patch_vary_headers(response, ("Cookie", "Accept-Language"))
+    return get_conditional_response(request, etag=cached["etag"], response=response)
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from merchant_account.models import Merchant
+from merchant_marketplace.models import Product
+from .cache import bump_storefront_version
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_storefront(sender, instance, **kwargs):
+    """商品新增、修改、上下架或刪除時讓該商家的商店頁面快取失效"""
+    bump_storefront_version(instance.merchant_id)
+
+
+@receiver(post_save, sender=Merchant)
+@receiver(post_delete, sender=Merchant)
+def invalidate_merchant_storefront(sender, instance, **kwargs):
+    """商家資料或商店模板變動時讓商店頁面快取失效"""
+    bump_storefront_version(instance.pk)
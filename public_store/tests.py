@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from merchant_account.models import Merchant
+from merchant_marketplace.models import Product
+
+Member = get_user_model()
+
+
+class StorefrontCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        merchant_member = Member.objects.create_user(
+            username='storefront@example.com',
+            email='storefront@example.com',
+            password='testpass123',
+            member_type='merchant'
+        )
+        self.merchant = Merchant.objects.create(
+            member=merchant_member,
+            ShopName='快取商店',
+            UnifiedNumber='11223344',
+            NationalNumber='A123456789',
+            Name='測試負責人',
+            Address='台北市中正區中山南路1號',
+            Cellphone='0912345678',
+            subdomain='storefront'
+        )
+        self.product = Product.objects.create(
+            name='快取票券',
+            description='測試',
+            price=100,
+            stock=10,
+            phone_number='0912345678',
+            merchant=self.merchant,
+        )
+        self.host = 'storefront.truepay.tw'
+
+    def test_anonymous_visitors_get_cached_page_with_etag(self):
+        """測試匿名訪客第二次請求不查詢商品，且帶 ETag 時回應 304"""
+        response = self.client.get('/', HTTP_HOST=self.host)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '快取票券')
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+
+        # 商家由子網域快取取得，不需查詢資料庫
+        with self.assertNumQueries(0):
+            response = self.client.get('/', HTTP_HOST=self.host)
+        self.assertContains(response, '快取票券')
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get('/', HTTP_HOST=self.host, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_page_uses_visitor_csrf_token(self):
+        """測試快取的頁面不包含佔位字串，而是目前訪客的 CSRF token"""
+        from .cache import CSRF_PLACEHOLDER
+
+        self.client.get('/', HTTP_HOST=self.host)
+        response = self.client.get('/', HTTP_HOST=self.host)
+        self.assertNotContains(response, CSRF_PLACEHOLDER)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_product_changes_invalidate_cached_page(self):
+        """測試商品修改與下架後快取立即失效"""
+        self.client.get('/', HTTP_HOST=self.host)
+
+        self.product.name = '新名稱票券'
+        self.product.save()
+        response = self.client.get('/', HTTP_HOST=self.host)
+        self.assertContains(response, '新名稱票券')
+
+        self.product.is_active = False
+        self.product.save(update_fields=['is_active'])
+        response = self.client.get('/', HTTP_HOST=self.host)
+        self.assertNotContains(response, '新名稱票券')
+
+    def test_payment_page_is_cached_per_product(self):
+        """測試收款頁面快取，商品不存在時回應 404"""
+        response = self.client.get(f'/pay/{self.product.id}/', HTTP_HOST=self.host)
+        self.assertContains(response, '快取票券')
+        self.assertTrue(response.has_header('ETag'))
+
+        response = self.client.get('/pay/999999/', HTTP_HOST=self.host)
+        self.assertEqual(response.status_code, 404)
@@ -1,9 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.utils import timezone
-from django.db.models import Q
 from merchant_account.models import Merchant
 from merchant_marketplace.models import Product
-from customers_account.models import Customer
+from truepay.middleware.customer import get_customer
+from .cache import cached_storefront_page
 from django.http import HttpResponsePermanentRedirect
 import os
 
@@ -28,13 +27,6 @@ def shop_overview(request, subdomain=None):
         # 正式環境：使用 middleware 設定的 merchant
         merchant = request.merchant
 
-    products = Product.objects.filter(
-        Q(ticket_expiry__isnull=True) | Q(ticket_expiry__gt=timezone.now()),
-        merchant=merchant,
-        is_active=True,
-        is_deleted=False
-    ).order_by("-created_at")
-
     preview_template = request.GET.get("preview")
     if preview_template and preview_template in [
         "modern_light",
@@ -47,10 +39,24 @@ def shop_overview(request, subdomain=None):
         template_path = f"shop_templates/{preview_template}/shop_overview.html"
     else:
         # 使用商家設定的模板
+        preview_template = None
         template_path = get_store_template(merchant, "shop_overview.html")
 
-    context = {"merchant": merchant, "products": products}
-    return render(request, template_path, context)
+    def render_page(extra_context):
+        products = list(
+            Product.objects.listed().filter(merchant=merchant).order_by("-created_at")
+        )
+        expires_at = min(
+            (product.ticket_expiry for product in products if product.ticket_expiry),
+            default=None,
+        )
+        context = {"merchant": merchant, "products": products, **extra_context}
+        return render(request, template_path, context), expires_at
+
+    if preview_template:
+        response, _ = render_page({})
+        return response
+    return cached_storefront_page(request, merchant, "overview", render_page)
 
 
 def payment_page(request, subdomain=None, id=None):
@@ -58,35 +64,41 @@ def payment_page(request, subdomain=None, id=None):
 
     # 本地開發：直接通過商品 ID 找到商品和商家
     if not hasattr(request, "merchant") or request.merchant is None:
-        product = get_object_or_404(Product,
-            Q(ticket_expiry__isnull=True) | Q(ticket_expiry__gt=timezone.now()),
-            id=id,
-            is_active=True,
-            is_deleted=False
-        )
+        product = get_object_or_404(Product.objects.listed(), id=id)
         merchant = product.merchant
+
+        def render_page(extra_context):
+            return _render_payment_page(request, merchant, product, extra_context)
     else:
         # 正式環境：使用 middleware 設定的 merchant
         merchant = request.merchant
-        product = get_object_or_404(Product,
-            Q(ticket_expiry__isnull=True) | Q(ticket_expiry__gt=timezone.now()),
-            id=id,
-            merchant=merchant,
-            is_active=True,
-            is_deleted=False
-        )
+
+        def render_page(extra_context):
+            product = get_object_or_404(
+                Product.objects.listed(), id=id, merchant=merchant
+            )
+            return _render_payment_page(request, merchant, product, extra_context)
+
+    # 模板中的登入連結帶有完整路徑
+    return cached_storefront_page(
+        request, merchant, f"pay:{id}", render_page, variant=request.get_full_path()
+    )
+
+
+def _render_payment_page(request, merchant, product, extra_context):
+    """渲染收款頁面，回傳 (HttpResponse, 票券到期時間)"""
     is_customer = (
         request.user.is_authenticated and request.user.member_type == "customer"
     )
 
     # 如果是已登入的客戶，取得Customer物件以檢查TOTP狀態
-    customer = None
-    if is_customer:
-        try:
-            customer = Customer.objects.get(member=request.user)
-        except Customer.DoesNotExist:
-            pass
-
-    context = {"product": product, "is_customer": is_customer, "customer": customer}
+    customer = get_customer(request) if is_customer else None
+
+    context = {
+        "product": product,
+        "is_customer": is_customer,
+        "customer": customer,
+        **extra_context,
+    }
     template_path = get_store_template(merchant, "payment_page.html")
-    return render(request, template_path, context)
+    return render(request, template_path, context), product.ticket_expiry
@@ -0,0 +1,166 @@
+"""
+緩衝計數器
+高頻率的計數欄位（如子網域重導向次數）若每次都 UPDATE 同一列，會在熱門資料列上
+排隊等待列鎖。這裡把增量以 HINCRBY 累加在 Redis（REDIS_URL），由 Celery Beat
+每 COUNTER_FLUSH_INTERVAL 秒執行 truepay.flush_counters，合併成每筆資料一次
+F() UPDATE 寫入資料庫。增量保存在 Redis 而非 web 程序，程序重新啟動或異常終止
+不會遺失，也不需要等下一次計數才送出。
+
+使用方式：
+    register_counter("subdomain_redirect_hits", "merchant_account.SubdomainRedirect",
+                     "redirect_count", touched_field="last_used")
+    increment_counter("subdomain_redirect_hits", redirect.pk)
+
+寫入時先取得 Redis 鎖（同時只有一個程序寫入），把計數器的 Hash 改名為處理中的 key，
+寫入資料庫後才刪除；寫入途中中斷時，下次執行會先重新寫入處理中的 key（至少一次）。未設定 REDIS_URL 時每次計數直接寫入資料庫
+"""
+
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .redis_client import get_redis_client, redis_key
+
+logger = logging.getLogger(__name__)
+
+Counter = namedtuple("Counter", ["model_label", "field", "touched_field"])
+
+_registry = {}
+
+# 寫入資料庫時的 Redis 鎖逾時（秒），持有鎖的程序中斷後由其他程序接手
+FLUSH_LOCK_TIMEOUT = 300
+
+# 把累加中的 Hash 改名為處理中的 key；處理中的 key 仍存在（上次寫入中斷）時不改名
+_CLAIM_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then return 1 end
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('RENAME', KEYS[1], KEYS[3])
+if redis.call('EXISTS', KEYS[2]) == 1 then redis.call('RENAME', KEYS[2], KEYS[4]) end
+return 1
+"""
+
+
+def register_counter(name, model_label, field, touched_field=None):
+    """
+    註冊緩衝計數器
+
+    Args:
+        name (str): 計數器名稱
+        model_label (str): 模型標籤，如 "merchant_account.SubdomainRedirect"
+        field (str): 要累加的整數欄位
+        touched_field (str): 寫入時一併更新為最後一次計數時間的欄位（可選）
+    """
+    _registry[name] = Counter(model_label, field, touched_field)
+
+
+def _counter_keys(name):
+    """累加中與處理中的計數、最後計數時間 Hash"""
+    return [
+        redis_key("counters", name, "counts"),
+        redis_key("counters", name, "touched"),
+        redis_key("counters", name, "flushing", "counts"),
+        redis_key("counters", name, "flushing", "touched"),
+    ]
+
+
+def increment_counter(name, pk, amount=1):
+    """累加計數（寫入 Redis），由 flush_counters 定期寫入資料庫"""
+    if name not in _registry:
+        raise ValueError(f"未註冊的計數器: {name}")
+
+    now = timezone.now().isoformat()
+    client = get_redis_client()
+    if client is None:
+        apply_counter_increments([[name, pk, amount, now]])
+        return
+
+    counts_key, touched_key = _counter_keys(name)[:2]
+    try:
+        pipe = client.pipeline()
+        pipe.hincrby(counts_key, pk, amount)
+        pipe.hset(touched_key, pk, now)
+        pipe.execute()
+    except Exception as e:
+        # Redis 無法使用時直接寫入，避免計數遺失
+        logger.warning(f"計數器增量無法寫入 Redis，改為直接寫入資料庫: {e}")
+        apply_counter_increments([[name, pk, amount, now]])
+
+
+def flush_counters():
+    """
+    將 Redis 中累積的增量寫入資料庫
+
+    Returns:
+        int: 寫入的增量筆數
+    """
+    client = get_redis_client()
+    if client is None:
+        return 0
+
+    lock = client.lock(
+        redis_key("counters", "flush_lock"), timeout=FLUSH_LOCK_TIMEOUT, blocking=False
+    )
+    if not lock.acquire():
+        # 上一次寫入尚未完成，留到下一次
+        return 0
+
+    claim = client.register_script(_CLAIM_SCRIPT)
+    try:
+        flushed = 0
+        for name in list(_registry):
+            keys = _counter_keys(name)
+            if not claim(keys=keys):
+                continue
+
+            flushing_counts_key, flushing_touched_key = keys[2:]
+            counts = client.hgetall(flushing_counts_key)
+            touched = client.hgetall(flushing_touched_key)
+            now = timezone.now().isoformat()
+            increments = [
+                [
+                    name,
+                    int(pk),
+                    int(count),
+                    touched[pk].decode() if pk in touched else now,
+                ]
+                for pk, count in counts.items()
+                if int(count)
+            ]
+            apply_counter_increments(increments)
+            client.delete(flushing_counts_key, flushing_touched_key)
+            flushed += len(increments)
+        return flushed
+    finally:
+        lock.release()
+
+
+def apply_counter_increments(increments):
+    """
+    將合併後的增量寫入資料庫
+
+    Args:
+        increments (list): [計數器名稱, 主鍵, 增量, 最後計數時間 ISO 字串] 的列表
+
+    Returns:
+        int: 更新的資料筆數
+    """
+    updated = 0
+    # 整批在同一交易中寫入，中斷時不會只寫入一部分
+    with transaction.atomic():
+        for name, pk, count, touched_at in increments:
+            counter = _registry.get(name)
+            if counter is None:
+                logger.error(f"未註冊的計數器 {name}，略過 {count} 次計數")
+                continue
+
+            model = apps.get_model(counter.model_label)
+            values = {counter.field: F(counter.field) + count}
+            if counter.touched_field:
+                values[counter.touched_field] = datetime.fromisoformat(touched_at)
+            updated += model.objects.filter(pk=pk).update(**values)
+    return updated
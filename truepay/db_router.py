@@ -0,0 +1,144 @@
+"""
+讀取副本路由
+報表、統計圖表與匯出等唯讀分析查詢以 using_replica 導向 DATABASES["replica"]，
+減輕主資料庫的負擔。未設定副本（DB_REPLICA_HOST）時一律使用 default。
+
+使用方式：
+    @using_replica
+    def reports_dashboard(request, subdomain): ...
+
+    with using_replica():
+        rows = list(OrderItem.objects.filter(...))
+
+讀寫一致性：副本有複寫延遲，使用者自己剛寫入的資料可能還讀不到。
+請求中有寫入主資料庫時，ReplicaStickinessMiddleware 會在 session 記錄
+REPLICA_STICKY_SECONDS 秒的固定期間，期間內該使用者的 using_replica 仍讀主資料庫。
+不經過 ORM（connection.cursor() 原生 SQL）的寫入不會呼叫路由，需自行呼叫 mark_primary_write
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpRequest
+
+REPLICA_DB_ALIAS = "replica"
+
+# session 中固定讀主資料庫的截止時間（Unix 時間戳）
+SESSION_PINNED_UNTIL_KEY = "replica_pinned_until"
+
+# 不視為使用者寫入的 app（每個請求都可能寫入 session）
+STICKY_EXEMPT_APPS = {"sessions"}
+
+_use_replica = ContextVar("truepay_use_replica", default=False)
+# 只在 ReplicaStickinessMiddleware 處理的請求中記錄（請求以外為 None）
+_wrote_primary = ContextVar("truepay_wrote_primary", default=None)
+
+
+def replica_configured():
+    """是否設定了讀取副本"""
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def is_reading_from_replica():
+    """目前的讀取查詢是否導向副本"""
+    return _use_replica.get()
+
+
+def is_pinned_to_primary(request):
+    """此請求的使用者最近有寫入（或本請求已寫入），應讀主資料庫"""
+    if _wrote_primary.get():
+        return True
+    session = getattr(request, "session", None)
+    if session is None:
+        return False
+    return session.get(SESSION_PINNED_UNTIL_KEY, 0) > time.time()
+
+
+def mark_primary_write():
+    """記錄本請求已寫入主資料庫（供不經過 ReplicaRouter.db_for_write 的原生 SQL 寫入使用）"""
+    if _wrote_primary.get() is not None:
+        _wrote_primary.set(True)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """在此區塊內把讀取查詢導向副本；enabled=False 時維持讀主資料庫"""
+    token = _use_replica.set(enabled and replica_configured())
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def using_replica(func=None):
+    """
+    讀取副本的裝飾器或 context manager
+
+    裝飾 view 時會檢查讀寫一致性，使用者最近有寫入時改讀主資料庫；
+    裝飾任務或一般函式、或以 `with using_replica():` 使用時一律讀副本
+    """
+    if func is None:
+        return replica_reads()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        request = args[0] if args and isinstance(args[0], HttpRequest) else None
+        enabled = request is None or not is_pinned_to_primary(request)
+        with replica_reads(enabled=enabled):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """只有在 using_replica 範圍內的讀取才導向副本，寫入一律使用主資料庫"""
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return REPLICA_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in STICKY_EXEMPT_APPS:
+            mark_primary_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本與主資料庫是同一份資料
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本由主資料庫複寫，不執行 migration
+        if db == REPLICA_DB_ALIAS:
+            return False
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """
+    請求中有寫入主資料庫時，在 session 記錄固定讀主資料庫的期間
+    需放在 SessionMiddleware 之後，回應時才來得及寫入 session
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote_primary.set(False)
+        try:
+            response = self.get_response(request)
+            if (
+                _wrote_primary.get()
+                and replica_configured()
+                and hasattr(request, "session")
+            ):
+                request.session[SESSION_PINNED_UNTIL_KEY] = (
+                    time.time() + settings.REPLICA_STICKY_SECONDS
+                )
+            return response
+        finally:
+            _wrote_primary.reset(token)
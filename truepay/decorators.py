@@ -2,6 +2,8 @@ from functools import wraps
 from django.shortcuts import get_object_or_404, redirect
 from django.http import Http404, HttpResponse
 from merchant_account.models import Merchant
+from merchant_account.session import get_authenticated_merchant
+from truepay.middleware.customer import get_customer
 from django.views.decorators.cache import never_cache
 from django.contrib.auth.decorators import login_required
 
@@ -13,12 +15,9 @@ def no_cache_required(view_func):
         subdomain = kwargs.get("subdomain")
         if subdomain:
             try:
-                merchant = Merchant.objects.get(subdomain=subdomain)
-                if (
-                    request.user.is_authenticated
-                    and request.user.email == merchant.member.email
-                    and request.user.member_type == "merchant"
-                ):
+                # 以 session 綁定的商家驗證，request.merchant 已帶入 member
+                merchant = get_authenticated_merchant(request, subdomain)
+                if merchant is not None:
                     request.merchant = merchant
                 else:
                     return redirect("merchant_account:login")
@@ -35,6 +34,9 @@ def customer_login_required(view_func):
     @login_required(login_url="/customers/login/")
     @never_cache
     def _wrapped_view(request, *args, **kwargs):
+        # 在此載入客戶（連同 member），view 中的 request.customer 為 Customer 或 None
+        request.customer = get_customer(request)
+
         # 設定防快取 headers
         response = view_func(request, *args, **kwargs)
         if hasattr(response, "__setitem__"):
@@ -0,0 +1,38 @@
+from django.utils.functional import SimpleLazyObject
+
+from customers_account.models import Customer
+
+
+def get_customer(request):
+    """
+    取得目前登入會員的 Customer（連同 member 一次查詢），同一請求只查詢一次
+
+    Returns:
+        Customer: 未登入或不是客戶時回傳 None
+    """
+    if not hasattr(request, "_cached_customer"):
+        customer = None
+        if request.user.is_authenticated:
+            customer = (
+                Customer.objects.select_related("member")
+                .filter(member=request.user)
+                .first()
+            )
+        request._cached_customer = customer
+    return request._cached_customer
+
+
+class CustomerMiddleware:
+    """
+    提供延遲載入的 request.customer，需放在 AuthenticationMiddleware 之後
+
+    只有在 view 實際使用時才查詢；沒有對應的客戶時為 None
+    （未經 customer_login_required 的 view 取得的是延遲物件，請以 `if not request.customer` 判斷）
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.customer = SimpleLazyObject(lambda: get_customer(request))
+        return self.get_response(request)
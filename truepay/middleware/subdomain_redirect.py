@@ -3,7 +3,10 @@ import os
 import logging
 from django.http import HttpResponsePermanentRedirect, HttpResponseRedirect
 from django.conf import settings
-from merchant_account.models import SubdomainRedirect
+from merchant_account.subdomain_cache import (
+    get_active_redirect,
+    get_merchant_by_subdomain,
+)
 from accounts.models import Member
 from django.http import Http404
 from django.contrib.auth import login
@@ -104,9 +107,9 @@ class SubdomainRedirectMiddleware:
             return None
 
         try:
-            redirect = SubdomainRedirect.objects.select_related("merchant").get(
-                old_subdomain=current_slug, is_active=True
-            )
+            redirect = get_active_redirect(current_slug)
+            if redirect is None:
+                return None
             if not redirect.is_valid():
                 redirect.is_active = False
                 redirect.save(update_fields=["is_active"])
@@ -117,8 +120,6 @@ class SubdomainRedirectMiddleware:
                 return HttpResponsePermanentRedirect(new_url)
             else:
                 return HttpResponseRedirect(new_url)
-        except SubdomainRedirect.DoesNotExist:
-            return None
         except Exception as e:
             logger.error(
                 f"Unexpected error during subdomain redirect check for slug '{current_slug}': {e}",
@@ -187,10 +188,8 @@ class SubdomainRedirectMiddleware:
 
         if host.endswith(base_domain_with_dot):
             subdomain = host.removesuffix(base_domain_with_dot)
-            from merchant_account.models import Merchant
-
-            try:
-                merchant = Merchant.objects.get(subdomain=subdomain)
+            merchant = get_merchant_by_subdomain(subdomain)
+            if merchant is not None:
                 request.merchant = merchant
                 request.domain_type = "truepay_subdomain"
 
@@ -243,20 +242,14 @@ class SubdomainRedirectMiddleware:
 
                 return None
 
-            except Merchant.DoesNotExist:
-                try:
-                    redirect = SubdomainRedirect.objects.select_related("merchant").get(
-                        old_subdomain=subdomain, is_active=True
-                    )
-                    if redirect.is_valid():
-                        scheme = "https" if request.is_secure() else "http"
-                        new_url = f"{scheme}://{redirect.new_subdomain}.{settings.BASE_DOMAIN}{request.path_info}"
-                        query_string = request.META.get("QUERY_STRING")
-                        if query_string:
-                            new_url += f"?{query_string}"
-                        redirect.use_redirect()
-                        return HttpResponsePermanentRedirect(new_url)
-                except SubdomainRedirect.DoesNotExist:
-                    pass
-                raise Http404("商店不存在")
+            redirect = get_active_redirect(subdomain)
+            if redirect is not None and redirect.is_valid():
+                scheme = "https" if request.is_secure() else "http"
+                new_url = f"{scheme}://{redirect.new_subdomain}.{settings.BASE_DOMAIN}{request.path_info}"
+                query_string = request.META.get("QUERY_STRING")
+                if query_string:
+                    new_url += f"?{query_string}"
+                redirect.use_redirect()
+                return HttpResponsePermanentRedirect(new_url)
+            raise Http404("商店不存在")
         return None
@@ -0,0 +1,176 @@
+"""
+游標分頁 (keyset pagination)
+以 (時間欄位, id) 作為排序鍵，用 WHERE 條件取代 OFFSET，也不需要 COUNT(*)，
+因此第 N 頁與第 1 頁的查詢成本相同。
+上一頁 / 下一頁以不透明的 cursor 字串表示，可用於模板連結與 JSON API
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_PARAM = "cursor"
+
+
+def encode_cursor(value, pk, direction):
+    """將排序鍵編碼為 URL 安全的 cursor 字串"""
+    payload = json.dumps(
+        {"v": value.isoformat(), "id": pk, "d": direction}, separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    解析 cursor 字串
+
+    Returns:
+        tuple: (value, pk, direction)，格式錯誤時回傳 None
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = parse_datetime(payload["v"])
+        pk = int(payload["id"])
+        direction = payload["d"]
+    except (ValueError, TypeError, KeyError, json.JSONDecodeError):
+        return None
+    if value is None or direction not in ("next", "prev"):
+        return None
+    return value, pk, direction
+
+
+class CursorPage:
+    """單頁結果，可直接在模板中迭代"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous, params):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self._params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not (self._has_next and self.object_list):
+            return None
+        return self.paginator.cursor_for(self.object_list[-1], "next")
+
+    @property
+    def previous_cursor(self):
+        if not (self._has_previous and self.object_list):
+            return None
+        return self.paginator.cursor_for(self.object_list[0], "prev")
+
+    def _query_with_cursor(self, cursor):
+        params = self._params.copy()
+        params.pop("format", None)
+        params[CURSOR_PARAM] = cursor
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        """下一頁的查詢字串（保留其他篩選參數）"""
+        cursor = self.next_cursor
+        return self._query_with_cursor(cursor) if cursor else ""
+
+    @property
+    def previous_query(self):
+        """上一頁的查詢字串（保留其他篩選參數）"""
+        cursor = self.previous_cursor
+        return self._query_with_cursor(cursor) if cursor else ""
+
+    def to_json(self, serialize):
+        """
+        轉換為 JSON 回應格式
+
+        Args:
+            serialize (callable): 將單筆資料轉為 dict 的函式
+        """
+        return {
+            "results": [serialize(obj) for obj in self.object_list],
+            "has_next": self.has_next(),
+            "has_previous": self.has_previous(),
+            "next_cursor": self.next_cursor,
+            "previous_cursor": self.previous_cursor,
+        }
+
+
+class CursorPaginator:
+    """
+    以 (key_field, id) 由新到舊排序的游標分頁
+
+    Args:
+        queryset: 已篩選的 QuerySet（原本的排序會被覆寫）
+        per_page (int): 每頁筆數
+        key_field (str): 排序用的時間欄位，預設 created_at
+    """
+
+    def __init__(self, queryset, per_page, key_field="created_at"):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key_field = key_field
+
+    def cursor_for(self, obj, direction):
+        return encode_cursor(getattr(obj, self.key_field), obj.pk, direction)
+
+    def get_page(self, params):
+        """
+        依查詢參數中的 cursor 取得一頁資料，cursor 無效時回到第一頁
+
+        Args:
+            params (QueryDict): 通常為 request.GET
+        """
+        key = self.key_field
+        decoded = decode_cursor(params.get(CURSOR_PARAM, ""))
+
+        if decoded is None:
+            rows = list(self.queryset.order_by(f"-{key}", "-pk")[: self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            return CursorPage(rows[: self.per_page], self, has_next, False, params)
+
+        value, pk, direction = decoded
+        if direction == "next":
+            rows = list(
+                self.queryset.filter(
+                    Q(**{f"{key}__lt": value}) | Q(**{key: value, "pk__lt": pk})
+                ).order_by(f"-{key}", "-pk")[: self.per_page + 1]
+            )
+            has_next = len(rows) > self.per_page
+            return CursorPage(rows[: self.per_page], self, has_next, True, params)
+
+        # 往前翻頁：反向排序取資料後再反轉回由新到舊
+        rows = list(
+            self.queryset.filter(
+                Q(**{f"{key}__gt": value}) | Q(**{key: value, "pk__gt": pk})
+            ).order_by(key, "pk")[: self.per_page + 1]
+        )
+        if not rows:
+            # 已經沒有更新的資料，回到第一頁
+            params = params.copy()
+            params.pop(CURSOR_PARAM, None)
+            return self.get_page(params)
+        has_previous = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        rows.reverse()
+        return CursorPage(rows, self, True, has_previous, params)
@@ -7,6 +7,7 @@ import qrcode
 from PIL import Image, ImageDraw
 from io import BytesIO
 import base64
+from functools import lru_cache
 from django.contrib.staticfiles import finders
 import os
 import logging
@@ -14,9 +15,54 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def generate_qr_code_with_logo(data, logo_path=None, logo_size_ratio=0.25, error_correction=qrcode.constants.ERROR_CORRECT_M):
+@lru_cache(maxsize=1)
+def get_default_logo_path():
+    """預設 logo (favicon) 的檔案路徑，每個程序只搜尋一次"""
+    return finders.find('favicon.ico')
+
+
+@lru_cache(maxsize=32)
+def get_logo_overlay(logo_path, logo_size):
     """
-    生成帶有 logo 的 QR Code
+    產生並記憶 QR Code 中央的 logo 圖層（白色圓形背景 + logo）
+
+    同一個程序中相同 logo 與尺寸只需讀檔、縮放、產生遮罩一次；
+    回傳的圖片只供 paste 讀取，不可修改
+
+    Returns:
+        Image: RGBA 圖片，logo 不存在時回傳 None
+    """
+    if not logo_path or not os.path.exists(logo_path):
+        return None
+
+    # 載入 logo 並轉換為 RGBA 模式
+    logo = Image.open(logo_path).convert('RGBA')
+
+    # 創建圓形白色背景
+    background = Image.new('RGBA', (logo_size, logo_size), (255, 255, 255, 255))
+
+    # 創建圓形遮罩
+    mask = Image.new('L', (logo_size, logo_size), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse([0, 0, logo_size, logo_size], fill=255)
+
+    # 應用圓形遮罩到白色背景
+    background.putalpha(mask)
+
+    # 調整 logo 大小（留一些邊距）
+    logo_margin = logo_size // 4
+    inner_size = logo_size - logo_margin * 2
+    logo_resized = logo.resize((inner_size, inner_size), Image.Resampling.LANCZOS)
+
+    # 白色圓形背景 + logo
+    logo_pos = ((logo_size - inner_size) // 2, (logo_size - inner_size) // 2)
+    background.paste(logo_resized, logo_pos, logo_resized)
+    return background
+
+
+def generate_qr_code_png(data, logo_path=None, logo_size_ratio=0.25, error_correction=qrcode.constants.ERROR_CORRECT_M):
+    """
+    生成帶有 logo 的 QR Code PNG
 
     Args:
         data (str): QR Code 要編碼的資料
@@ -25,12 +71,12 @@ def generate_qr_code_with_logo(data, logo_path=None, logo_size_ratio=0.25, error
         error_correction: QR Code 的錯誤修正等級
 
     Returns:
-        str: base64 編碼的 PNG 圖片
+        bytes: PNG 圖片內容
     """
 
     # 如果沒有指定 logo 路徑，使用預設的 favicon
     if logo_path is None:
-        logo_path = finders.find('favicon.ico')
+        logo_path = get_default_logo_path()
 
     # 創建 QR Code
     qr = qrcode.QRCode(
@@ -47,59 +93,45 @@ def generate_qr_code_with_logo(data, logo_path=None, logo_size_ratio=0.25, error
 
     # 嘗試添加 logo
     try:
-        if os.path.exists(logo_path):
-            # 載入 logo
-            logo = Image.open(logo_path)
-
-            # 轉換為 RGBA 模式
-            logo = logo.convert('RGBA')
-
-            # 計算 logo 尺寸
-            qr_width, qr_height = qr_img.size
-            logo_size = int(min(qr_width, qr_height) * logo_size_ratio)
-
-            # 調整 logo 大小
-            logo = logo.resize((logo_size, logo_size), Image.Resampling.LANCZOS)
-
-            # 創建圓形白色背景
-            background_size = logo_size
-            background = Image.new('RGBA', (background_size, background_size), (255, 255, 255, 255))
-
-            # 創建圓形遮罩
-            mask = Image.new('L', (background_size, background_size), 0)
-            draw = ImageDraw.Draw(mask)
-            draw.ellipse([0, 0, background_size, background_size], fill=255)
+        qr_width, qr_height = qr_img.size
+        logo_size = int(min(qr_width, qr_height) * logo_size_ratio)
+        overlay = get_logo_overlay(logo_path, logo_size)
 
-            # 應用圓形遮罩到白色背景
-            background.putalpha(mask)
-
-            # 調整 logo 大小（留一些邊距）
-            logo_margin = logo_size // 4
-            inner_size = logo_size - logo_margin * 2
-            logo_resized = logo.resize((inner_size, inner_size), Image.Resampling.LANCZOS)
-
-            # 創建最終的 logo（白色圓形背景 + logo）
-            final_logo = background.copy()
-            logo_pos = ((background_size - inner_size) // 2, (background_size - inner_size) // 2)
-            final_logo.paste(logo_resized, logo_pos, logo_resized)
-
-            # 計算 logo 在 QR Code 中的位置（居中）
+        if overlay is not None:
+            # 將 logo 置中粘貼到 QR Code 上
             logo_x = (qr_width - logo_size) // 2
             logo_y = (qr_height - logo_size) // 2
-
-            # 將 logo 粘貼到 QR Code 上
-            qr_img.paste(final_logo, (logo_x, logo_y), final_logo)
+            qr_img.paste(overlay, (logo_x, logo_y), overlay)
 
     except Exception as e:
         # 如果添加 logo 失敗，就使用原始的 QR Code
         logger.warning(f"Warning: Could not add logo to QR code: {e}")
 
-    # 轉換為 base64
     buffer = BytesIO()
     qr_img.save(buffer, format='PNG')
-    buffer.seek(0)
+    return buffer.getvalue()
+
+
+def generate_qr_code_with_logo(data, logo_path=None, logo_size_ratio=0.25, error_correction=qrcode.constants.ERROR_CORRECT_M):
+    """
+    生成帶有 logo 的 QR Code
 
-    return base64.b64encode(buffer.getvalue()).decode()
+    Args:
+        data (str): QR Code 要編碼的資料
+        logo_path (str): Logo 圖片的路徑，如果為 None 則使用預設的 favicon
+        logo_size_ratio (float): Logo 相對於 QR Code 的大小比例 (0.1-0.3 推薦)
+        error_correction: QR Code 的錯誤修正等級
+
+    Returns:
+        str: base64 編碼的 PNG 圖片
+    """
+    png = generate_qr_code_png(
+        data,
+        logo_path=logo_path,
+        logo_size_ratio=logo_size_ratio,
+        error_correction=error_correction,
+    )
+    return base64.b64encode(png).decode()
 
 
 def generate_simple_qr_code(data, **kwargs):
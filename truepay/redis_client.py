@@ -0,0 +1,33 @@
+"""
+共用 Redis 連線
+緩衝計數器（truepay.counters）與票券驗證記錄（payments.audit）把尚未寫入資料庫的
+資料保存在 Redis，由 Celery Beat 定期寫入；web 程序重新啟動或異常終止時不會遺失。
+未設定 REDIS_URL 時 get_redis_client 回傳 None，呼叫端改為直接寫入資料庫
+"""
+
+import threading
+
+from django.conf import settings
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_redis_client():
+    """取得 REDIS_URL 的 Redis 連線（同一程序共用連線池），未設定時回傳 None"""
+    url = settings.REDIS_URL
+    if not url:
+        return None
+
+    client = _clients.get(url)
+    if client is None:
+        import redis
+
+        with _lock:
+            client = _clients.setdefault(url, redis.Redis.from_url(url))
+    return client
+
+
+def redis_key(*parts):
+    """與快取相同前綴的 Redis key"""
+    return ":".join(["truepay", *map(str, parts)])
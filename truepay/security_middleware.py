@@ -1,3 +1,6 @@
+import time
+
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 from django.shortcuts import redirect
 from django.contrib import messages
@@ -42,21 +45,22 @@ class SessionSecurityMiddleware(MiddlewareMixin):
 
             if any(request.path.startswith(path) for path in sensitive_paths):
                 # 檢查 session 中是否有最後活動時間戳記
+                now = time.time()
                 last_activity = request.session.get("last_activity")
                 if last_activity:
-                    import time
-
                     # 如果超過 30 分鐘沒有活動，強制登出
-                    if time.time() - last_activity > 1800:  # 30 minutes
+                    if now - last_activity > 1800:  # 30 minutes
                         from django.contrib.auth import logout
 
                         logout(request)
                         messages.warning(request, "因長時間未活動，已自動登出")
                         return redirect("customers_account:login")
 
-                # 更新最後活動時間
-                import time
-
-                request.session["last_activity"] = time.time()
+                # 更新最後活動時間（間隔太短時不寫入，避免每個請求都儲存 session）
+                if (
+                    not last_activity
+                    or now - last_activity >= settings.SESSION_ACTIVITY_UPDATE_INTERVAL
+                ):
+                    request.session["last_activity"] = now
 
         return None
@@ -24,6 +24,48 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # 票券設定
 TICKET_VALIDITY_DAYS = 180  # 票券有效期（天數）
 
+# 票券到期通知批次設定
+EXPIRY_NOTIFICATION_BATCH_SIZE = 100  # 每批票券數（共用一條 SMTP 連線）
+EXPIRY_NOTIFICATION_WORKERS = 4  # 同時處理的批次數（執行緒）
+
+# 票券 QR code 圖片快取時間（秒）
+TICKET_QR_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# 子網域解析快取（SubdomainRedirectMiddleware）
+SUBDOMAIN_CACHE_TIMEOUT = 60 * 60  # 共用快取（秒）
+SUBDOMAIN_NEGATIVE_CACHE_TIMEOUT = 60  # 查無商家的子網域（秒）
+SUBDOMAIN_LOCAL_CACHE_TIMEOUT = 30  # 程序內快取（秒），其他程序最多延遲這麼久才更新
+SUBDOMAIN_LOCAL_CACHE_SIZE = 1024  # 程序內快取筆數
+
+# 匿名訪客的商店頁面快取時間（秒），商品或商家資料變動時立即失效
+STOREFRONT_CACHE_TIMEOUT = 60 * 5
+
+# 票券到期前多久排程 ETA 下架任務（秒），需大於 auto-deactivate-expired-products 的執行間隔
+PRODUCT_UNLIST_SCHEDULE_HORIZON = 60 * 20
+
+# 離線掃描器（payments.scanner）：差異同步保留的重疊時間（秒）、每次上傳的核銷筆數上限
+# 與票券清單每頁的票券數
+SCANNER_SYNC_OVERLAP_SECONDS = 60
+SCANNER_SYNC_MAX_BATCH = 500
+SCANNER_MANIFEST_PAGE_SIZE = 2000
+
+# 批次驗證／核銷票券 API 每次可處理的票券數
+TICKET_BATCH_MAX_CODES = 100
+
+# 訂單異動後延遲幾秒重新計算商家每日統計（同一商家同一天的異動合併為一次）
+DAILY_STATS_REBUILD_DELAY = 10
+
+# 緩衝計數器（truepay.counters）由 Celery Beat 寫入資料庫的間隔
+COUNTER_FLUSH_INTERVAL = 10  # 秒
+
+# 票券驗證失敗記錄（payments.audit）由 Celery Beat 寫入資料庫的間隔與每批筆數
+TICKET_AUDIT_FLUSH_INTERVAL = 5  # 秒
+TICKET_AUDIT_BATCH_SIZE = 200
+
+# nginx 重導向 map 匯出目錄（空字串表示不匯出），及內容變動後重新載入 nginx 的指令
+NGINX_REDIRECT_DIR = os.getenv("NGINX_REDIRECT_DIR", "")
+NGINX_RELOAD_COMMAND = os.getenv("NGINX_RELOAD_COMMAND", "")
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -33,6 +75,10 @@ SECRET_KEY = os.getenv("DJANGO_SECRET_KEY")
 if not SECRET_KEY:
     raise ValueError("請在 .env 檔案中設定 DJANGO_SECRET_KEY")
 
+# 票券 QR code 簽章金鑰（payments.ticket_tokens），未設定時使用 SECRET_KEY
+# 更換後已發出的票券 QR code 會失效，請與 SECRET_KEY 分開管理
+TICKET_TOKEN_SECRET = os.getenv("TICKET_TOKEN_SECRET") or SECRET_KEY
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
 
@@ -95,6 +141,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "truepay.middleware.customer.CustomerMiddleware",  # 延遲載入 request.customer
+    "truepay.db_router.ReplicaStickinessMiddleware",  # 寫入後暫時固定讀主資料庫
     "truepay.middleware.subdomain_redirect.SubdomainRedirectMiddleware",  # 子網域必需
     "django.contrib.messages.middleware.MessageMiddleware",
     # "django.middleware.clickjacking.XFrameOptionsMiddleware",  # 已改用 CSP frame-ancestors
@@ -142,6 +190,13 @@ def get_db_host():
     return os.getenv("DB_HOST", "localhost")
 
 
+def is_celery_worker():
+    """是否在 Celery worker 程序中（決定預設的連線池大小）"""
+    import sys
+
+    return os.path.basename(sys.argv[0]) == "celery" and "worker" in sys.argv
+
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -150,9 +205,51 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": get_db_host(),
         "PORT": os.getenv("DB_PORT"),
+        # 重用連線前先確認連線仍可用（資料庫重啟、閒置斷線後自動重連）
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# 資料庫連線管理模式（DB_CONN_MODE）
+# - persistent（預設）：每個程序保留連線 DB_CONN_MAX_AGE 秒，不必每個請求重新連線
+# - pool：psycopg3 連線池（需安裝 psycopg[pool]），每個程序 DB_POOL_MIN_SIZE ~ DB_POOL_MAX_SIZE 條
+# - pgbouncer：DB_HOST/DB_PORT 指向 PgBouncer（transaction pooling），停用 server-side cursor
+# - off：每個請求結束就關閉連線（舊行為，僅供效能比較）
+# 所有程序的連線數總和（gunicorn workers + Celery 子程序 × 每程序連線數）需小於 PostgreSQL max_connections
+DB_CONN_MODE = os.getenv("DB_CONN_MODE", "persistent")
+if DB_CONN_MODE == "pool":
+    # gunicorn sync worker 一次只處理一個請求；Celery 的到期通知會以執行緒池並行處理批次
+    default_pool_max_size = 5 if is_celery_worker() else 2
+    DATABASES["default"]["CONN_MAX_AGE"] = 0  # 連線池不可與持久連線同時使用
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", default_pool_max_size)),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        }
+    }
+elif DB_CONN_MODE == "off":
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("DB_CONN_MAX_AGE", "600"))
+    if DB_CONN_MODE == "pgbouncer":
+        # transaction pooling 下同一交易以外的 cursor 可能落在不同後端連線
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+
+# 讀取副本：設定 DB_REPLICA_HOST 時，報表、統計圖表與匯出（using_replica）改讀副本
+# 其餘設定與 default 相同；使用者寫入後 REPLICA_STICKY_SECONDS 秒內仍讀主資料庫，避免複寫延遲
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+if DB_REPLICA_HOST:
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": DB_REPLICA_HOST,
+        "PORT": os.getenv("DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["truepay.db_router.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -226,6 +323,12 @@ AWS_S3_OBJECT_PARAMETERS = {
     "CacheControl": "max-age=86400",
 }
 
+# 報表匯出檔案（merchant_marketplace.storage_backends.ExportStorage）
+# 檔案不公開，由商家下載頁產生有時效的簽章網址；建議使用未設定公開讀取的 bucket
+AWS_EXPORT_BUCKET_NAME = os.getenv("AWS_EXPORT_BUCKET_NAME") or AWS_STORAGE_BUCKET_NAME
+REPORT_EXPORT_URL_EXPIRE = 300  # 下載網址有效秒數
+REPORT_EXPORT_RETENTION_HOURS = 24  # 保留時間，逾期由 cleanup_report_exports 刪除
+
 # Media files (uploads)
 # 檔案上傳限制設定
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5MB
@@ -240,6 +343,9 @@ STORAGES = {
     "staticfiles": {
         "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
     },
+    "exports": {
+        "BACKEND": "merchant_marketplace.storage_backends.ExportStorage",
+    },
 }
 MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/"
 
@@ -331,6 +437,30 @@ SESSION_COOKIE_DOMAIN = f".{BASE_DOMAIN}"
 CSRF_COOKIE_DOMAIN = f".{BASE_DOMAIN}"
 
 
+# 快取設定：設定 REDIS_URL 時使用 Redis（web 與 Celery 各程序共用），
+# 未設定時（本機開發、測試）使用程序內的 locmem
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "truepay",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "truepay",
+        }
+    }
+
+# Session 先讀快取，快取沒有時才查資料庫（寫入時兩邊都會更新）
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+# last_activity 移動超過此秒數才寫回 session，避免每個請求都更新 session
+SESSION_ACTIVITY_UPDATE_INTERVAL = 60
+
 # 快取設定（防止敏感頁面被快取）
 CACHE_MIDDLEWARE_SECONDS = 0  # 不快取頁面
 CACHE_MIDDLEWARE_KEY_PREFIX = "truepay"
@@ -443,12 +573,56 @@ CELERY_BEAT_SCHEDULE = {
             "expires": 3300,  # 55分鐘後過期
         },
     },
+    # 每小時校正商家每日統計
+    "refresh-merchant-daily-stats-hourly": {
+        "task": "payments.refresh_merchant_daily_stats",
+        "schedule": crontab(minute=30),  # 每小時30分執行
+        "options": {
+            "expires": 3300,  # 55分鐘後過期
+        },
+    },
+    # 每小時重新匯出 nginx 重導向設定（移除已過期的重導向）
+    "export-nginx-redirects-hourly": {
+        "task": "merchant_account.export_nginx_redirects",
+        "schedule": crontab(minute=15),  # 每小時15分執行
+        "options": {
+            "expires": 3300,  # 55分鐘後過期
+        },
+    },
+    # 每小時刪除超過保留時間的報表匯出檔案
+    "cleanup-report-exports-hourly": {
+        "task": "merchant_account.cleanup_report_exports",
+        "schedule": crontab(minute=45),  # 每小時45分執行
+        "options": {
+            "expires": 3300,  # 55分鐘後過期
+        },
+    },
+    # 將 Redis 中累積的計數器增量寫入資料庫
+    "flush-counters": {
+        "task": "truepay.flush_counters",
+        "schedule": COUNTER_FLUSH_INTERVAL,
+        "options": {
+            "expires": COUNTER_FLUSH_INTERVAL,  # 下一次執行會一併寫入，避免堆積
+        },
+    },
+    # 將 Redis 中的票券驗證失敗記錄批次寫入資料庫
+    "flush-ticket-validations": {
+        "task": "payments.flush_ticket_validations",
+        "schedule": TICKET_AUDIT_FLUSH_INTERVAL,
+        "options": {
+            "expires": TICKET_AUDIT_FLUSH_INTERVAL,  # 下一次執行會一併寫入，避免堆積
+        },
+    },
     "auto-deactivate-expired-products": {
         "task": "merchant_marketplace.auto_deactivate_expired_products",
-        "schedule": crontab(minute="*/10"),  # 10分鐘一次
+        # 到期下架由 ETA 任務準時執行，這裡補排程即將到期的商品並下架遺漏的過期商品
+        "schedule": crontab(minute="*/15"),
     },
 }
 
+# 非 Django app 的任務模組
+CELERY_IMPORTS = ["truepay.tasks"]
+
 # 任務路由（可選）
 CELERY_TASK_ROUTES = {
     "payments.*": {"queue": "payments"},
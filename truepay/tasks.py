@@ -0,0 +1,31 @@
+"""
+TruePay 共用 Celery 任務
+"""
+
+import logging
+
+from celery import shared_task
+
+from . import counters
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, name="truepay.flush_counters")
+def flush_counters(self):
+    """
+    將 Redis 中累積的計數器增量寫入資料庫（由 Celery Beat 定期執行）
+
+    Returns:
+        dict: 執行結果統計
+    """
+    try:
+        flushed = counters.flush_counters()
+        logger.info(f"計數器增量寫入完成 - 增量筆數: {flushed}")
+        return {
+            "task_name": "flush_counters",
+            "increments": flushed,
+        }
+    except Exception as e:
+        logger.error(f"計數器增量寫入失敗: {str(e)}")
+        raise self.retry(exc=e, countdown=30, max_retries=3)